@@ -0,0 +1,113 @@
+import time
+import unittest
+from aiohttp import web
+
+from async_client import AsyncPythonClient, Backoff
+from rate_limiter import parse_retry_after
+
+RETRY_AFTER = 0.2
+
+
+def status_json(status, slides_done=0, slides_total=3):
+    """
+    :return: the json object the web API answers for a file with the given progress.
+    """
+    return {"status": status, "filename": "deck.pptx", "timestamp": None, "finish_time": None,
+            "explanation": None, "slides_done": slides_done, "slides_total": slides_total}
+
+
+class AsyncClientTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        """
+        This method starts a local web server that plays the status of the files, every file is pending for two polls,
+        processing for one and then done, and asks the clients to retry after RETRY_AFTER seconds until it is done.
+        :return:
+        """
+        self.polls = {}
+        self.poll_times = []
+        app = web.Application()
+        app.add_routes([web.get('/status/{uid}', self.status), web.post('/status/batch', self.status_batch)])
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.client = AsyncPythonClient(f"http://127.0.0.1:{port}", initial_delay=0.01, max_delay=1)
+
+    async def asyncTearDown(self):
+        await self.client.close()
+        await self.runner.cleanup()
+
+    def next_status(self, uid):
+        """
+        :return: the status of the file at its next poll, or None for an unknown file.
+        """
+        if uid.startswith("missing"):
+            return None
+        self.polls[uid] = self.polls.get(uid, 0) + 1
+        self.poll_times.append(time.monotonic())
+        if self.polls[uid] <= 2:
+            return status_json("pending")
+        if self.polls[uid] == 3:
+            return status_json("processing", slides_done=1)
+        return status_json("done", slides_done=3)
+
+    async def status(self, request):
+        status = self.next_status(request.match_info["uid"])
+        if status is None:
+            return web.json_response({"not_found": "uid not found"}, status=404)
+        etag = f'"{status["status"]}-{status["slides_done"]}"'
+        headers = {"ETag": etag}
+        if status["status"] != "done":
+            headers["Retry-After"] = str(RETRY_AFTER)
+        if request.headers.get("If-None-Match") == etag:
+            return web.Response(status=304, headers=headers)
+        return web.json_response(status, headers=headers)
+
+    async def status_batch(self, request):
+        uids = (await request.json())["uids"]
+        statuses = {uid: self.next_status(uid) or {"not_found": "uid not found"} for uid in uids}
+        return web.json_response({"statuses": statuses}, headers={"Retry-After": str(RETRY_AFTER)})
+
+    async def test_wait_for_completion_honors_retry_after(self):
+        """
+        The client must poll until the file is done, report its progress once per change, and never poll sooner than
+        the server asked for, although its own backoff starts far lower.
+        """
+        progress = []
+        status = await self.client.wait_for_completion("deck", on_progress=progress.append)
+
+        self.assertTrue(status.is_done())
+        self.assertEqual(["pending", "processing"], [status.status for status in progress])
+        gaps = [later - earlier for earlier, later in zip(self.poll_times, self.poll_times[1:])]
+        self.assertEqual(3, len(gaps))
+        self.assertGreaterEqual(min(gaps), RETRY_AFTER * 0.9)
+        self.assertIsNone(await self.client.wait_for_completion("missing"))
+
+    async def test_wait_for_many_polls_only_the_unfinished_files(self):
+        """
+        Many files are tracked with batch requests, a done or unknown file is not polled again.
+        """
+        uids = [f"deck{number}" for number in range(1000)] + ["missing"]
+        statuses = await self.client.wait_for_many(uids)
+
+        self.assertIsNone(statuses.pop("missing"))
+        self.assertTrue(all(status.is_done() for status in statuses.values()))
+        self.assertTrue(all(polls == 4 for polls in self.polls.values()))
+
+    def test_backoff_grows_with_jitter_and_respects_the_suggested_delay(self):
+        backoff = Backoff(initial_delay=1, max_delay=8)
+        delays = [backoff.next_delay() for _ in range(6)]
+        for delay, ceiling in zip(delays, [1, 2, 4, 8, 8, 8]):
+            self.assertTrue(ceiling / 2 <= delay <= ceiling)
+        self.assertGreaterEqual(backoff.next_delay(suggested_delay=6), 6)
+        self.assertEqual(30, backoff.next_delay(suggested_delay=30))
+        backoff.reset()
+        self.assertLessEqual(backoff.next_delay(), 1)
+        self.assertEqual(2.5, parse_retry_after("2.5"))
+        self.assertEqual(0, parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT"))
+        self.assertIsNone(parse_retry_after("soon"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,132 @@
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from aiohttp.test_utils import TestClient, TestServer
+from sqlalchemy.orm import Session
+
+import async_web_api
+import webAPI
+from async_client import AsyncPythonClient
+from handle_db import Base, Upload, SlideExplanation, create_database_engine
+from WebAPI_test import build_presentation
+
+EXPLANATIONS = {"slide1": "first", "slide2": "second"}
+
+
+class AsyncWebAPITest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        """
+        This method serves the async web API from a temporary folder with a database of its own, holding a done
+        upload whose output is stored in the database, a done upload whose output is a json file, and an upload in
+        progress.
+        :return:
+        """
+        self.folder = tempfile.mkdtemp()
+        self.working_folder = os.getcwd()
+        os.chdir(self.folder)
+        database_path = os.path.join(self.folder, 'async.db')
+        self.engine = create_database_engine(f"sqlite:///{database_path}")
+        Base.metadata.create_all(self.engine)
+        self.async_engine = async_web_api.create_async_database_engine(f"sqlite+aiosqlite:///{database_path}")
+        for patch in (mock.patch.object(async_web_api, 'engine', self.engine),
+                      mock.patch.object(async_web_api, 'async_engine', self.async_engine)):
+            patch.start()
+            self.addCleanup(patch.stop)
+
+        with Session(self.engine) as session:
+            stored, old, running = (Upload(f"{uid}.pptx", status, uid) for uid, status in (
+                ("stored", webAPI.DONE), ("old", webAPI.DONE), ("running", webAPI.PROCESSING)))
+            session.add_all([stored, old, running])
+            session.flush()
+            webAPI.OUTPUT_STORE.save(session, stored, EXPLANATIONS)
+            session.add(SlideExplanation(running.id, 1, EXPLANATIONS["slide1"]))
+            session.commit()
+        os.makedirs(webAPI.OUTPUT_FOLDER)
+        with open(os.path.join(webAPI.OUTPUT_FOLDER, "old.json"), "w") as file:
+            json.dump(EXPLANATIONS, file)
+
+        self.client = TestClient(TestServer(async_web_api.create_app()))
+        await self.client.start_server()
+
+    async def asyncTearDown(self):
+        await self.client.close()
+        self.engine.dispose()
+        os.chdir(self.working_folder)
+        shutil.rmtree(self.folder)
+
+    async def get_status(self, uid, accept_encoding):
+        """
+        :return: the content encoding of the status of the upload, and its decoded json object (Tuple)
+        """
+        response = await self.client.get(f"/status/{uid}", headers={"Accept-Encoding": accept_encoding},
+                                         auto_decompress=False)
+        self.assertEqual(webAPI.OK, response.status)
+        content_encoding = response.headers.get(async_web_api.CONTENT_ENCODING_HEADER)
+        body = await response.read()
+        if content_encoding == webAPI.GZIP_ENCODING:
+            body = gzip.decompress(body)
+        return content_encoding, json.loads(body)
+
+    async def test_gzip_follows_the_quality_of_the_accept_encoding_header(self):
+        for accept_encoding, expected_encoding in (("gzip", "gzip"), ("br, gzip;q=0.5", "gzip"), ("*", "gzip"),
+                                                   ("gzip;q=0", None), ("gzip;q=0.0, br", None), ("identity", None)):
+            for uid in ("stored", "old"):
+                content_encoding, status = await self.get_status(uid, accept_encoding)
+                self.assertEqual((expected_encoding, EXPLANATIONS),
+                                 (content_encoding, status[webAPI.EXPLANATION_FIELD]), (accept_encoding, uid))
+
+    async def test_upload_in_progress_is_answered_from_the_database(self):
+        content_encoding, status = await self.get_status("running", "gzip")
+        self.assertEqual((None, webAPI.PROCESSING, {"slide1": "first"}), (
+            content_encoding, status[webAPI.STATUS_FIELD], status[webAPI.EXPLANATION_FIELD]))
+
+    async def test_upload_with_a_priority(self):
+        file_path = os.path.join(self.folder, "deck.pptx")
+        with open(file_path, "wb") as file:
+            file.write(build_presentation(1))
+        client = AsyncPythonClient(str(self.client.make_url("")).rstrip("/"))
+        try:
+            uid = await client.upload(file_path, priority=webAPI.MAX_PRIORITY)
+            with self.assertRaises(Exception):
+                await client.upload(file_path, priority="urgent")
+        finally:
+            await client.close()
+        with Session(self.engine) as session:
+            self.assertEqual(webAPI.MAX_PRIORITY, session.query(Upload.priority).filter_by(uid=uid).scalar())
+        self.assertEqual([f"{uid}.pptx"], os.listdir(webAPI.UPLOAD_FOLDER))
+
+    async def test_identical_upload_reuses_the_output_and_drops_its_file(self):
+        file_path = os.path.join(self.folder, "deck.pptx")
+        with open(file_path, "wb") as file:
+            file.write(build_presentation(2))
+        client = AsyncPythonClient(str(self.client.make_url("")).rstrip("/"))
+        try:
+            first_uid = await client.upload(file_path)
+            with Session(self.engine) as session:
+                first = session.query(Upload).filter_by(uid=first_uid).one()
+                webAPI.OUTPUT_STORE.save(session, first, EXPLANATIONS)
+                first.set_file_status(webAPI.DONE)
+                first.set_upload_finish_time()
+                first.set_slides_failed(0)
+                session.commit()
+            second_uid = await client.upload(file_path)
+        finally:
+            await client.close()
+
+        with Session(self.engine) as session:
+            second = session.query(Upload).filter_by(uid=second_uid).one()
+            self.assertEqual((webAPI.DONE, first_uid), (second.status, second.get_output_uid()))
+        self.assertEqual([f"{first_uid}.pptx"], os.listdir(webAPI.UPLOAD_FOLDER))
+
+    def test_sync_engine_reads_the_database_of_the_async_engine(self):
+        sync_engine = async_web_api.create_sync_database_engine("sqlite+aiosqlite:///other/explainer.db")
+        self.assertEqual("sqlite:///other/explainer.db", str(sync_engine.url))
+        sync_engine.dispose()
+
+
+if __name__ == "__main__":
+    unittest.main()
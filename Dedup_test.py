@@ -0,0 +1,72 @@
+import os
+import shutil
+import tempfile
+import unittest
+from sqlalchemy.orm import Session
+
+import webAPI
+from handle_db import Base, Upload, create_database_engine
+
+DIGEST = "d" * 64
+SLIDES = 3
+
+
+class DedupTest(unittest.TestCase):
+    def setUp(self):
+        """
+        This method creates a database of its own and an uploads folder in a temporary folder, with a finished upload
+        of the content DIGEST.
+        :return:
+        """
+        self.folder = tempfile.mkdtemp()
+        self.working_folder = os.getcwd()
+        os.chdir(self.folder)
+        os.makedirs(webAPI.UPLOAD_FOLDER)
+        self.engine = create_database_engine(f"sqlite:///{os.path.join(self.folder, 'dedup.db')}")
+        Base.metadata.create_all(self.engine)
+        with Session(self.engine) as session:
+            finished = Upload("first.pptx", webAPI.DONE, "first", digest=DIGEST)
+            finished.slides_total = SLIDES
+            finished.set_upload_finish_time()
+            session.add(finished)
+            session.commit()
+
+    def tearDown(self):
+        self.engine.dispose()
+        os.chdir(self.working_folder)
+        shutil.rmtree(self.folder)
+
+    def set_slides_failed(self, slides_failed):
+        with Session(self.engine) as session:
+            session.query(Upload).filter_by(uid="first").update({Upload.slides_failed: slides_failed})
+            session.commit()
+
+    def add_upload(self, uid):
+        """
+        This method saves a file for a new upload of the content DIGEST and adds the upload.
+        :return: the status and the output uid of the new upload, and whether its saved file was kept (Tuple)
+        """
+        upload_path = os.path.join(webAPI.UPLOAD_FOLDER, f"{uid}{webAPI.PRESENTATION_EXTENSION}")
+        with open(upload_path, "wb") as file:
+            file.write(b"presentation")
+        with Session(self.engine) as session:
+            upload = webAPI.add_upload(session, None, (uid, DIGEST, SLIDES))
+            session.commit()
+            return upload.status, upload.get_output_uid(), os.path.exists(upload_path)
+
+    def test_identical_upload_reuses_an_output_without_failed_slides(self):
+        self.set_slides_failed(0)
+        self.assertEqual((webAPI.DONE, "first", False), self.add_upload("second"))
+
+    def test_identical_upload_is_processed_again_when_slides_failed(self):
+        """
+        An output holding error messages, or processed before the failed slides were counted, is not reused.
+        """
+        self.set_slides_failed(2)
+        self.assertEqual((webAPI.PENDING, "second", True), self.add_upload("second"))
+        self.set_slides_failed(None)
+        self.assertEqual((webAPI.PENDING, "third", True), self.add_upload("third"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from explanation_cache import ExplanationCache, HITS_FIELD, MISSES_FIELD, EVICTIONS_FIELD
+from handle_db import Base, CachedExplanation, create_database_engine
+
+MODEL = "model"
+PROMPT = "prompt"
+
+
+class ExplanationCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.engine = create_database_engine(f"sqlite:///{os.path.join(self.folder, 'cache.db')}")
+        Base.metadata.create_all(self.engine)
+
+    def tearDown(self):
+        self.engine.dispose()
+        shutil.rmtree(self.folder)
+
+    def entries(self):
+        """
+        :return: the hit count of every entry, keyed by explanation. (Dictionary)
+        """
+        with Session(self.engine) as session:
+            return dict(session.query(CachedExplanation.explanation, CachedExplanation.hit_count).all())
+
+    def test_hits_and_misses_are_counted_per_slide(self):
+        """
+        Slides differing only in case and white spaces share an entry, a lookup of the deck counts every slide, and
+        the hit count of every entry found is raised once per lookup.
+        """
+        cache = ExplanationCache(self.engine, MODEL, PROMPT)
+        cache.put_many({"First  slide": "first", "second slide": "second"})
+
+        self.assertEqual(["first", None, "second", "first"],
+                         cache.get_many(["first slide", "third slide", "Second Slide", "FIRST slide"]))
+        self.assertEqual("second", cache.get("second slide"))
+        self.assertEqual({HITS_FIELD: 4, MISSES_FIELD: 1, EVICTIONS_FIELD: 0}, cache.stats())
+        self.assertEqual({"first": 1, "second": 2}, self.entries())
+
+        cache.put("first slide", "first again")
+        self.assertEqual("first again", cache.get("first slide"))
+        self.assertEqual(2, cache.count_entries())
+
+    def test_disabled_cache_stores_nothing(self):
+        cache = ExplanationCache(self.engine, MODEL, PROMPT, max_entries=0)
+        cache.put("slide", "explanation")
+        self.assertEqual([None], cache.get_many(["slide"]))
+        self.assertEqual(0, cache.count_entries())
+
+    def test_least_recently_used_entries_are_evicted_every_interval(self):
+        """
+        The cache grows past its maximum until the eviction interval is reached, then keeps the entries used last.
+        """
+        cache = ExplanationCache(self.engine, MODEL, PROMPT, max_entries=2, eviction_interval=3)
+        cache.put_many({"slide 1": "1", "slide 2": "2"})
+        with Session(self.engine) as session:
+            session.execute(update(CachedExplanation).values(last_used_time=datetime.now() - timedelta(days=1)))
+            session.commit()
+        cache.get("slide 1")
+        cache.put("slide 3", "3")
+        self.assertEqual(2, cache.count_entries())
+        self.assertEqual(1, cache.stats()[EVICTIONS_FIELD])
+        self.assertEqual(["1", None, "3"], cache.get_many(["slide 1", "slide 2", "slide 3"]))
+
+        cache.put("slide 4", "4")
+        self.assertEqual(3, cache.count_entries())
+
+    def test_entries_of_another_model_or_prompt_are_invalidated(self):
+        ExplanationCache(self.engine, "old model", PROMPT).put("slide 1", "old model")
+        ExplanationCache(self.engine, MODEL, "old prompt").put("slide 2", "old prompt")
+        cache = ExplanationCache(self.engine, MODEL, PROMPT)
+        cache.put("slide 3", "current")
+
+        self.assertEqual(2, cache.invalidate_stale_entries())
+        self.assertEqual({"current": 0}, self.entries())
+        self.assertEqual(0, cache.invalidate_stale_entries())
+
+
+if __name__ == "__main__":
+    unittest.main()
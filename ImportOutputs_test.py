@@ -0,0 +1,74 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from sqlalchemy.orm import Session
+
+import import_outputs
+from handle_db import Base, Upload, create_database_engine
+from output_store import DatabaseOutputStore, OUTPUT_EXTENSION
+
+EXPLANATIONS = {"slide1": "first", "slide2": "second"}
+
+
+class ImportOutputsTest(unittest.TestCase):
+    def setUp(self):
+        """
+        This method creates a database of its own and an outputs folder in a temporary folder, with the json file of
+        a new upload, of an upload already stored, of an unknown upload, and an unreadable one.
+        :return:
+        """
+        self.folder = tempfile.mkdtemp()
+        self.outputs_folder = os.path.join(self.folder, 'outputs')
+        os.makedirs(self.outputs_folder)
+        self.engine = create_database_engine(f"sqlite:///{os.path.join(self.folder, 'import.db')}")
+        Base.metadata.create_all(self.engine)
+        patch = mock.patch.object(import_outputs, 'engine', self.engine)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+        with Session(self.engine) as session:
+            for uid in ("new", "stored", "broken"):
+                session.add(Upload(f"{uid}.pptx", "done", uid))
+            session.flush()
+            stored = session.query(Upload).filter_by(uid="stored").one()
+            DatabaseOutputStore().save(session, stored, {"slide1": "already stored"})
+            session.commit()
+        for uid in ("new", "stored", "unknown"):
+            with open(self.output_path(uid), "w") as file:
+                json.dump(EXPLANATIONS, file)
+        with open(self.output_path("broken"), "w") as file:
+            file.write("{not json")
+
+    def tearDown(self):
+        self.engine.dispose()
+        shutil.rmtree(self.folder)
+
+    def output_path(self, uid):
+        return os.path.join(self.outputs_folder, uid + OUTPUT_EXTENSION)
+
+    def stored_output(self, uid):
+        with Session(self.engine) as session:
+            return json.loads(DatabaseOutputStore().read(session, session.query(Upload).filter_by(uid=uid).one()))
+
+    def test_imports_the_new_outputs_and_skips_the_others(self):
+        counts = import_outputs.import_outputs(self.outputs_folder, remove_files=True)
+
+        self.assertEqual({import_outputs.IMPORTED: 1, import_outputs.ALREADY_STORED: 1,
+                          import_outputs.WITHOUT_UPLOAD: 1, import_outputs.UNREADABLE: 1}, counts)
+        self.assertEqual(EXPLANATIONS, self.stored_output("new"))
+        self.assertEqual({"slide1": "already stored"}, self.stored_output("stored"))
+        self.assertEqual(["broken", "stored", "unknown"],
+                         sorted(os.path.splitext(name)[0] for name in os.listdir(self.outputs_folder)))
+
+    def test_import_runs_again_safely(self):
+        import_outputs.import_outputs(self.outputs_folder)
+        counts = import_outputs.import_outputs(self.outputs_folder)
+        self.assertEqual((0, 2), (counts[import_outputs.IMPORTED], counts[import_outputs.ALREADY_STORED]))
+        self.assertTrue(os.path.exists(self.output_path("new")))
+
+
+if __name__ == "__main__":
+    unittest.main()
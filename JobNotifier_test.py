@@ -0,0 +1,77 @@
+import asyncio
+import socket
+import unittest
+from unittest import mock
+
+import job_notifier
+from job_notifier import JobNotificationListener, ProgressListener, start_listener, notify_new_upload, \
+    notify_progress
+
+HOST = "127.0.0.1"
+WAIT_TIMEOUT = 5
+
+
+def free_port():
+    """
+    :return: a UDP port of the local host that nothing is bound to. (Integer)
+    """
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as probe:
+        probe.bind((HOST, 0))
+        return probe.getsockname()[1]
+
+
+class JobNotificationTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.port = free_port()
+        self.listener = await start_listener(HOST, self.port)
+        self.addCleanup(self.listener.close)
+
+    async def test_new_upload_wakes_the_listener_up(self):
+        self.assertIsInstance(self.listener, JobNotificationListener)
+        # the first scan happens right away
+        await asyncio.wait_for(self.listener.wait(), WAIT_TIMEOUT)
+        self.listener.clear()
+        waiter = asyncio.create_task(self.listener.wait())
+        await asyncio.sleep(0.05)
+        self.assertFalse(waiter.done())
+
+        with mock.patch.object(job_notifier, 'NOTIFY_HOST', HOST), mock.patch.object(job_notifier, 'NOTIFY_PORT',
+                                                                                      self.port):
+            self.assertTrue(notify_new_upload("uid"))
+        await asyncio.wait_for(waiter, WAIT_TIMEOUT)
+
+    async def test_second_listener_on_the_same_port_can_not_bind(self):
+        with self.assertRaises(OSError):
+            await start_listener(HOST, self.port)
+
+
+class ProgressListenerTest(unittest.TestCase):
+    def setUp(self):
+        self.port = free_port()
+        self.listener = ProgressListener(HOST, self.port)
+        self.listener.start()
+        patches = [mock.patch.object(job_notifier, 'PROGRESS_NOTIFY_HOST', HOST),
+                   mock.patch.object(job_notifier, 'PROGRESS_NOTIFY_PORT', self.port)]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_progress_bumps_the_version_of_the_upload_and_wakes_its_waiters(self):
+        self.assertEqual(0, self.listener.version("uid"))
+        self.assertFalse(self.listener.wait_for_change("uid", 0, 0.05))
+
+        self.assertTrue(notify_progress("uid"))
+        self.assertTrue(self.listener.wait_for_change("uid", 0, WAIT_TIMEOUT))
+        self.assertEqual(1, self.listener.version("uid"))
+        self.assertEqual(0, self.listener.version("other"))
+
+    def test_other_notifications_are_ignored(self):
+        job_notifier.send_notification(f"{job_notifier.NEW_UPLOAD_MESSAGE} uid", HOST, self.port)
+        job_notifier.send_notification(job_notifier.PROGRESS_MESSAGE, HOST, self.port)
+        notify_progress("other")
+        self.assertTrue(self.listener.wait_for_change("other", 0, WAIT_TIMEOUT))
+        self.assertEqual(0, self.listener.version("uid"))
+
+
+if __name__ == "__main__":
+    unittest.main()
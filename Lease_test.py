@@ -0,0 +1,77 @@
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta, timezone
+from sqlalchemy.orm import Session
+
+from handle_db import Base, Upload, create_database_engine, claim_upload, renew_leases, database_now
+
+LEASE_SECONDS = 60
+
+
+class LeaseTest(unittest.TestCase):
+    def setUp(self):
+        """
+        This method creates a database of its own in a temporary folder, with a single pending upload.
+        :return:
+        """
+        self.folder = tempfile.mkdtemp()
+        self.engine = create_database_engine(f"sqlite:///{os.path.join(self.folder, 'lease.db')}")
+        Base.metadata.create_all(self.engine)
+        with Session(self.engine) as session:
+            upload = Upload("deck.pptx", "pending", "deck")
+            session.add(upload)
+            session.commit()
+            self.upload_id = upload.id
+        self.now = datetime.now()
+
+    def tearDown(self):
+        self.engine.dispose()
+        shutil.rmtree(self.folder)
+
+    def claim(self, owner, now):
+        with Session(self.engine) as session:
+            claimed = claim_upload(session, self.upload_id, owner, LEASE_SECONDS, now)
+            session.commit()
+        return claimed
+
+    def test_only_one_explainer_claims_an_upload(self):
+        self.assertTrue(self.claim("a", self.now))
+        self.assertFalse(self.claim("b", self.now))
+        with Session(self.engine) as session:
+            upload = session.get(Upload, self.upload_id)
+            self.assertEqual(("processing", "a"), (upload.status, upload.lease_owner))
+            self.assertEqual(self.now + timedelta(seconds=LEASE_SECONDS), upload.lease_expires)
+
+    def test_expired_lease_is_claimed_and_the_old_owner_can_not_renew_it(self):
+        """
+        A lease renewed in time keeps the upload, once it expires another explainer claims the upload, and the
+        explainer that held it before learns it lost it when it renews.
+        """
+        self.assertTrue(self.claim("a", self.now))
+        later = self.now + timedelta(seconds=LEASE_SECONDS - 1)
+        with Session(self.engine) as session:
+            self.assertEqual({self.upload_id}, renew_leases(session, "a", [self.upload_id], LEASE_SECONDS, later))
+            session.commit()
+        self.assertFalse(self.claim("b", later + timedelta(seconds=LEASE_SECONDS - 1)))
+
+        expired = later + timedelta(seconds=LEASE_SECONDS + 1)
+        self.assertTrue(self.claim("b", expired))
+        with Session(self.engine) as session:
+            self.assertEqual(set(), renew_leases(session, "a", [self.upload_id], LEASE_SECONDS, expired))
+            session.commit()
+
+    def test_leases_follow_the_clock_of_the_database_in_utc(self):
+        with Session(self.engine) as session:
+            self.assertTrue(claim_upload(session, self.upload_id, "a", LEASE_SECONDS))
+            session.commit()
+            upload = session.get(Upload, self.upload_id)
+            utc_now = datetime.now(timezone.utc).replace(tzinfo=None)
+            self.assertLess(abs(database_now(session) - utc_now), timedelta(seconds=5))
+            self.assertLess(abs(upload.lease_expires - utc_now - timedelta(seconds=LEASE_SECONDS)),
+                            timedelta(seconds=5))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+import unittest
+import urllib.request
+
+from metrics import Counter, Gauge, Histogram, Registry, start_metrics_server, CONTENT_TYPE
+
+
+class MetricsTest(unittest.TestCase):
+    def setUp(self):
+        self.registry = Registry()
+
+    def test_histogram_buckets_are_cumulative(self):
+        """
+        Every bucket counts the values up to its bound, the values above the largest bound are only in '+Inf', the
+        count and the sum hold every value.
+        """
+        histogram = Histogram('stage_seconds', "Stage durations.", ('stage',), registry=self.registry,
+                              buckets=(0.1, 1, 10))
+        for value in (0.05, 0.1, 0.5, 5, 50):
+            histogram.observe(value, stage='load')
+        with histogram.time(stage='save'):
+            pass
+
+        rendered = self.registry.render().decode()
+        self.assertIn('stage_seconds_bucket{stage="load",le="0.1"} 2', rendered)
+        self.assertIn('stage_seconds_bucket{stage="load",le="1"} 3', rendered)
+        self.assertIn('stage_seconds_bucket{stage="load",le="10"} 4', rendered)
+        self.assertIn('stage_seconds_bucket{stage="load",le="+Inf"} 5', rendered)
+        self.assertIn('stage_seconds_sum{stage="load"} 55.65', rendered)
+        self.assertIn('stage_seconds_count{stage="load"} 5', rendered)
+        self.assertEqual(1, histogram.count(stage='save'))
+        with self.assertRaises(ValueError):
+            histogram.observe(1, step='load')
+
+    def test_render_counters_and_gauges(self):
+        """
+        The metrics are rendered with their help and type lines, a metric read through a function is read at every
+        scrape, and the label values are escaped.
+        """
+        counter = Counter('slides_total', "Slides explained.", ('source',), registry=self.registry)
+        counter.inc(source='model')
+        counter.inc(2, source='cache "hot"')
+        in_flight = [3]
+        Gauge('in_flight', "Requests in flight.", registry=self.registry, function=lambda: in_flight[0])
+        gauge = Gauge('processing', "Uploads processing.", registry=self.registry)
+        gauge.inc()
+        gauge.inc()
+        gauge.dec()
+
+        rendered = self.registry.render().decode()
+        self.assertIn("# HELP slides_total Slides explained.\n# TYPE slides_total counter\n", rendered)
+        self.assertIn('slides_total{source="model"} 1\n', rendered)
+        self.assertIn('slides_total{source="cache \\"hot\\""} 2\n', rendered)
+        self.assertIn("# TYPE in_flight gauge\nin_flight 3\n", rendered)
+        self.assertIn("processing 1\n", rendered)
+        in_flight[0] = 0
+        self.assertIn("in_flight 0\n", self.registry.render().decode())
+
+    def test_metrics_server(self):
+        Counter('requests_total', "Requests.", registry=self.registry).inc()
+        server = start_metrics_server('127.0.0.1', 0, self.registry)
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{server.server_port}/metrics") as response:
+                self.assertEqual(CONTENT_TYPE, response.headers['Content-Type'])
+                self.assertIn(b"requests_total 1\n", response.read())
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == "__main__":
+    unittest.main()
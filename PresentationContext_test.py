@@ -0,0 +1,100 @@
+import unittest
+
+from presentation_context import PresentationContext, estimate_tokens, split_text, USER_ROLE, CONTENT_FIELD, \
+    ROLE_FIELD, SYSTEM_ROLE, PART_HEADER
+
+
+class PresentationContextTest(unittest.TestCase):
+    def test_split_text_keeps_every_part_under_the_limit(self):
+        """
+        The parts hold the whole text in order, split between lines first, and a single word longer than a part is
+        split as well.
+        """
+        lines = [" ".join(f"word{line}_{word}" for word in range(30)) for line in range(40)]
+        text = "\n".join(lines + ["x" * 2000])
+        parts = split_text(text, 100)
+
+        self.assertGreater(len(parts), 1)
+        self.assertTrue(all(estimate_tokens(part) <= 100 for part in parts))
+        self.assertEqual("".join(text.split()), "".join("".join(parts).split()))
+        self.assertEqual(["short slide"], split_text("short slide", 100))
+
+    def test_split_text_joins_the_words_of_a_line_with_spaces(self):
+        """
+        A line longer than a part is split between words and rejoined with spaces, and a word longer than a part is cut
+        into pieces as long as the limit allows, measured in tokens rather than characters.
+        """
+        line = " ".join(f"word{word}" for word in range(60))
+        parts = split_text(line + "\nnext line", 20)
+
+        self.assertEqual([line, "next line"], [" ".join(parts[:-1]), parts[-1]])
+        self.assertTrue(all(estimate_tokens(part) <= 20 for part in parts))
+
+        cuts = split_text("x" * 500, 20)
+        self.assertEqual("x" * 500, "".join(cuts))
+        self.assertTrue(all(estimate_tokens(cut) <= 20 for cut in cuts))
+        self.assertLess(len(cuts), 500 // 20)
+
+    def test_oversized_slide_is_sent_in_parts(self):
+        """
+        Only the slide over the limit is oversized, and every part of it is sent with the preceding slides and a
+        header numbering the parts.
+        """
+        long_text = "\n".join("a line of a pasted article about caches" for _ in range(200))
+        context = PresentationContext(["intro", long_text, "end"], window=1, max_slide_tokens=300)
+
+        self.assertFalse(context.is_oversized(0))
+        self.assertTrue(context.is_oversized(1))
+        self.assertEqual(estimate_tokens(long_text), context.slide_tokens(1))
+        requests = context.part_messages_for(1)
+        self.assertGreater(len(requests), 1)
+        for number, messages in enumerate(requests, start=1):
+            self.assertEqual({ROLE_FIELD: USER_ROLE, CONTENT_FIELD: "intro"}, messages[1])
+            self.assertTrue(messages[-1][CONTENT_FIELD].startswith(f"Part {number} of {len(requests)}"))
+
+
+    def test_preceding_slides_are_limited_to_the_window(self):
+        context = PresentationContext([f"slide {number}" for number in range(6)], window=2, token_budget=1000)
+        self.assertEqual(["slide 3", "slide 4"], context.preceding_texts(5))
+        self.assertEqual(["slide 0"], context.preceding_texts(1))
+        self.assertEqual([], context.preceding_texts(0))
+        self.assertEqual([], PresentationContext(["a", "b"], window=0).preceding_texts(1))
+
+    def test_preceding_slides_stop_at_the_first_slide_over_the_token_budget(self):
+        """
+        The closest slides are taken first, and a slide that does not fit the budget ends the window, even if the
+        slides before it would fit.
+        """
+        texts = ["an early slide", "x" * 400, "a close slide", "the closest slide", "current slide"]
+        budget = sum(estimate_tokens(text) for text in (texts[0], texts[2], texts[3]))
+        context = PresentationContext(texts, window=10, token_budget=budget)
+        self.assertEqual(["a close slide", "the closest slide"], context.preceding_texts(4))
+        self.assertEqual([], PresentationContext(texts, window=10, token_budget=0).preceding_texts(4))
+
+    def test_empty_slides_are_skipped_but_count_in_the_window(self):
+        texts = ["first", "", "  \n ", "current"]
+        self.assertEqual(["first"], PresentationContext(texts, window=3).preceding_texts(3))
+        self.assertEqual([], PresentationContext(texts, window=2).preceding_texts(3))
+
+    def test_messages_hold_the_system_prompt_the_preceding_slides_and_the_slide(self):
+        context = PresentationContext(["intro", "", "current"], system_prompt="prompt", window=2)
+        self.assertEqual([{ROLE_FIELD: SYSTEM_ROLE, CONTENT_FIELD: "prompt"},
+                          {ROLE_FIELD: USER_ROLE, CONTENT_FIELD: "intro"},
+                          {ROLE_FIELD: USER_ROLE, CONTENT_FIELD: "current"}], context.messages_for(2))
+
+    def test_parts_are_numbered_and_hold_the_whole_slide(self):
+        long_text = "\n".join(f"line {number} of a long slide" for number in range(100))
+        context = PresentationContext(["intro", long_text], system_prompt="prompt", window=1, max_slide_tokens=50)
+        parts = split_text(long_text, 50)
+        requests = context.part_messages_for(1)
+
+        self.assertEqual(len(parts), len(requests))
+        for number, (part, messages) in enumerate(zip(parts, requests), start=1):
+            self.assertEqual(context.messages_for(1)[:-1], messages[:-1])
+            header = PART_HEADER.format(number=number, count=len(parts))
+            self.assertEqual(f"{header}\n{part}", messages[-1][CONTENT_FIELD])
+        self.assertEqual(long_text, "\n".join(parts))
+
+
+if __name__ == "__main__":
+    unittest.main()
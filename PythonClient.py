@@ -1,4 +1,8 @@
+import argparse
 import requests
+from requests.adapters import HTTPAdapter
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from dataclasses import dataclass
 import os
@@ -8,22 +12,41 @@ NOT_FOUND = 404
 ERROR = 400
 OK = 200
 DONE_STATUS = 'done'
+FAILED_STATUS = 'failed'
 STATUS_FIELD = 'status'
 FILENAME_FIELD = 'filename'
 TIMESTAMP_FIELD = 'timestamp'
 FINISH_TIME_FIELD = 'finish_time'
 EXPLANATION_FIELD = 'explanation'
+SLIDES_DONE_FIELD = 'slides_done'
+SLIDES_TOTAL_FIELD = 'slides_total'
 UID_FIELD = 'uid'
+UIDS_FIELD = 'uids'
+UPLOADS_FIELD = 'uploads'
+STATUSES_FIELD = 'statuses'
+ERROR_FIELD = 'error'
+FILE_FIELD = 'file'
 EMAIL_FIELD = 'email'
+PRIORITY_FIELD = 'priority'
 NOT_FOUND_FIELD = 'not_found'
+TIMEOUT_FIELD = 'timeout'
+WAIT_POLL_TIMEOUT = 30
+REQUEST_TIMEOUT_MARGIN = 10
+MAX_WORKERS = 4
+UPLOAD_BATCH_SIZE = 10
+STATUS_BATCH_SIZE = 500
+PRESENTATION_EXTENSION = '.pptx'
+READ_BINARY_MODE = 'rb'
 NO_DATA_RETRIEVED = "Please provide either UID or email and filename."
 UPLOAD_COMPLETED_MESSAGE = "File upload is complete."
 FILE_UPLOADING_MESSAGE = "File processing is still in progress."
+FILE_FAILED_MESSAGE = "The file could not be processed."
 BASE_URL = "http://localhost:5000"
 FIRST_TASK_CHOOSER = "which task do you want to use? 'u' for uploading new files, 's' to get the status of a file, " \
-                     "or 'q' to exit: "
+                     "'w' to wait until a file is done, or 'q' to exit: "
 UPLOAD_TASK = 'u'
 STATUS_TASK = 's'
+WAIT_TASK = 'w'
 EXIT_TASK = 'q'
 VALID_TASK_ERROR = "please enter a valid option."
 PROVIDE_OPTIONAL_EMAIL_MESSAGE = "Please provide your email(optional, press enter for anonymous upload): "
@@ -38,6 +61,7 @@ PROVIDE_UID_MESSAGE = "Please enter the UID of the file to get its status: "
 PROVIDE_EMAIL_MESSAGE = "Please enter an email: "
 PROVIDE_FILENAME_MESSAGE = "Please enter the desired file_name: "
 VALID_SECOND_TASK_ERROR = "please enter a valid option, '1' for uid, '2' for a file_name and email."
+NO_PRESENTATIONS_FOUND = "No power-point presentations found in"
 
 
 @dataclass
@@ -47,20 +71,25 @@ class Status:
     Status:
     1) Pending - the file did not finish processing yet.
     2) Done - the file has finished processing.
-    3) Not found - the UID provided does not exist in the uploads/processed files.
+    3) Failed - the file could not be processed, it will not be processed again.
+    4) Not found - the UID provided does not exist in the uploads/processed files.
     Filename:
     1) no explanation file yet, then there is no name (when the status = pending).
     2) the filename of the explanation file or the file that has been processed ( when status = done).
     Timestamp: simply the time when the status has been changed.
     Explanation:
     1) None: if the status is pending
-    2) the explanations of the slides if the status is done.
+    2) the explanations of the slides finished so far if the status is processing.
+    3) the explanations of the slides if the status is done.
+    Slides done and slides total: the progress of the file, slides total is None until the file is processed.
     """
     status: str
     filename: str
     timestamp: datetime
     finish_time: datetime
     explanation: str
+    slides_done: int = 0
+    slides_total: int = None
 
     def is_done(self):
         """
@@ -69,6 +98,18 @@ class Status:
         """
         return self.status == DONE_STATUS
 
+    def is_failed(self):
+        """
+        :return: Returns True if the file could not be processed, false otherwise.
+        """
+        return self.status == FAILED_STATUS
+
+    def is_final(self):
+        """
+        :return: Returns True if the status will not change anymore, the file is either done or failed.
+        """
+        return self.is_done() or self.is_failed()
+
 
 def handle_response(response):
     """
@@ -77,13 +118,35 @@ def handle_response(response):
     :param: response: response object
     :return: returns a status object with all details of the file.
     """
-    json_data = response.json()
+    return status_from_json(response.json())
+
+
+def upload_params(email, priority):
+    """
+    :param: email: email of the user could be None or could be a String.
+    :param: priority: priority of the upload, None to leave the default of the web API (Integer)
+    :return: the query parameters of an upload request (Dictionary)
+    """
+    params = {EMAIL_FIELD: email or ""}
+    if priority is not None:
+        params[PRIORITY_FIELD] = priority
+    return params
+
+
+def status_from_json(json_data):
+    """
+    This method creates a status object from the json object of the status of a file.
+    :param: json_data: json object of the status of a file (Dictionary)
+    :return: returns a status object with all details of the file.
+    """
     return Status(
         status=json_data[STATUS_FIELD],
         filename=json_data[FILENAME_FIELD],
         timestamp=json_data[TIMESTAMP_FIELD],
         finish_time=json_data[FINISH_TIME_FIELD],
-        explanation=json_data[EXPLANATION_FIELD]
+        explanation=json_data[EXPLANATION_FIELD],
+        slides_done=json_data.get(SLIDES_DONE_FIELD, 0),
+        slides_total=json_data.get(SLIDES_TOTAL_FIELD)
     )
 
 
@@ -92,12 +155,29 @@ class PythonClient:
     The class has two members, the base_url, which is the url and the port the web API is listening to,
     and error_messages which is a member that holds the error messages if there is any.
     The class has also two methods, upload and get status.
+
+    ADDED:
+    every request goes through a single requests session, so the connections to the web API are kept alive and
+    reused, with a pool large enough for max_workers concurrent requests. upload_many and status_many upload and
+    check many files at once through the batch end-points.
     """
-    def __init__(self, base_url):
+    def __init__(self, base_url, max_workers=MAX_WORKERS):
         self.base_url = base_url
         self._error_message = ""
+        self._max_workers = max_workers
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
 
-    def upload(self, file_path, email):
+    def close(self):
+        """
+        This method closes the pooled connections of the client.
+        :return:
+        """
+        self._session.close()
+
+    def upload(self, file_path, email, priority=None):
         """
         The upload method receives a file_path which is the power-point presentation the user wants to be explained,
         as well as, an email, which is an optional way of identification for the user, if the email is None then the
@@ -107,23 +187,68 @@ class PythonClient:
         the uid of the file from the database to send back to the python client where it will be displayed to the user.
         :param: email: email of the user could be None or could be a String.
         :param: file_path: path of the power-point presentation (String)
+        :param: priority: optional priority of the upload, higher is processed first, the web API only accepts
+        integers between its MIN_PRIORITY and MAX_PRIORITY (Integer)
         :return: UID created by web API (json)
         """
 
-        if not email:
-            email = ""
-
         url = self.base_url + f'/upload'
-        params = {
-            EMAIL_FIELD: email
-        }
-        files = {'file': open(file_path, 'rb')}
-        response = requests.post(url, files=files, params=params)
+        params = upload_params(email, priority)
+        with open(file_path, READ_BINARY_MODE) as file:
+            response = self._session.post(url, files={FILE_FIELD: file}, params=params)
         if response.ok:
             return response.json()[UID_FIELD]
         else:
             raise Exception(f"Upload failed. Status code: {response.status_code}")
 
+    def upload_many(self, file_paths, email=None, batch_size=UPLOAD_BATCH_SIZE, priority=None):
+        """
+        The upload_many method uploads many power-point presentations with the same optional email and priority. The
+        files are sent to the /upload/batch end-point batch_size at a time, and up to max_workers batches are sent
+        concurrently over the pooled connections.
+        :param: file_paths: paths of the power-point presentations (List)
+        :param: email: email of the user could be None or could be a String.
+        :param: batch_size: number of files sent in a single request (Integer)
+        :param: priority: optional priority of the uploads, like in upload (Integer)
+        :return: the UID of every file path, or None if the web API rejected the file, in which case the error
+        message lists the rejected files and their errors (Dictionary)
+        """
+        batches = [file_paths[start:start + batch_size] for start in range(0, len(file_paths), batch_size)]
+        with ThreadPoolExecutor(max_workers=self._max_workers) as executor:
+            batch_results = list(executor.map(lambda batch: self._upload_batch(batch, email, priority), batches))
+
+        uids = {}
+        errors = []
+        for batch, results in zip(batches, batch_results):
+            for file_path, result in zip(batch, results):
+                uids[file_path] = result.get(UID_FIELD)
+                if ERROR_FIELD in result:
+                    errors.append(f"{file_path}: {result[ERROR_FIELD]}")
+        self._error_message = "\n".join(errors)
+        return uids
+
+    def _upload_batch(self, file_paths, email, priority=None):
+        """
+        This method uploads a single batch of files to the /upload/batch end-point.
+        :param: file_paths: paths of the power-point presentations (List)
+        :param: email: email of the user could be None or could be a String.
+        :param: priority: optional priority of the uploads (Integer)
+        :return: the result of every file, its uid or its error, in the order of the paths (List)
+        """
+        files = []
+        try:
+            for file_path in file_paths:
+                files.append((FILE_FIELD, (os.path.basename(file_path), open(file_path, READ_BINARY_MODE))))
+            response = self._session.post(self.base_url + '/upload/batch', files=files,
+                                          params=upload_params(email, priority))
+        finally:
+            for _, (_, file) in files:
+                file.close()
+        if response.ok:
+            return response.json()[UPLOADS_FIELD]
+        else:
+            raise Exception(f"Batch upload failed. Status code: {response.status_code}")
+
     def status(self, uid=None, email=None, filename=None):
         """
         The status method retrieves the status based on either UID or email and filename.
@@ -136,14 +261,14 @@ class PythonClient:
         """
         if uid:
             url = self.base_url + f'/status/{uid}'
-            response = requests.get(url)
+            response = self._session.get(url)
         elif email and filename:
             url = self.base_url + '/status'
             params = {
                 EMAIL_FIELD: email,
                 FILENAME_FIELD: filename
             }
-            response = requests.get(url, params=params)
+            response = self._session.get(url, params=params)
         else:
             self._error_message = NO_DATA_RETRIEVED
             return None
@@ -156,6 +281,72 @@ class PythonClient:
         else:
             raise Exception(f"Status retrieval failed. Status code: {response.status_code}")
 
+    def status_many(self, uids):
+        """
+        The status_many method retrieves the status of many files by their UIDs through the /status/batch end-point,
+        STATUS_BATCH_SIZE UIDs at a time, with up to max_workers requests sent concurrently.
+        :param: uids: UIDs of the files (List)
+        :return: the Status object of every UID, or None if the UID was not found (Dictionary)
+        """
+        uids = list(dict.fromkeys(uids))
+        batches = [uids[start:start + STATUS_BATCH_SIZE] for start in range(0, len(uids), STATUS_BATCH_SIZE)]
+        with ThreadPoolExecutor(max_workers=self._max_workers) as executor:
+            batch_statuses = list(executor.map(self._status_batch, batches))
+
+        statuses = {}
+        for batch in batch_statuses:
+            for uid, status_data in batch.items():
+                statuses[uid] = status_from_json(status_data) if STATUS_FIELD in status_data else None
+        return statuses
+
+    def _status_batch(self, uids):
+        """
+        This method retrieves the status of a single batch of UIDs from the /status/batch end-point.
+        :param: uids: UIDs of the files (List)
+        :return: the json object of the status of every UID (Dictionary)
+        """
+        response = self._session.post(self.base_url + '/status/batch', json={UIDS_FIELD: uids})
+        if response.ok:
+            return response.json()[STATUSES_FIELD]
+        else:
+            raise Exception(f"Batch status retrieval failed. Status code: {response.status_code}")
+
+    def wait_for(self, uid, timeout=None, poll_timeout=WAIT_POLL_TIMEOUT, on_progress=None):
+        """
+        The wait_for method waits until the file with the given UID is done or failed, using the '/status/<uid>/wait'
+        long-poll end-point, so the server only answers when the status or the progress of the file changed instead of
+        being polled over and over.
+        :param: uid: UID of the file
+        :param: timeout: maximum number of seconds to wait, None to wait until the file is done (optional)
+        :param: poll_timeout: maximum number of seconds a single request is held by the server (optional)
+        :param: on_progress: function called with every Status received before the file is done (optional)
+        :return: the latest Status object, which is done or failed unless the timeout passed, or None if the UID was
+        not found.
+        """
+        url = self.base_url + f'/status/{uid}/wait'
+        deadline = None if timeout is None else time.monotonic() + timeout
+        status = None
+        while True:
+            params = {TIMEOUT_FIELD: poll_timeout}
+            if deadline is not None:
+                params[TIMEOUT_FIELD] = max(0, min(poll_timeout, deadline - time.monotonic()))
+            if status is not None:
+                params[STATUS_FIELD] = status.status
+                params[SLIDES_DONE_FIELD] = status.slides_done
+
+            response = self._session.get(url, params=params, timeout=params[TIMEOUT_FIELD] + REQUEST_TIMEOUT_MARGIN)
+            if response.status_code == NOT_FOUND:
+                self._error_message = response.json()[NOT_FOUND_FIELD]
+                return None
+            elif not response.ok:
+                raise Exception(f"Status retrieval failed. Status code: {response.status_code}")
+
+            status = handle_response(response)
+            if status.is_final() or (deadline is not None and time.monotonic() >= deadline):
+                return status
+            if on_progress is not None:
+                on_progress(status)
+
     @property
     def error_message(self):
         """
@@ -197,12 +388,51 @@ def print_status_results(status):
     print(f"Filename: {status.filename}")
     print(f"Upload Time: {status.timestamp}")
     print(f"Finish upload Time: {status.finish_time}")
+    if status.slides_total:
+        print(f"Slides explained: {status.slides_done}/{status.slides_total}")
 
     if status.is_done():
         print(UPLOAD_COMPLETED_MESSAGE)
         print(f"Explanation: {status.explanation}")
+    elif status.is_failed():
+        print(FILE_FAILED_MESSAGE)
     else:
         print(FILE_UPLOADING_MESSAGE)
+        if status.slides_done:
+            print(f"Explanation so far: {status.explanation}")
+
+
+def print_progress(status):
+    """
+    This function receives a status object of a file that is not done yet and prints its progress.
+    :param: status: status object
+    :return:
+    """
+    print(f"Status: {status.status}, slides explained: {status.slides_done}/{status.slides_total or '?'}")
+
+
+def upload_directory(client, directory, email=None):
+    """
+    This function uploads every power-point presentation of a directory at once, and prints the UID of every file,
+    or the reason it was rejected.
+    :param: client: the client of the web API (PythonClient)
+    :param: directory: path of the directory (String)
+    :param: email: email of the user could be None or could be a String.
+    :return: the UID of every file path, or None if the file was rejected (Dictionary)
+    """
+    file_paths = sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                        if name.lower().endswith(PRESENTATION_EXTENSION))
+    if not file_paths:
+        print(f"{NO_PRESENTATIONS_FOUND} {directory}")
+        return {}
+
+    uids = client.upload_many(file_paths, email)
+    for file_path, uid in uids.items():
+        if uid:
+            print(f"{file_path}: {uid}")
+    if client.error_message:
+        print(client.error_message)
+    return uids
 
 
 def main():
@@ -214,13 +444,36 @@ def main():
     ADDED TO THE MAIN FUNCTION:
     the ability for the user to optionally provide his email when uploading a file, and the ability to ask for
     the status of a file using an email and a file name instead of the uid.
+
+    ADDED:
+    the ability to wait until a file is done, printing its progress along the way.
+
+    ADDED:
+    a command line mode, 'python PythonClient.py --upload-dir <directory> [--email <email>]' uploads every
+    presentation of the directory at once and exits, without the interactive loop.
     :return:
     """
-    client = PythonClient(BASE_URL)
+    parser = argparse.ArgumentParser(description="Client of the power-point explainer web API.")
+    parser.add_argument("--upload-dir", help="upload every presentation of the directory and exit")
+    parser.add_argument("--email", help="email of the uploads of --upload-dir")
+    parser.add_argument("--base-url", default=BASE_URL, help="url of the web API")
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS, help="concurrent requests")
+    args = parser.parse_args()
+    client = PythonClient(args.base_url, max_workers=args.workers)
+
+    if args.upload_dir:
+        if args.email and not is_email_format(args.email):
+            print(VALID_EMAIL_ERROR)
+            return
+        if not os.path.isdir(args.upload_dir):
+            print(VALID_PATH_ERROR)
+            return
+        upload_directory(client, args.upload_dir, args.email)
+        return
 
     while True:
         task = input(FIRST_TASK_CHOOSER).strip()
-        if not task.lower() == UPLOAD_TASK and not task.lower() == STATUS_TASK and not task.lower() == EXIT_TASK:
+        if task.lower() not in (UPLOAD_TASK, STATUS_TASK, WAIT_TASK, EXIT_TASK):
             print(VALID_TASK_ERROR)
             continue
         elif task.lower() == UPLOAD_TASK:
@@ -262,6 +515,14 @@ def main():
                 print(VALID_SECOND_TASK_ERROR)
                 continue
 
+        elif task.lower() == WAIT_TASK:
+            powerpoint_UID = input(PROVIDE_UID_MESSAGE).strip()
+            status = client.wait_for(str(powerpoint_UID), on_progress=print_progress)
+            if status is None:
+                print(client.error_message)
+            else:
+                print_status_results(status)
+
         elif task.lower() == EXIT_TASK:
             break
 
@@ -0,0 +1,100 @@
+import asyncio
+import unittest
+import openai
+
+from fake_completion_server import FakeCompletionServer
+from rate_limiter import AdaptiveRateLimiter
+
+
+class RateLimiterTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        """
+        This method points the openai package to a local fake completion server, the tests set the latency and the
+        failures the server injects.
+        :return:
+        """
+        self.server = FakeCompletionServer().start()
+        self.original_api_base = openai.api_base
+        self.original_api_key = openai.api_key
+        openai.api_base = self.server.api_base
+        openai.api_key = "test-key"
+
+    def tearDown(self):
+        """
+        This method stops the fake server and restores the openai settings.
+        :return:
+        """
+        self.server.stop()
+        openai.api_base = self.original_api_base
+        openai.api_key = self.original_api_key
+
+    def request(self, content="slide"):
+        """
+        :return: a function that creates a new completion request to the fake server.
+        """
+        return lambda: openai.ChatCompletion.acreate(model="gpt-3.5-turbo",
+                                                     messages=[{"role": "user", "content": content}])
+
+    async def test_retries_rate_limited_requests_until_they_succeed(self):
+        """
+        Against a server that answers a third of the requests with a 429, every request must end up succeeding, the
+        429s must be retried, and the concurrency limit must be lowered.
+        :return:
+        """
+        self.server.rate_limit_probability = 0.3
+        self.server.retry_after = 0.01
+        limiter = AdaptiveRateLimiter(rate=100, burst=20, initial_concurrency=8, max_retries=20, base_backoff=0.01,
+                                      max_backoff=0.05)
+        responses = [await limiter.call(self.request(f"slide {number}")) for number in range(20)]
+
+        self.assertEqual(len(responses), 20)
+        self.assertEqual(responses[3]["choices"][0].message.content, "Explanation of: slide 3")
+        self.assertGreater(limiter.throttled, 0)
+        self.assertEqual(limiter.retries, self.server.rate_limited)
+        self.assertLess(limiter.concurrency_limit, 8)
+
+    async def test_honors_retry_after(self):
+        """
+        A request answered with a 429 must not be retried before the Retry-After of the server.
+        :return:
+        """
+        self.server.rate_limit_probability = 1.0
+        self.server.retry_after = 0.2
+        limiter = AdaptiveRateLimiter(rate=100, max_retries=1, base_backoff=0.001, max_backoff=0.001)
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        with self.assertRaises(openai.error.RateLimitError):
+            await limiter.call(self.request())
+
+        self.assertGreaterEqual(loop.time() - start, 0.2)
+        self.assertEqual(self.server.requests, 2)
+
+    async def test_respects_the_concurrency_limit(self):
+        """
+        With latency on the server, the requests in flight must never exceed the concurrency limit.
+        :return:
+        """
+        self.server.latency = 0.05
+        limiter = AdaptiveRateLimiter(rate=1000, burst=100, initial_concurrency=3, max_concurrency=3)
+        await asyncio.gather(*(limiter.call(self.request()) for _ in range(15)))
+
+        self.assertLessEqual(self.server.max_in_flight, 3)
+        self.assertEqual(limiter.in_flight, 0)
+
+    async def test_does_not_retry_invalid_requests(self):
+        """
+        An error that would fail the same way again must be raised on the first attempt.
+        :return:
+        """
+        limiter = AdaptiveRateLimiter(max_retries=5)
+
+        async def invalid_request():
+            raise openai.error.InvalidRequestError("bad request", None)
+
+        with self.assertRaises(openai.error.InvalidRequestError):
+            await limiter.call(invalid_request)
+        self.assertEqual(limiter.retries, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
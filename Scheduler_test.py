@@ -0,0 +1,54 @@
+import unittest
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from job_scheduler import schedule_uploads, FAIR_POLICY, FIFO_POLICY
+
+Job = namedtuple('Job', ['id', 'user_id', 'slides_total', 'priority', 'upload_time'])
+START = datetime(2024, 1, 1)
+
+
+def make_job(job_id, user_id, slides, seconds=0, priority=0):
+    return Job(job_id, user_id, slides, priority, START + timedelta(seconds=seconds))
+
+
+class SchedulerTest(unittest.TestCase):
+    def setUp(self):
+        # user 1 dumps five decks first, user 2 and an anonymous user upload one each later on
+        self.jobs = [make_job(number, 1, 100 - number, seconds=number) for number in range(1, 6)]
+        self.jobs += [make_job(6, 2, 50, seconds=10), make_job(7, None, 5, seconds=11)]
+        self.now = START + timedelta(seconds=20)
+
+    def test_fifo_follows_the_upload_time(self):
+        self.assertEqual([1, 2, 3], schedule_uploads(self.jobs, {}, 3, now=self.now, policy=FIFO_POLICY))
+
+    def test_fair_interleaves_users_and_favors_short_decks(self):
+        """
+        Every user gets a deck before the heavy user gets a second one, and the shortest deck of the heavy user goes
+        first. A user with uploads already processing waits for the others.
+        """
+        chosen = schedule_uploads(self.jobs, {}, 4, now=self.now, policy=FAIR_POLICY, aging_rate=0)
+        self.assertEqual({5, 6, 7}, set(chosen[:3]))
+        self.assertEqual(4, chosen[3])
+
+        chosen = schedule_uploads(self.jobs, {1: 2}, 3, now=self.now, policy=FAIR_POLICY, aging_rate=0)
+        self.assertEqual([7, 6, 5], chosen)
+
+    def test_aging_and_priority(self):
+        """
+        A long deck that waited long enough goes before a newer short deck of the same user, and an upload with a
+        higher priority goes before every other user.
+        """
+        jobs = [make_job(1, 1, 60, seconds=0), make_job(2, 1, 10, seconds=100)]
+        now = START + timedelta(seconds=200)
+        self.assertEqual([2], schedule_uploads(jobs, {}, 1, now=now, policy=FAIR_POLICY, aging_rate=0))
+        self.assertEqual([1], schedule_uploads(jobs, {}, 1, now=now, policy=FAIR_POLICY, aging_rate=1))
+
+        jobs = self.jobs + [make_job(8, 1, 300, seconds=15, priority=1)]
+        self.assertEqual(8, schedule_uploads(jobs, {1: 4}, 1, now=self.now, policy=FAIR_POLICY)[0])
+        with self.assertRaises(ValueError):
+            schedule_uploads(jobs, {}, 1, policy="random")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+import os
+import shutil
+import tempfile
+import unittest
+from sqlalchemy import inspect, text
+from sqlalchemy.orm import Session
+
+from handle_db import User, Upload, create_database_engine, prepare_database, upsert_user
+
+
+class SchemaTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.engine = create_database_engine(f"sqlite:///{os.path.join(self.folder, 'schema.db')}")
+
+    def tearDown(self):
+        self.engine.dispose()
+        shutil.rmtree(self.folder)
+
+    def test_prepare_database_adds_the_missing_columns_and_indexes_and_keeps_the_rows(self):
+        """
+        An uploads table created before the later columns and indexes gets them, with its rows, and preparing the
+        database again changes nothing.
+        """
+        with self.engine.begin() as connection:
+            connection.execute(text(f"CREATE TABLE {Upload.__tablename__} (id INTEGER PRIMARY KEY, uid VARCHAR, "
+                                    f"file_name VARCHAR, status VARCHAR, upload_time DATETIME)"))
+            connection.execute(text(f"INSERT INTO {Upload.__tablename__} (uid, file_name, status) "
+                                    f"VALUES ('old', 'old.pptx', 'done')"))
+
+        prepare_database(self.engine)
+        prepare_database(self.engine)
+
+        inspector = inspect(self.engine)
+        columns = {column["name"] for column in inspector.get_columns(Upload.__tablename__)}
+        self.assertEqual({column.name for column in Upload.__table__.columns}, columns)
+        indexes = {index["name"] for index in inspector.get_indexes(Upload.__tablename__)}
+        self.assertTrue({index.name for index in Upload.__table__.indexes} <= indexes)
+        self.assertIn(User.__tablename__, inspector.get_table_names())
+        with Session(self.engine) as session:
+            upload = session.query(Upload).one()
+            self.assertEqual(("old", None, None), (upload.uid, upload.lease_owner, upload.slides_failed))
+
+    def test_upsert_user_creates_a_user_once(self):
+        prepare_database(self.engine)
+        with Session(self.engine) as session:
+            user_id = upsert_user(session, "user@example.com")
+            session.commit()
+        with Session(self.engine) as session:
+            self.assertEqual(user_id, upsert_user(session, "user@example.com"))
+            other_id = upsert_user(session, "other@example.com")
+            self.assertNotEqual(user_id, other_id)
+            session.rollback()
+        with Session(self.engine) as session:
+            self.assertEqual(["user@example.com"], [user.email for user in session.query(User)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+import json
+import unittest
+
+from presentation_context import PresentationContext, CONTENT_FIELD
+from slide_batcher import plan_batches, build_batch_messages, parse_batch_response, BATCH_INSTRUCTIONS
+
+SHORT_TEXT = "a short slide"
+LONG_TEXT = " ".join(f"word{number}" for number in range(200))
+
+
+class PlanBatchesTest(unittest.TestCase):
+    def setUp(self):
+        self.context = PresentationContext([SHORT_TEXT] * 5, window=0)
+        self.tokens = self.context.slide_tokens(0)
+
+    def test_consecutive_short_slides_fill_the_token_budget(self):
+        self.assertEqual([[0, 1], [2, 3], [4]], plan_batches(
+            self.context, range(5), token_budget=2 * self.tokens, short_slide_tokens=self.tokens))
+
+    def test_batches_hold_at_most_max_batch_slides(self):
+        self.assertEqual([[0, 1, 2], [3, 4]], plan_batches(
+            self.context, range(5), token_budget=100 * self.tokens, max_batch_slides=3,
+            short_slide_tokens=self.tokens))
+
+    def test_slides_already_explained_break_a_batch(self):
+        self.assertEqual([[0, 1], [3, 4]], plan_batches(
+            self.context, [0, 1, 3, 4], token_budget=100 * self.tokens, short_slide_tokens=self.tokens))
+
+    def test_long_and_oversized_slides_get_a_request_of_their_own(self):
+        context = PresentationContext([SHORT_TEXT, SHORT_TEXT, LONG_TEXT, SHORT_TEXT, SHORT_TEXT], window=0,
+                                      max_slide_tokens=self.tokens * 2)
+        self.assertTrue(context.is_oversized(2))
+        self.assertEqual([[0, 1], [2], [3, 4]], plan_batches(
+            context, range(5), token_budget=100 * self.tokens, short_slide_tokens=self.tokens))
+
+
+class BatchMessagesTest(unittest.TestCase):
+    def test_messages_hold_the_instructions_the_context_and_a_header_per_slide(self):
+        context = PresentationContext(["intro", "first", "second"], window=1)
+        messages = build_batch_messages(context, [1, 2])
+
+        self.assertIn(BATCH_INSTRUCTIONS, messages[0][CONTENT_FIELD])
+        self.assertEqual(["intro", "slide2:\nfirst\n\nslide3:\nsecond"],
+                         [message[CONTENT_FIELD] for message in messages[1:]])
+
+
+class ParseBatchResponseTest(unittest.TestCase):
+    batch = [2, 3]
+
+    def test_answer_with_every_slide_is_split(self):
+        """
+        Text around the JSON object and keys of slides outside of the batch are ignored.
+        """
+        content = "Here you go: " + json.dumps({"slide3": "third", "slide4": "fourth", "slide9": "extra"}) + " Bye."
+        self.assertEqual({2: "third", 3: "fourth"}, parse_batch_response(content, self.batch))
+
+    def test_malformed_or_non_object_answers_are_rejected(self):
+        for content in ("no json at all", '{"slide3": "third", "slide4": ', '["slide3", "slide4"]',
+                        '} "slide3": "third" {', '{"slide3": "third"} and {"slide4": "fourth"}'):
+            self.assertIsNone(parse_batch_response(content, self.batch), content)
+
+    def test_answers_missing_a_slide_or_with_a_non_string_explanation_are_rejected(self):
+        for answers in ({"slide3": "third"}, {"slide3": "third", "slide4": None}, {"slide3": "third", "slide4": 4},
+                        {"slide3": ["third"], "slide4": "fourth"}, {"slide3": "third", "slide4": "  "}):
+            self.assertIsNone(parse_batch_response(json.dumps(answers), self.batch), answers)
+
+
+if __name__ == "__main__":
+    unittest.main()
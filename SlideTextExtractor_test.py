@@ -0,0 +1,129 @@
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+import zipfile
+from pptx import Presentation
+from pptx.util import Inches
+
+from slide_text_extractor import count_slides, extract_slide_texts, extract_texts, parse_text_of_slide, \
+    read_slide_count, PPTX_EXTRACTION_ENGINE, REQUIRED_PARTS
+
+SAMPLE_PRESENTATION = os.path.join('test', 'test.pptx')
+TITLE_ONLY_LAYOUT = 5
+LOCAL_HEADER = b"PK\x03\x04"
+CENTRAL_HEADER = b"PK\x01\x02"
+# offsets of the flags and of the compression method in the local and central headers of a zip entry
+LOCAL_FLAGS_OFFSET, LOCAL_METHOD_OFFSET = 6, 8
+CENTRAL_FLAGS_OFFSET, CENTRAL_METHOD_OFFSET = 8, 10
+ENCRYPTED_FLAG = 1
+UNKNOWN_METHOD = 99
+
+
+class SlideTextExtractorTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        """
+        This method builds a presentation with a group shape, a table and notes, and reorders its slides so the order
+        of the slides differs from the numbering of the slide files.
+        :return:
+        """
+        cls.folder = tempfile.mkdtemp()
+        cls.presentation_path = os.path.join(cls.folder, 'shapes.pptx')
+        prs = Presentation()
+        layout = prs.slide_layouts[TITLE_ONLY_LAYOUT]
+
+        slide = prs.slides.add_slide(layout)
+        slide.shapes.title.text = "Grouped"
+        group = slide.shapes.add_group_shape()
+        group.shapes.add_textbox(Inches(1), Inches(2), Inches(3), Inches(1)).text_frame.text = "inside group"
+        slide.notes_slide.notes_text_frame.text = "speaker notes"
+
+        slide = prs.slides.add_slide(layout)
+        slide.shapes.title.text = "Table"
+        table = slide.shapes.add_table(1, 2, Inches(1), Inches(2), Inches(4), Inches(1)).table
+        table.cell(0, 0).text = "left cell"
+        table.cell(0, 1).text = "right cell"
+
+        slide_ids = prs.slides._sldIdLst
+        slide_ids.insert(0, slide_ids[-1])
+        prs.save(cls.presentation_path)
+
+    @classmethod
+    def tearDownClass(cls):
+        """
+        This method removes the built presentation.
+        :return:
+        """
+        shutil.rmtree(cls.folder)
+
+    def test_matches_python_pptx(self):
+        """
+        By default the extractor must return exactly the text of the python-pptx walk, in the order of the slides.
+        :return:
+        """
+        for presentation_path in (SAMPLE_PRESENTATION, self.presentation_path):
+            expected = [parse_text_of_slide(slide) for slide in Presentation(presentation_path).slides]
+            self.assertEqual(extract_slide_texts(presentation_path), expected)
+        self.assertEqual(extract_slide_texts(self.presentation_path), ["Table", "Grouped"])
+        self.assertEqual(extract_texts(self.presentation_path, PPTX_EXTRACTION_ENGINE), ["Table", "Grouped"])
+
+    def test_extracts_groups_tables_and_notes(self):
+        """
+        The options must add the text of group shapes, table cells and notes after the text of the slide.
+        :return:
+        """
+        self.assertEqual(extract_slide_texts(self.presentation_path, include_groups=True, include_tables=True,
+                                             include_notes=True),
+                         ["Table left cell right cell", "Grouped inside group speaker notes"])
+
+    def test_counts_slides(self):
+        """
+        The slides must be counted from the slide list of the presentation.
+        :return:
+        """
+        self.assertEqual(count_slides(self.presentation_path), 2)
+
+    def build_damaged_zip(self, local_offset=None, central_offset=None, value=None):
+        """
+        This method writes a zip holding the parts a presentation requires, and overwrites a 16 bit field of the
+        headers of every entry, if one is given.
+        :return: path of the zip (String)
+        """
+        path = os.path.join(self.folder, 'damaged.pptx')
+        with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+            for part in REQUIRED_PARTS:
+                archive.writestr(part, "<presentation>" + "slide" * 100 + "</presentation>")
+        with open(path, 'rb') as file:
+            content = bytearray(file.read())
+        for header, offset in ((LOCAL_HEADER, local_offset), (CENTRAL_HEADER, central_offset)):
+            start = content.find(header) if offset is not None else -1
+            while start >= 0:
+                struct.pack_into('<H', content, start + offset, value)
+                start = content.find(header, start + len(header))
+        with open(path, 'wb') as file:
+            file.write(content)
+        return path
+
+    def test_unreadable_zip_is_not_a_presentation(self):
+        """
+        An encrypted part, an unknown compression method and corrupt compressed data must not raise.
+        :return:
+        """
+        self.assertIsNone(read_slide_count(self.build_damaged_zip(LOCAL_FLAGS_OFFSET, CENTRAL_FLAGS_OFFSET,
+                                                                  ENCRYPTED_FLAG)))
+        self.assertIsNone(read_slide_count(self.build_damaged_zip(LOCAL_METHOD_OFFSET, CENTRAL_METHOD_OFFSET,
+                                                                  UNKNOWN_METHOD)))
+        corrupt_path = self.build_damaged_zip()
+        with open(corrupt_path, 'rb') as file:
+            content = bytearray(file.read())
+        data_start = content.find(REQUIRED_PARTS[1].encode()) + len(REQUIRED_PARTS[1])
+        content[data_start:data_start + 8] = b"\xff" * 8
+        with open(corrupt_path, 'wb') as file:
+            file.write(content)
+        self.assertIsNone(read_slide_count(corrupt_path))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,460 @@
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+import zipfile
+from unittest import mock
+from pptx import Presentation
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from werkzeug.serving import make_server
+
+import webAPI
+from PythonClient import PythonClient
+from handle_db import Base, Upload, SlideExplanation, StoredOutput, create_database_engine
+
+TITLE_ONLY_LAYOUT = 5
+
+
+def build_presentation(slides):
+    """
+    :param: slides: number of slides of the presentation (Integer)
+    :return: the content of a presentation with the given number of slides (Bytes)
+    """
+    prs = Presentation()
+    for number in range(slides):
+        prs.slides.add_slide(prs.slide_layouts[TITLE_ONLY_LAYOUT]).shapes.title.text = f"Slide {number}"
+    content = io.BytesIO()
+    prs.save(content)
+    return content.getvalue()
+
+
+def build_zip(parts):
+    """
+    :param: parts: names of the parts of the zip file (List of strings)
+    :return: the content of a zip file holding the given parts (Bytes)
+    """
+    content = io.BytesIO()
+    with zipfile.ZipFile(content, 'w') as archive:
+        for part in parts:
+            archive.writestr(part, "<empty/>")
+    return content.getvalue()
+
+
+class WebAPITestCase(unittest.TestCase):
+    """
+    This class runs the web API in the test process, with the test client of flask, in a temporary folder with a
+    database of its own.
+    """
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.working_folder = os.getcwd()
+        os.chdir(self.folder)
+        self.engine = create_database_engine(f"sqlite:///{os.path.join(self.folder, 'web.db')}")
+        Base.metadata.create_all(self.engine)
+        patch = mock.patch.object(webAPI, 'engine', self.engine)
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.client = webAPI.webAPI.test_client()
+
+    def tearDown(self):
+        self.engine.dispose()
+        os.chdir(self.working_folder)
+        shutil.rmtree(self.folder)
+
+    def add_upload(self, uid, status, source_uid=None, slides=None):
+        """
+        This method adds an upload, with the given explanations stored as its output if it is done, or saved as its
+        finished slides otherwise.
+        :return:
+        """
+        with Session(self.engine) as session:
+            upload = Upload(f"{uid}.pptx", status, uid)
+            upload.source_uid = source_uid
+            session.add(upload)
+            session.flush()
+            if slides is not None and status == webAPI.DONE:
+                webAPI.OUTPUT_STORE.save(session, upload, slides)
+            elif slides is not None:
+                for number, explanation in enumerate(slides.values(), start=1):
+                    session.add(SlideExplanation(upload.id, number, explanation))
+            session.commit()
+
+    def upload(self, content, file_name="deck.pptx", **params):
+        return self.client.post("/upload", data={webAPI.FILE_FIELD: (io.BytesIO(content), file_name)},
+                                content_type="multipart/form-data", query_string=params)
+
+    def priorities(self):
+        """
+        :return: the priority of every upload, keyed by uid (Dictionary)
+        """
+        with Session(self.engine) as session:
+            return dict(session.query(Upload.uid, Upload.priority))
+
+    def saved_files(self):
+        """
+        :return: names of the files left in the uploads folder (List of strings)
+        """
+        return os.listdir(webAPI.UPLOAD_FOLDER) if os.path.exists(webAPI.UPLOAD_FOLDER) else []
+
+
+class UploadValidationTest(WebAPITestCase):
+    def assertRejected(self, response, status_code, message):
+        self.assertEqual((status_code, {webAPI.ERROR_FIELD: message}), (response.status_code, response.get_json()))
+        self.assertEqual([], self.saved_files())
+
+    def test_accepts_a_presentation(self):
+        response = self.upload(build_presentation(2))
+        self.assertEqual(webAPI.OK, response.status_code)
+        self.assertEqual([f"{response.get_json()[webAPI.UID_FIELD]}.pptx"], self.saved_files())
+
+    def test_rejects_a_file_that_is_not_a_zip(self):
+        self.assertRejected(self.upload(b"not a presentation"), webAPI.ERROR, webAPI.NOT_A_PRESENTATION)
+        self.assertRejected(self.upload(build_presentation(1), "deck.txt"), webAPI.ERROR, webAPI.NOT_A_PRESENTATION)
+
+    def test_rejects_a_zip_without_the_presentation_parts(self):
+        for parts in ([], ["[Content_Types].xml"], ["ppt/presentation.xml"]):
+            self.assertRejected(self.upload(build_zip(parts)), webAPI.ERROR, webAPI.NOT_A_PRESENTATION)
+
+    def test_rejects_a_file_larger_than_the_request_limit(self):
+        with mock.patch.dict(webAPI.webAPI.config, MAX_CONTENT_LENGTH=1024):
+            self.assertRejected(self.upload(build_presentation(1)), webAPI.PAYLOAD_TOO_LARGE, webAPI.FILE_TOO_LARGE)
+
+    def test_rejects_a_slide_count_out_of_range(self):
+        self.assertRejected(self.upload(build_presentation(0)), webAPI.UNPROCESSABLE,
+                            webAPI.SLIDE_COUNT_OUT_OF_RANGE)
+        with mock.patch.object(webAPI, 'MAX_SLIDES', 2):
+            self.assertRejected(self.upload(build_presentation(3)), webAPI.UNPROCESSABLE,
+                                webAPI.SLIDE_COUNT_OUT_OF_RANGE)
+
+    def test_priority_is_validated_and_stored(self):
+        default_uid = self.upload(build_presentation(1)).get_json()[webAPI.UID_FIELD]
+        urgent_uid = self.upload(build_presentation(2), priority=webAPI.MAX_PRIORITY).get_json()[webAPI.UID_FIELD]
+        self.assertEqual({default_uid: webAPI.DEFAULT_PRIORITY, urgent_uid: webAPI.MAX_PRIORITY}, self.priorities())
+        saved_files = self.saved_files()
+
+        for priority in ("high", "1.5", webAPI.MAX_PRIORITY + 1, webAPI.MIN_PRIORITY - 1):
+            response = self.upload(build_presentation(1), priority=priority)
+            self.assertEqual((webAPI.ERROR, {webAPI.ERROR_FIELD: webAPI.INVALID_PRIORITY}),
+                             (response.status_code, response.get_json()))
+        self.assertEqual(saved_files, self.saved_files())
+
+
+class BatchTest(WebAPITestCase):
+    def count_statements(self, table):
+        """
+        :return: the list the statements run on the database that mention the table are added to (List)
+        """
+        statements = []
+
+        def record(connection, cursor, statement, parameters, context, executemany):
+            if table in statement:
+                statements.append(statement)
+        event.listen(self.engine, "before_cursor_execute", record)
+        self.addCleanup(event.remove, self.engine, "before_cursor_execute", record)
+        return statements
+
+    def test_upload_batch_reports_every_file_in_order(self):
+        response = self.client.post("/upload/batch", content_type="multipart/form-data", query_string={
+            webAPI.PRIORITY_FIELD: 4}, data={webAPI.FILE_FIELD: [
+            (io.BytesIO(build_presentation(1)), "first.pptx"), (io.BytesIO(b"not a zip"), "broken.pptx"),
+            (io.BytesIO(build_presentation(2)), "notes.txt"), (io.BytesIO(build_presentation(2)), "second.pptx")]})
+
+        self.assertEqual(webAPI.OK, response.status_code)
+        results = response.get_json()[webAPI.UPLOADS_FIELD]
+        self.assertEqual(["first.pptx", "broken.pptx", "notes.txt", "second.pptx"],
+                         [result[webAPI.FILENAME_FIELD] for result in results])
+        self.assertEqual([webAPI.NOT_A_PRESENTATION] * 2, [results[1][webAPI.ERROR_FIELD],
+                                                          results[2][webAPI.ERROR_FIELD]])
+        uids = [results[0][webAPI.UID_FIELD], results[3][webAPI.UID_FIELD]]
+        with Session(self.engine) as session:
+            self.assertEqual({(uids[0], 1, 4), (uids[1], 2, 4)},
+                             set(session.query(Upload.uid, Upload.slides_total, Upload.priority)))
+        self.assertEqual(sorted(f"{uid}.pptx" for uid in uids), sorted(self.saved_files()))
+
+    def test_upload_batch_rejects_an_empty_or_oversized_batch_or_an_invalid_priority(self):
+        response = self.client.post("/upload/batch", content_type="multipart/form-data", data={})
+        self.assertEqual((webAPI.ERROR, webAPI.NO_FILE_ATTACHED),
+                         (response.status_code, response.get_json()[webAPI.ERROR_FIELD]))
+        with mock.patch.object(webAPI, 'MAX_BATCH_FILES', 1):
+            response = self.client.post("/upload/batch", content_type="multipart/form-data", data={
+                webAPI.FILE_FIELD: [(io.BytesIO(build_presentation(1)), f"{name}.pptx") for name in "ab"]})
+        self.assertEqual((webAPI.ERROR, webAPI.TOO_MANY_FILES),
+                         (response.status_code, response.get_json()[webAPI.ERROR_FIELD]))
+        response = self.client.post("/upload/batch", content_type="multipart/form-data", query_string={
+            webAPI.PRIORITY_FIELD: "urgent"}, data={webAPI.FILE_FIELD: [(io.BytesIO(build_presentation(1)), "a.pptx")]})
+        self.assertEqual((webAPI.ERROR, webAPI.INVALID_PRIORITY),
+                         (response.status_code, response.get_json()[webAPI.ERROR_FIELD]))
+        self.assertEqual([], self.saved_files())
+
+    def test_status_batch_answers_every_uid(self):
+        """
+        Done uploads, one of them reusing the output of another, an upload in progress, a done upload whose output is
+        missing and an unknown uid are answered in a single response, the versions of the outputs are read with one
+        query.
+        """
+        self.add_upload("done", webAPI.DONE, slides={"slide1": "first", "slide2": "second"})
+        self.add_upload("copy", webAPI.DONE, source_uid="done")
+        self.add_upload("running", webAPI.PROCESSING, slides={"slide1": "first"})
+        self.add_upload("lost", webAPI.DONE)
+        output_queries = self.count_statements(StoredOutput.__tablename__)
+
+        response = self.client.post("/status/batch", json={webAPI.UIDS_FIELD: [
+            "done", "copy", "running", "lost", "unknown", "done"]})
+
+        self.assertEqual(webAPI.OK, response.status_code)
+        self.assertIsNotNone(response.retry_after)
+        statuses = response.get_json()[webAPI.STATUSES_FIELD]
+        self.assertEqual(["done", "copy", "running", "lost", "unknown"], list(statuses))
+        for uid in ("done", "copy"):
+            self.assertEqual((webAPI.DONE, {"slide1": "first", "slide2": "second"}),
+                             (statuses[uid][webAPI.STATUS_FIELD], statuses[uid][webAPI.EXPLANATION_FIELD]))
+        self.assertEqual((webAPI.PROCESSING, {"slide1": "first"}), (statuses["running"][webAPI.STATUS_FIELD],
+                                                                    statuses["running"][webAPI.EXPLANATION_FIELD]))
+        self.assertIn(webAPI.NO_EXPLANATION_FILE, statuses["lost"][webAPI.ERROR_FIELD])
+        self.assertEqual({webAPI.NOT_FOUND_FIELD: webAPI.UID_NOT_FOUND}, statuses["unknown"])
+        self.assertEqual(1, len([statement for statement in output_queries if " IN " in statement]))
+
+    def test_status_batch_rejects_invalid_uids(self):
+        for payload in ({}, {webAPI.UIDS_FIELD: []}, {webAPI.UIDS_FIELD: "uid"}, {webAPI.UIDS_FIELD: [1]}):
+            self.assertEqual(webAPI.ERROR, self.client.post("/status/batch", json=payload).status_code)
+        with mock.patch.object(webAPI, 'MAX_BATCH_UIDS', 1):
+            response = self.client.post("/status/batch", json={webAPI.UIDS_FIELD: ["a", "b"]})
+        self.assertEqual((webAPI.ERROR, webAPI.TOO_MANY_UIDS),
+                         (response.status_code, response.get_json()[webAPI.ERROR_FIELD]))
+
+
+class ServedWebAPITestCase(WebAPITestCase):
+    def setUp(self):
+        """
+        This method serves the web API on a free local port, for the python client.
+        :return:
+        """
+        super().setUp()
+        self.server = make_server("127.0.0.1", 0, webAPI.webAPI, threaded=True)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.python_client = PythonClient(f"http://127.0.0.1:{self.server.server_port}")
+
+    def tearDown(self):
+        self.python_client.close()
+        self.server.shutdown()
+        super().tearDown()
+
+
+class ClientBatchTest(ServedWebAPITestCase):
+    def test_upload_many_and_status_many(self):
+        """
+        The files are sent in several batches, a rejected file gets no uid and is listed in the error message, and
+        the status of every uid is answered, None for an unknown one.
+        """
+        file_paths = []
+        for name, content in (("a.pptx", build_presentation(1)), ("broken.pptx", b"not a zip"),
+                              ("b.pptx", build_presentation(2))):
+            file_paths.append(os.path.join(self.folder, name))
+            with open(file_paths[-1], "wb") as file:
+                file.write(content)
+
+        uids = self.python_client.upload_many(file_paths, email="user@example.com", batch_size=2, priority=3)
+
+        self.assertEqual(file_paths, list(uids))
+        self.assertIsNone(uids[file_paths[1]])
+        self.assertIn(f"{file_paths[1]}: {webAPI.NOT_A_PRESENTATION}", self.python_client.error_message)
+        statuses = self.python_client.status_many([uids[file_paths[0]], uids[file_paths[2]], "unknown"])
+        self.assertEqual([webAPI.PENDING, webAPI.PENDING, None],
+                         [status and status.status for status in statuses.values()])
+        self.assertEqual([1, 2], [statuses[uids[path]].slides_total for path in (file_paths[0], file_paths[2])])
+        self.assertEqual({uids[file_paths[0]]: 3, uids[file_paths[2]]: 3}, self.priorities())
+
+    def test_upload_with_a_priority(self):
+        file_path = os.path.join(self.folder, "deck.pptx")
+        with open(file_path, "wb") as file:
+            file.write(build_presentation(1))
+        uid = self.python_client.upload(file_path, None, priority=-2)
+        self.assertEqual({uid: -2}, self.priorities())
+        with self.assertRaises(Exception):
+            self.python_client.upload(file_path, None, priority=webAPI.MAX_PRIORITY + 1)
+
+
+class WaitTest(ServedWebAPITestCase):
+    """
+    This class waits on uploads without the progress listener, the waits check the database every RECHECK_INTERVAL
+    seconds instead, and the changes of the uploads are made from a timer thread while the request waits.
+    """
+    RECHECK_INTERVAL = 0.05
+
+    def setUp(self):
+        super().setUp()
+        for patch in (mock.patch.object(webAPI, 'get_progress_listener', return_value=None),
+                      mock.patch.object(webAPI, 'PROGRESS_RECHECK_INTERVAL', self.RECHECK_INTERVAL),
+                      mock.patch.object(webAPI, 'KEEP_ALIVE_INTERVAL', self.RECHECK_INTERVAL)):
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.add_upload("running", webAPI.PROCESSING, slides={"slide1": "first"})
+
+    def later(self, delay, change, *args):
+        timer = threading.Timer(delay, change, args)
+        timer.start()
+        self.addCleanup(timer.join)
+
+    def add_slide(self, uid, number, explanation):
+        with Session(self.engine) as session:
+            upload = session.query(Upload).filter_by(uid=uid).one()
+            session.add(SlideExplanation(upload.id, number, explanation))
+            session.commit()
+
+    def finish(self, uid, explanations):
+        with Session(self.engine) as session:
+            upload = session.query(Upload).filter_by(uid=uid).one()
+            webAPI.OUTPUT_STORE.save(session, upload, explanations)
+            upload.status = webAPI.DONE
+            upload.slide_explanations.clear()
+            session.commit()
+
+    def wait(self, uid, **params):
+        """
+        :return: the answer of the long-poll end-point and the seconds it took (Tuple)
+        """
+        start = time.monotonic()
+        response = self.client.get(f"/status/{uid}/wait", query_string=params)
+        return response, time.monotonic() - start
+
+    def events(self, uid):
+        """
+        :return: the name and the data of every server-sent event of the upload, until the stream ends (List)
+        """
+        response = self.client.get(f"/status/{uid}/events")
+        self.assertEqual(webAPI.EVENT_STREAM_MIMETYPE, response.mimetype)
+        events = []
+        for block in response.get_data(as_text=True).split("\n\n"):
+            lines = dict(line.split(": ", 1) for line in block.splitlines() if not line.startswith(":"))
+            if lines:
+                events.append((lines["event"], json.loads(lines["data"])))
+        return events
+
+    def test_wait_answers_once_the_timeout_passed(self):
+        response, seconds = self.wait("running", timeout=0.3, status=webAPI.PROCESSING, slides_done=1)
+        self.assertEqual((webAPI.OK, webAPI.PROCESSING, 1), (response.status_code, response.get_json()[
+            webAPI.STATUS_FIELD], response.get_json()[webAPI.SLIDES_DONE_FIELD]))
+        self.assertGreaterEqual(seconds, 0.3)
+
+    def test_wait_answers_as_soon_as_the_upload_changes(self):
+        self.later(0.2, self.add_slide, "running", 2, "second")
+        response, seconds = self.wait("running", timeout=10)
+        self.assertEqual((webAPI.OK, 2), (response.status_code, response.get_json()[webAPI.SLIDES_DONE_FIELD]))
+        self.assertLess(seconds, 5)
+
+        response, seconds = self.wait("running", timeout=10, status=webAPI.PROCESSING, slides_done=1)
+        self.assertEqual(2, response.get_json()[webAPI.SLIDES_DONE_FIELD])
+        self.assertLess(seconds, 1)
+
+    def test_unknown_uid_is_not_found(self):
+        self.assertEqual(webAPI.NOT_FOUND, self.wait("unknown", timeout=10)[0].status_code)
+        self.assertEqual(webAPI.NOT_FOUND, self.client.get("/status/unknown/events").status_code)
+        self.assertIsNone(self.python_client.wait_for("unknown", timeout=10))
+
+    def test_events_follow_the_upload_until_it_is_done(self):
+        self.later(0.3, self.finish, "running", {"slide1": "first", "slide2": "second"})
+        progress = {webAPI.STATUS_FIELD: webAPI.PROCESSING, webAPI.SLIDES_DONE_FIELD: 1,
+                    webAPI.SLIDES_TOTAL_FIELD: None}
+        done = dict(progress, **{webAPI.STATUS_FIELD: webAPI.DONE, webAPI.SLIDES_DONE_FIELD: 2})
+        self.assertEqual([
+            (webAPI.SLIDE_EVENT, {webAPI.SLIDE_FIELD: "slide1", webAPI.EXPLANATION_FIELD: "first"}),
+            (webAPI.STATUS_EVENT, progress),
+            (webAPI.SLIDE_EVENT, {webAPI.SLIDE_FIELD: "slide2", webAPI.EXPLANATION_FIELD: "second"}),
+            (webAPI.STATUS_EVENT, done),
+            (webAPI.DONE_EVENT, done)], self.events("running"))
+
+    def test_events_of_a_done_upload_without_its_output_end_with_an_error(self):
+        self.add_upload("lost", webAPI.DONE)
+        events = self.events("lost")
+        self.assertEqual([webAPI.ERROR_EVENT], [name for name, _ in events])
+        self.assertIn(webAPI.NO_EXPLANATION_FILE, events[0][1][webAPI.ERROR_FIELD])
+
+    def test_client_waits_until_the_upload_is_done(self):
+        self.later(0.2, self.add_slide, "running", 2, "second")
+        self.later(0.6, self.finish, "running", {"slide1": "first", "slide2": "second"})
+        progress = []
+        status = self.python_client.wait_for("running", timeout=10, poll_timeout=5, on_progress=progress.append)
+
+        self.assertEqual((webAPI.DONE, {"slide1": "first", "slide2": "second"}), (status.status, status.explanation))
+        self.assertTrue(progress)
+        self.assertTrue(all(update.status == webAPI.PROCESSING for update in progress))
+
+    def test_client_wait_returns_the_latest_status_after_the_timeout(self):
+        status = self.python_client.wait_for("running", timeout=0.3, poll_timeout=5)
+        self.assertEqual((webAPI.PROCESSING, 1), (status.status, status.slides_done))
+
+
+class DoneStatusTest(WebAPITestCase):
+    EXPLANATIONS = {"slide1": "first", "slide2": "second \u00e9"}
+
+    def get_status(self, uid, encoding, etag=None):
+        headers = {"Accept-Encoding": encoding}
+        if etag:
+            headers["If-None-Match"] = etag
+        return self.client.get(f"/status/{uid}", headers=headers)
+
+    def stored_output(self, uid, compressed=False):
+        """
+        :return: the explanations of the upload as the output store holds them (Bytes)
+        """
+        with Session(self.engine) as session:
+            upload = session.query(Upload).filter_by(uid=uid).one()
+            if compressed:
+                return webAPI.OUTPUT_STORE.read_compressed(session, upload)
+            return webAPI.OUTPUT_STORE.read(session, upload)
+
+    def assertBodyHoldsOutput(self, uid):
+        """
+        The gzip body is a sequence of gzip members around the stored member, sent as is, and decompresses to the
+        same json object as the plain body, whose explanations are the stored json object.
+        """
+        gzip_response = self.get_status(uid, webAPI.GZIP_ENCODING)
+        plain_response = self.get_status(uid, "identity")
+        self.assertEqual((webAPI.GZIP_ENCODING, None), (gzip_response.content_encoding,
+                                                        plain_response.content_encoding))
+        self.assertIn(self.stored_output(uid, compressed=True), gzip_response.data)
+        status = json.loads(gzip.decompress(gzip_response.data))
+        self.assertEqual(json.loads(plain_response.data), status)
+        self.assertEqual((webAPI.DONE, json.loads(self.stored_output(uid)), len(self.EXPLANATIONS)),
+                         (status[webAPI.STATUS_FIELD], status[webAPI.EXPLANATION_FIELD],
+                          status[webAPI.SLIDES_DONE_FIELD]))
+        self.assertEqual(self.EXPLANATIONS, status[webAPI.EXPLANATION_FIELD])
+
+    def test_done_status_holds_the_stored_output_in_every_encoding(self):
+        self.add_upload("done", webAPI.DONE, slides=self.EXPLANATIONS)
+        self.assertBodyHoldsOutput("done")
+
+    def test_unchanged_status_is_not_modified_in_every_encoding(self):
+        self.add_upload("done", webAPI.DONE, slides=self.EXPLANATIONS)
+        etags = set()
+        for encoding in (webAPI.GZIP_ENCODING, "identity"):
+            response = self.get_status("done", encoding)
+            self.assertEqual(webAPI.OK, response.status_code)
+            self.assertIn("Accept-Encoding", response.vary)
+            etag = response.headers["ETag"]
+            etags.add(etag)
+            not_modified = self.get_status("done", encoding, etag)
+            self.assertEqual((304, b"", etag), (not_modified.status_code, not_modified.data,
+                                                not_modified.headers["ETag"]))
+        self.assertEqual(2, len(etags))
+
+    def test_output_saved_as_a_file_is_served_from_the_fallback(self):
+        """
+        An upload done before the database store, whose output is only a json file of the outputs folder, is served
+        from the file in every encoding.
+        """
+        self.add_upload("old", webAPI.DONE)
+        os.makedirs(webAPI.OUTPUT_FOLDER)
+        with open(os.path.join(webAPI.OUTPUT_FOLDER, "old.json"), "w") as file:
+            json.dump(self.EXPLANATIONS, file, indent=4)
+        self.assertBodyHoldsOutput("old")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,435 @@
+import asyncio
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from unittest import mock
+import openai
+from pptx import Presentation
+from sqlalchemy import select, update
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+import pptxApp
+from explanation_cache import ExplanationCache
+from fake_completion_server import FakeCompletionServer, build_completion
+from handle_db import Base, Upload, SlideExplanation, create_database_engine, claim_upload, database_now
+from presentation_context import SYSTEM_PROMPT, CONTENT_FIELD
+from slide_batcher import BATCH_INSTRUCTIONS
+from slide_text_extractor import extract_texts
+
+TITLE_AND_CONTENT_LAYOUT = 1
+SLIDES = 8
+LATENCY = 0.2
+LEASE_SECONDS = 60
+WAIT_TIMEOUT = 10
+
+
+def save_deck(path, bodies):
+    """
+    This method saves a deck with a slide for every body text, titled with the number of the slide.
+    :param: path: path of the deck. (String)
+    :param: bodies: the body text of every slide. (List of strings)
+    :return:
+    """
+    prs = Presentation()
+    for number, body in enumerate(bodies, start=1):
+        slide = prs.slides.add_slide(prs.slide_layouts[TITLE_AND_CONTENT_LAYOUT])
+        slide.shapes.title.text = f"Slide {number}"
+        slide.placeholders[1].text = body
+    prs.save(path)
+
+
+class WorkerTestCase(unittest.IsolatedAsyncioTestCase):
+    """
+    This class runs the explainer in the test process, in a temporary folder with a database of its own, against a
+    fake completion server, with a single pending upload of a deck of SLIDES slides, every one long enough to be
+    explained by a request of its own.
+    """
+    latency = LATENCY
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.working_folder = os.getcwd()
+        os.chdir(self.folder)
+        os.makedirs(pptxApp.UPLOADS_FOLDER)
+        self.engine = create_database_engine(f"sqlite:///{os.path.join(self.folder, 'worker.db')}")
+        Base.metadata.create_all(self.engine)
+        self.server = FakeCompletionServer(latency=self.latency).start()
+
+        patches = [mock.patch.object(pptxApp, 'engine', self.engine),
+                   mock.patch.object(pptxApp, 'EXPLANATION_CACHE', ExplanationCache(
+                       self.engine, pptxApp.ENGINE_MODEL, SYSTEM_PROMPT, max_entries=0)),
+                   mock.patch.object(pptxApp, 'EXTRACTION_PROCESSES', 0),
+                   mock.patch.object(openai, 'api_base', self.server.api_base),
+                   mock.patch.object(openai, 'api_key', 'test')]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+        with Session(self.engine) as session:
+            upload = Upload("deck.pptx", pptxApp.PENDING_STATUS, "deck")
+            session.add(upload)
+            session.commit()
+            self.upload_id = upload.id
+        save_deck(f"{pptxApp.UPLOADS_FOLDER}/deck.pptx",
+                  [" ".join(f"point{number}_{word}" for word in range(80)) for number in range(1, SLIDES + 1)])
+
+    def tearDown(self):
+        self.server.stop()
+        self.engine.dispose()
+        os.chdir(self.working_folder)
+        shutil.rmtree(self.folder)
+
+    def claim(self, owner, now=None):
+        with Session(self.engine) as session:
+            claimed = claim_upload(session, self.upload_id, owner, LEASE_SECONDS, now)
+            session.commit()
+        return claimed
+
+    def checkpoints(self):
+        """
+        :return: the explanation of every slide saved so far, keyed by slide number. (Dictionary)
+        """
+        with Session(self.engine) as session:
+            return dict(session.execute(select(SlideExplanation.slide_number, SlideExplanation.explanation).filter_by(
+                upload_id=self.upload_id)).all())
+
+    def output(self):
+        """
+        :return: the saved explanations of the upload. (Dictionary)
+        """
+        with Session(self.engine) as session:
+            return json.loads(pptxApp.OUTPUT_STORE.read(session, session.get(Upload, self.upload_id)))
+
+    async def wait_for_checkpoints(self, count):
+        deadline = time.monotonic() + WAIT_TIMEOUT
+        while len(self.checkpoints()) < count:
+            self.assertLess(time.monotonic(), deadline)
+            await asyncio.sleep(0.02)
+
+
+class ParsePresentationTestCase(unittest.IsolatedAsyncioTestCase):
+    """
+    This class parses decks in a temporary folder, without a database or an explanation cache, and with the model
+    requests answered by a stub of send_request, which records their messages.
+    """
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.deck_path = os.path.join(self.folder, "deck.pptx")
+        self.requests = []
+        patches = [mock.patch.object(pptxApp, 'EXPLANATION_CACHE', ExplanationCache(
+                       None, pptxApp.ENGINE_MODEL, SYSTEM_PROMPT, max_entries=0)),
+                   mock.patch.object(pptxApp, 'EXTRACTION_PROCESSES', 0),
+                   mock.patch.object(pptxApp, 'send_request', self.send_request)]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    async def send_request(self, messages, usage=None):
+        self.requests.append(messages)
+        if BATCH_INSTRUCTIONS in messages[0][CONTENT_FIELD]:
+            return self.answer_batch(messages)
+        return self.answer_slide(messages)
+
+    def answer_batch(self, messages):
+        return build_completion({"messages": messages})["choices"][0]["message"]["content"]
+
+    def answer_slide(self, messages):
+        return f"Explanation of: {messages[-1][CONTENT_FIELD]}"
+
+
+class BatchFallbackTest(ParsePresentationTestCase):
+    async def explain_short_slides(self):
+        """
+        :return: the explanations of a deck of three short slides, explained by a single batch when it works (List)
+        """
+        save_deck(self.deck_path, ["a short slide"] * 3)
+        explanations = await pptxApp.parse_presentation(self.deck_path)
+        for number, explanation in enumerate(explanations, start=1):
+            self.assertIn(f"Slide {number}", explanation)
+        return explanations
+
+    async def test_short_slides_are_explained_by_a_single_request(self):
+        await self.explain_short_slides()
+        self.assertEqual(1, len(self.requests))
+
+    async def test_slides_are_explained_one_by_one_when_the_batch_answer_can_not_be_split(self):
+        with mock.patch.object(self, 'answer_batch', return_value="Sure! Slide 1 is about..."):
+            await self.explain_short_slides()
+        self.assertEqual(1 + 3, len(self.requests))
+
+    async def test_slides_are_explained_one_by_one_when_the_batch_request_fails(self):
+        errors_before = pptxApp.ERRORS.get(stage=pptxApp.BATCH_ERROR)
+        with mock.patch.object(self, 'answer_batch', side_effect=openai.error.APIError("Injected failure")):
+            await self.explain_short_slides()
+        self.assertEqual(1 + 3, len(self.requests))
+        self.assertEqual(1, pptxApp.ERRORS.get(stage=pptxApp.BATCH_ERROR) - errors_before)
+
+
+class SlideConcurrencyTest(ParsePresentationTestCase):
+    """
+    Every slide is long enough for a request of its own, and the later slides are answered sooner, so the requests
+    finish out of order.
+    """
+    async def send_request(self, messages, usage=None):
+        text = messages[-1][CONTENT_FIELD]
+        number = int(re.search(r"Slide (\d+)", text).group(1))
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep((SLIDES - number) * 0.02)
+            if "fails" in text:
+                raise openai.error.APIError("Injected failure")
+            return f"Explanation of slide {number}"
+        finally:
+            self.in_flight -= 1
+
+    async def test_slides_come_back_in_order_and_a_failed_slide_does_not_stop_the_others(self):
+        self.in_flight = self.max_in_flight = 0
+        bodies = [" ".join(f"point{number}_{word}" for word in range(80)) for number in range(1, SLIDES + 1)]
+        bodies[2] += " fails"
+        save_deck(self.deck_path, bodies)
+
+        explanations = await pptxApp.parse_presentation(self.deck_path, concurrency=3)
+
+        self.assertEqual(3, self.max_in_flight)
+        self.assertTrue(explanations[2].startswith(f"{pptxApp.ERROR_MESSAGE} {pptxApp.PROCESS_SLIDE_ERROR}"))
+        self.assertEqual([f"Explanation of slide {number}" for number in range(1, SLIDES + 1) if number != 3],
+                         explanations[:2] + explanations[3:])
+
+
+def exit_process(*args):
+    """
+    This method stands for the extraction in a process of the pool, and kills the process instead.
+    :return:
+    """
+    os._exit(1)
+
+
+class ExtractionPoolTest(unittest.IsolatedAsyncioTestCase):
+    """
+    This class extracts decks in a real process pool of a single process, started with the configured start method.
+    """
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.deck_path = os.path.join(self.folder, "deck.pptx")
+        save_deck(self.deck_path, ["first body", "second body"])
+        patches = [mock.patch.object(pptxApp, 'EXTRACTION_PROCESSES', 1),
+                   mock.patch.object(pptxApp, 'extraction_executor', None)]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.addCleanup(pptxApp.shutdown_extraction_executor)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    async def test_deck_is_extracted_in_a_process_of_the_pool(self):
+        slide_texts = await pptxApp.extract_texts_in_pool(self.deck_path)
+
+        self.assertEqual(extract_texts(self.deck_path, pptxApp.EXTRACTION_ENGINE), slide_texts)
+        executor = pptxApp.extraction_executor
+        self.assertIsInstance(executor, ProcessPoolExecutor)
+        self.assertEqual(pptxApp.EXTRACTION_START_METHOD, executor._mp_context.get_start_method())
+        self.assertIs(executor, pptxApp.get_extraction_executor())
+
+    async def test_broken_pool_is_replaced_for_the_next_deck(self):
+        with mock.patch.object(pptxApp, 'extract_texts_timed', exit_process):
+            broken_executor = pptxApp.get_extraction_executor()
+            with self.assertRaises(BrokenProcessPool):
+                await pptxApp.extract_texts_in_pool(self.deck_path)
+        self.assertIsNone(pptxApp.extraction_executor)
+
+        slide_texts = await pptxApp.extract_texts_in_pool(self.deck_path)
+
+        self.assertEqual(2, len(slide_texts))
+        self.assertIsNot(broken_executor, pptxApp.extraction_executor)
+
+
+class LeaseRaceTest(WorkerTestCase):
+    async def test_explainer_that_lost_its_lease_stops_and_the_new_owner_finishes(self):
+        """
+        Another explainer claims the upload while the first one is explaining it: the first one writes no more slides
+        and is cancelled once it renews its leases, and the second one finishes the upload from the slides saved so
+        far, without failing on the slides the first one saved.
+        """
+        with mock.patch.object(pptxApp, 'WORKER_ID', 'a'), mock.patch.object(pptxApp, 'LEASE_RENEW_INTERVAL', 0.05):
+            self.assertTrue(self.claim('a'))
+            task = asyncio.create_task(pptxApp.process_upload(self.upload_id))
+            leased_uploads = {self.upload_id: task}
+            renewal = asyncio.create_task(pptxApp.renew_leases_periodically(leased_uploads))
+            await self.wait_for_checkpoints(1)
+            with Session(self.engine) as session:
+                expired = database_now(session) + timedelta(seconds=LEASE_SECONDS + 1)
+            self.assertTrue(self.claim('b', expired))
+
+            with self.assertRaises(asyncio.CancelledError):
+                await asyncio.wait_for(task, WAIT_TIMEOUT)
+            renewal.cancel()
+            self.assertEqual({}, leased_uploads)
+            saved_by_a = self.checkpoints()
+            pptxApp.SlideProgress(self.upload_id, "deck").slide_done(SLIDES, "late explanation")
+            self.assertEqual(saved_by_a, self.checkpoints())
+
+        with mock.patch.object(pptxApp, 'WORKER_ID', 'b'):
+            pptxApp.SlideProgress(self.upload_id, "deck").slide_done(min(saved_by_a), "saved again")
+            await pptxApp.process_upload(self.upload_id)
+
+        with Session(self.engine) as session:
+            upload = session.get(Upload, self.upload_id)
+            self.assertEqual((pptxApp.DONE_STATUS, None, 0), (upload.status, upload.lease_owner, upload.slides_failed))
+        output = self.output()
+        self.assertEqual(SLIDES, len(output))
+        self.assertFalse(any(explanation.startswith(pptxApp.ERROR_MESSAGE) for explanation in output.values()))
+        self.assertEqual({}, self.checkpoints())
+
+
+class FailedUploadTest(WorkerTestCase):
+    def set_upload(self, **values):
+        with Session(self.engine) as session:
+            session.execute(update(Upload).where(Upload.id == self.upload_id).values(**values))
+            session.commit()
+
+    def upload_state(self):
+        with Session(self.engine) as session:
+            upload = session.get(Upload, self.upload_id)
+            return upload.status, upload.attempts, upload.lease_owner
+
+    async def test_upload_that_keeps_failing_ends_failed(self):
+        """
+        A file the explainer can not read is queued again after every failed attempt, and failed for good after the
+        last one, then it is never claimed again.
+        """
+        with open(f"{pptxApp.UPLOADS_FOLDER}/deck.pptx", "wb") as file:
+            file.write(b"not a presentation")
+        with mock.patch.object(pptxApp, 'WORKER_ID', 'a'):
+            for attempt in range(1, pptxApp.MAX_UPLOAD_ATTEMPTS + 1):
+                self.assertEqual([self.upload_id], pptxApp.claim_pending_uploads(1))
+                await pptxApp.process_upload(self.upload_id)
+                status = pptxApp.FAILED_STATUS if attempt == pptxApp.MAX_UPLOAD_ATTEMPTS else pptxApp.PENDING_STATUS
+                self.assertEqual((status, attempt, None), self.upload_state())
+            self.assertEqual([], pptxApp.claim_pending_uploads(1))
+
+    def test_abandoned_and_interrupted_uploads_are_retried_a_bounded_number_of_times(self):
+        """
+        An upload whose explainer stopped is claimed again until it was attempted MAX_UPLOAD_ATTEMPTS times, then it
+        fails, whether its lease expired or it is found without a lease when the explainer starts.
+        """
+        attempts = pptxApp.MAX_UPLOAD_ATTEMPTS
+        self.set_upload(status=pptxApp.PROCESSING_STATUS, lease_owner='gone', attempts=attempts,
+                        lease_expires=datetime(2000, 1, 1))
+        self.assertEqual([], pptxApp.claim_pending_uploads(1))
+        self.assertEqual((pptxApp.FAILED_STATUS, attempts, None), self.upload_state())
+
+        self.set_upload(status=pptxApp.PROCESSING_STATUS, lease_owner=None, attempts=attempts - 1)
+        self.assertEqual(1, pptxApp.recover_interrupted_uploads())
+        self.assertEqual((pptxApp.PENDING_STATUS, attempts - 1, None), self.upload_state())
+
+        self.set_upload(status=pptxApp.PROCESSING_STATUS, attempts=attempts)
+        self.assertEqual(0, pptxApp.recover_interrupted_uploads())
+        self.assertEqual((pptxApp.FAILED_STATUS, attempts, None), self.upload_state())
+
+
+class CacheFailureTest(WorkerTestCase):
+    async def test_upload_is_explained_when_the_cache_fails(self):
+        """
+        The explanation cache failing on its lookup of the deck and on every write is counted as a cache error, and
+        the slides are explained as if they were not cached.
+        """
+        error = OperationalError("SELECT", None, Exception("database is locked"))
+        cache = ExplanationCache(self.engine, pptxApp.ENGINE_MODEL, SYSTEM_PROMPT, max_entries=10)
+        errors_before = pptxApp.ERRORS.get(stage=pptxApp.CACHE_ERROR)
+        with mock.patch.object(pptxApp, 'EXPLANATION_CACHE', cache), mock.patch.object(pptxApp, 'WORKER_ID', 'a'), \
+                mock.patch.object(cache, 'get_many', side_effect=error), \
+                mock.patch.object(cache, 'put_many', side_effect=error):
+            self.assertTrue(self.claim('a'))
+            await pptxApp.process_upload(self.upload_id)
+
+        with Session(self.engine) as session:
+            self.assertEqual(pptxApp.DONE_STATUS, session.get(Upload, self.upload_id).status)
+        output = self.output()
+        self.assertEqual(SLIDES, len(output))
+        self.assertFalse(any(explanation.startswith(pptxApp.ERROR_MESSAGE) for explanation in output.values()))
+        self.assertEqual(1 + SLIDES, pptxApp.ERRORS.get(stage=pptxApp.CACHE_ERROR) - errors_before)
+
+
+class SaveFailureTest(WorkerTestCase):
+    async def test_upload_whose_output_is_not_saved_is_queued_again_with_its_slides(self):
+        """
+        An error saving the output fails the attempt: the upload is queued again instead of done, and keeps the
+        explanations of its slides and its file, so the next attempt resumes from them.
+        """
+        error = OperationalError("INSERT", None, Exception("disk I/O error"))
+        with mock.patch.object(pptxApp, 'WORKER_ID', 'a'), \
+                mock.patch.object(pptxApp.OUTPUT_STORE, 'save', side_effect=error):
+            self.assertTrue(self.claim('a'))
+            await pptxApp.process_upload(self.upload_id)
+
+        with Session(self.engine) as session:
+            upload = session.get(Upload, self.upload_id)
+            self.assertEqual((pptxApp.PENDING_STATUS, 1, None), (upload.status, upload.attempts, upload.lease_owner))
+        self.assertEqual(SLIDES, len(self.checkpoints()))
+        self.assertTrue(os.path.exists(f"{pptxApp.UPLOADS_FOLDER}/deck.pptx"))
+
+
+class ResumeTest(WorkerTestCase):
+    async def test_interrupted_upload_resumes_from_its_first_unexplained_slide(self):
+        """
+        An upload interrupted after its file was moved to the processed folder gets its file back, only the slides
+        without a saved explanation are sent to the model, and a slide saved as an error is explained again.
+        """
+        saved = {1: "saved 1", 2: "saved 2", 3: "saved 3"}
+        with Session(self.engine) as session:
+            for slide_number, explanation in saved.items():
+                session.add(SlideExplanation(self.upload_id, slide_number, explanation))
+            session.add(SlideExplanation(self.upload_id, 4, f"{pptxApp.ERROR_MESSAGE} timeout"))
+            session.commit()
+        os.makedirs(pptxApp.PROCESSED_FOLDER)
+        shutil.move(f"{pptxApp.UPLOADS_FOLDER}/deck.pptx", f"{pptxApp.PROCESSED_FOLDER}/deck.pptx")
+
+        with mock.patch.object(pptxApp, 'WORKER_ID', 'a'):
+            self.assertTrue(self.claim('a'))
+            await pptxApp.process_upload(self.upload_id)
+
+        with Session(self.engine) as session:
+            self.assertEqual(pptxApp.DONE_STATUS, session.get(Upload, self.upload_id).status)
+        self.assertEqual(SLIDES - len(saved), self.server.requests)
+        output = self.output()
+        self.assertEqual(saved, {number: output[f"slide{number}"] for number in saved})
+        for number in range(len(saved) + 1, SLIDES + 1):
+            self.assertIn(f"point{number}_0", output[f"slide{number}"])
+        self.assertTrue(os.path.exists(f"{pptxApp.PROCESSED_FOLDER}/deck.pptx"))
+        self.assertEqual({}, self.checkpoints())
+
+
+class ClaimWindowTest(WorkerTestCase):
+    def test_every_user_gets_a_window_of_its_first_uploads(self):
+        """
+        A user with a long queue does not hide the newer uploads of the other users, and an upload of a higher
+        priority is in the window of its user however new it is.
+        """
+        with Session(self.engine) as session:
+            heavy = [Upload(f"heavy{number}.pptx", pptxApp.PENDING_STATUS, f"heavy{number}", user_id=1)
+                     for number in range(5)]
+            heavy[-1].priority = 5
+            light = Upload("light.pptx", pptxApp.PENDING_STATUS, "light", user_id=2)
+            session.add_all(heavy + [light])
+            session.commit()
+            expected = {self.upload_id, heavy[0].id, heavy[-1].id, light.id}
+
+        with mock.patch.object(pptxApp, 'SCHEDULER_USER_WINDOW', 2), mock.patch.object(pptxApp, 'WORKER_ID', 'a'):
+            self.assertEqual(expected, set(pptxApp.claim_pending_uploads(10)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,305 @@
+import asyncio
+import os
+import random
+import time
+import aiohttp
+from PythonClient import status_from_json, upload_params, BASE_URL, UID_FIELD, UIDS_FIELD, FILE_FIELD, \
+    STATUSES_FIELD, STATUS_FIELD, NOT_FOUND_FIELD, NOT_FOUND, STATUS_BATCH_SIZE, READ_BINARY_MODE
+from rate_limiter import parse_retry_after
+
+MAX_CONNECTIONS = 100
+INITIAL_DELAY = 1
+MAX_DELAY = 60
+BACKOFF_FACTOR = 2
+NOT_MODIFIED = 304
+TOO_MANY_REQUESTS = 429
+SERVICE_UNAVAILABLE = 503
+RETRYABLE_STATUS_CODES = (TOO_MANY_REQUESTS, SERVICE_UNAVAILABLE)
+RETRY_AFTER_HEADER = 'Retry-After'
+ETAG_HEADER = 'ETag'
+IF_NONE_MATCH_HEADER = 'If-None-Match'
+
+
+class Backoff:
+    """
+    This class computes the delays between the polls of a status, they grow exponentially from initial_delay up to
+    max_delay, and each one is drawn at random between half and all of its value, so many clients that started
+    together do not poll the server in lockstep. A delay suggested by the server is a lower bound, even above
+    max_delay, the client never polls sooner than asked to.
+    """
+    def __init__(self, initial_delay=INITIAL_DELAY, max_delay=MAX_DELAY, factor=BACKOFF_FACTOR):
+        """
+        :param: initial_delay: the delay before the first retry, in seconds (Float)
+        :param: max_delay: the longest delay, in seconds (Float)
+        :param: factor: the growth of the delay after every retry (Float)
+        """
+        self._initial_delay = initial_delay
+        self._max_delay = max_delay
+        self._factor = factor
+        self._attempt = 0
+
+    def next_delay(self, suggested_delay=None):
+        """
+        :param: suggested_delay: the delay the server asked for, None if it did not (Float)
+        :return: the number of seconds to wait before the next poll (Float)
+        """
+        delay = min(self._max_delay, self._initial_delay * self._factor ** self._attempt)
+        self._attempt += 1
+        delay = random.uniform(delay / 2, delay)
+        if suggested_delay is not None:
+            delay = max(delay, suggested_delay)
+        return delay
+
+    def reset(self):
+        """
+        This method starts the delays over from initial_delay, once the polled status made progress.
+        :return:
+        """
+        self._attempt = 0
+
+
+class AsyncPythonClient:
+    """
+    This class is the asyncio version of PythonClient, it returns the same Status objects. All the requests go through
+    a single aiohttp session with a pool of at most max_connections connections, so thousands of uploads can be
+    tracked from a single event loop, without a thread per upload.
+    wait_for_completion polls the status of an upload with exponential backoff and jitter, and never sooner than the
+    Retry-After header of the web API asks for. wait_for_many tracks many uploads at once through the /status/batch
+    end-point, so every round of polling costs a single request per STATUS_BATCH_SIZE uploads that are not done.
+    """
+    def __init__(self, base_url=BASE_URL, max_connections=MAX_CONNECTIONS, initial_delay=INITIAL_DELAY,
+                 max_delay=MAX_DELAY):
+        """
+        :param: base_url: the url of the web API (String)
+        :param: max_connections: maximum number of concurrent connections to the web API (Integer)
+        :param: initial_delay: the delay before the first poll of a status that is not done, in seconds (Float)
+        :param: max_delay: the longest delay between two polls, in seconds (Float)
+        """
+        self.base_url = base_url
+        self._max_connections = max_connections
+        self._initial_delay = initial_delay
+        self._max_delay = max_delay
+        self._session = None
+        self._error_message = ""
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    @property
+    def session(self):
+        """
+        :return: the aiohttp session of the client, created on first use inside the running event loop
+        (ClientSession)
+        """
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self._max_connections))
+        return self._session
+
+    async def close(self):
+        """
+        This method closes the pooled connections of the client.
+        :return:
+        """
+        if self._session is not None:
+            await self._session.close()
+
+    @property
+    def error_message(self):
+        """
+        Getter for the instance variable
+        :return: returns an error message (String)
+        """
+        return self._error_message
+
+    def backoff(self):
+        """
+        :return: the delays of a new wait (Backoff)
+        """
+        return Backoff(self._initial_delay, self._max_delay)
+
+    async def upload(self, file_path, email=None, priority=None):
+        """
+        The upload method uploads a power-point presentation like PythonClient.upload, the file is read in the
+        default executor.
+        :param: file_path: path of the power-point presentation (String)
+        :param: email: email of the user could be None or could be a String.
+        :param: priority: optional priority of the upload, higher is processed first (Integer)
+        :return: UID created by web API (String)
+        """
+        content = await asyncio.get_running_loop().run_in_executor(None, read_file, file_path)
+        form = aiohttp.FormData()
+        form.add_field(FILE_FIELD, content, filename=os.path.basename(file_path))
+        async with self.session.post(self.base_url + '/upload', data=form,
+                                     params=upload_params(email, priority)) as response:
+            if response.ok:
+                return (await response.json())[UID_FIELD]
+            raise Exception(f"Upload failed. Status code: {response.status}")
+
+    async def status(self, uid):
+        """
+        The status method retrieves the status of a file by its UID.
+        :param: uid: UID of the file
+        :return: Status object, or None if the UID was not found.
+        """
+        polled = await self._poll(uid)
+        return polled[0] if polled else None
+
+    async def _poll(self, uid, known_status=None, etag=None):
+        """
+        This method retrieves the status of a file once, as a conditional request when the entity tag of the known
+        status is given. Rate limited and unavailable responses are not errors, they are answered with the known
+        status and the delay the server asked for.
+        :param: uid: UID of the file
+        :param: known_status: the latest status received, returned again if the status did not change (Status)
+        :param: etag: the entity tag of the known status (String)
+        :return: the Status object, its entity tag and the delay suggested by the server, or None if the UID was not
+        found (Tuple)
+        """
+        headers = {IF_NONE_MATCH_HEADER: etag} if etag else None
+        async with self.session.get(self.base_url + f'/status/{uid}', headers=headers) as response:
+            retry_after = parse_retry_after(response.headers.get(RETRY_AFTER_HEADER))
+            if response.status == NOT_MODIFIED:
+                return known_status, etag, retry_after
+            if response.status in RETRYABLE_STATUS_CODES:
+                return known_status, etag, retry_after
+            if response.status == NOT_FOUND:
+                self._error_message = (await response.json())[NOT_FOUND_FIELD]
+                return None
+            if not response.ok:
+                raise Exception(f"Status retrieval failed. Status code: {response.status}")
+            return status_from_json(await response.json()), response.headers.get(ETAG_HEADER), retry_after
+
+    async def wait_for_completion(self, uid, timeout=None, on_progress=None):
+        """
+        The wait_for_completion method polls the status of a file until it is done or failed. The delay between two
+        polls grows exponentially with jitter, starts over whenever more slides are explained, and is never shorter
+        than the Retry-After header of the response. Every poll is a conditional request, so an unchanged status costs
+        an empty 304 response.
+        :param: uid: UID of the file
+        :param: timeout: maximum number of seconds to wait, None to wait until the file is done (optional)
+        :param: on_progress: function called with every new Status received before the file is done (optional)
+        :return: the latest Status object, which is done or failed unless the timeout passed, or None if the UID was
+        not found.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        backoff = self.backoff()
+        status, etag = None, None
+        while True:
+            previous_status = status
+            polled = await self._poll(uid, status, etag)
+            if polled is None:
+                return None
+            status, etag, retry_after = polled
+            if status is not None and status.is_final():
+                return status
+            if status is not None and status != previous_status:
+                if previous_status is not None and status.slides_done > previous_status.slides_done:
+                    backoff.reset()
+                if on_progress is not None:
+                    on_progress(status)
+
+            delay = backoff.next_delay(retry_after)
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return status
+                delay = min(delay, remaining)
+            await asyncio.sleep(delay)
+
+    async def status_many(self, uids):
+        """
+        The status_many method retrieves the status of many files by their UIDs through the /status/batch end-point,
+        STATUS_BATCH_SIZE UIDs per request, all the requests sent concurrently.
+        :param: uids: UIDs of the files (List)
+        :return: the Status object of every UID, or None if the UID was not found (Dictionary)
+        """
+        statuses, _ = await self._poll_many(list(dict.fromkeys(uids)))
+        return statuses
+
+    async def _poll_many(self, uids):
+        """
+        This method retrieves the status of many files once through the /status/batch end-point.
+        :param: uids: distinct UIDs of the files (List)
+        :return: the Status object of every UID that was answered, None if it was not found, and the longest delay
+        suggested by the server (Tuple)
+        """
+        batches = [uids[start:start + STATUS_BATCH_SIZE] for start in range(0, len(uids), STATUS_BATCH_SIZE)]
+        results = await asyncio.gather(*(self._poll_batch(batch) for batch in batches))
+        statuses = {}
+        retry_after = None
+        for batch_statuses, batch_retry_after in results:
+            statuses.update(batch_statuses)
+            if batch_retry_after is not None:
+                retry_after = max(retry_after or 0, batch_retry_after)
+        return statuses, retry_after
+
+    async def _poll_batch(self, uids):
+        """
+        This method retrieves the status of a single batch of UIDs, a rate limited or unavailable response answers
+        none of them.
+        :param: uids: UIDs of the files (List)
+        :return: the Status object of every UID answered, None if it was not found, and the delay suggested by the
+        server (Tuple)
+        """
+        async with self.session.post(self.base_url + '/status/batch', json={UIDS_FIELD: uids}) as response:
+            retry_after = parse_retry_after(response.headers.get(RETRY_AFTER_HEADER))
+            if response.status in RETRYABLE_STATUS_CODES:
+                return {}, retry_after
+            if not response.ok:
+                raise Exception(f"Batch status retrieval failed. Status code: {response.status}")
+            statuses = (await response.json())[STATUSES_FIELD]
+        return {uid: status_from_json(status_data) if STATUS_FIELD in status_data else None
+                for uid, status_data in statuses.items()}, retry_after
+
+    async def wait_for_many(self, uids, timeout=None, on_progress=None):
+        """
+        The wait_for_many method waits until all the given files are done or failed. Every round polls only the files
+        that are still pending or processing, through the /status/batch end-point, and the rounds are spaced with the
+        same backoff as wait_for_completion, honoring the longest Retry-After of the round.
+        :param: uids: UIDs of the files (List)
+        :param: timeout: maximum number of seconds to wait, None to wait until all the files are done (optional)
+        :param: on_progress: function called with the UID and the Status of every file that made progress (optional)
+        :return: the latest Status object of every UID, or None if the UID was not found (Dictionary)
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        backoff = self.backoff()
+        statuses = {}
+        waiting = list(dict.fromkeys(uids))
+        while waiting:
+            polled_statuses, retry_after = await self._poll_many(waiting)
+            progressed = False
+            for uid, status in polled_statuses.items():
+                previous_status = statuses.get(uid)
+                statuses[uid] = status
+                if status is not None and status != previous_status and not status.is_final():
+                    progressed = progressed or (previous_status is not None and
+                                                status.slides_done > previous_status.slides_done)
+                    if on_progress is not None:
+                        on_progress(uid, status)
+            waiting = [uid for uid in waiting
+                       if uid not in polled_statuses or (statuses[uid] is not None and not statuses[uid].is_final())]
+            if not waiting:
+                break
+            if progressed:
+                backoff.reset()
+
+            delay = backoff.next_delay(retry_after)
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                delay = min(delay, remaining)
+            await asyncio.sleep(delay)
+        return {uid: statuses.get(uid) for uid in dict.fromkeys(uids)}
+
+
+def read_file(file_path):
+    """
+    :param: file_path: path of a file (String)
+    :return: the content of the file (Bytes)
+    """
+    with open(file_path, READ_BINARY_MODE) as file:
+        return file.read()
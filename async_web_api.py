@@ -0,0 +1,289 @@
+import asyncio
+import hashlib
+import os
+import uuid
+from aiohttp import web
+from sqlalchemy import event, make_url, select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import Session
+from werkzeug.http import parse_accept_header, parse_etags, quote_etag
+from handle_db import User, Upload, DATABASE_URL, DATABASE_ECHO, create_database_engine, set_sqlite_pragmas, \
+    upsert_user, prepare_database
+from job_notifier import notify_new_upload
+from slide_text_extractor import read_slide_count
+from webAPI import build_status_body, add_upload, read_priority, UPLOAD_FOLDER, MAX_UPLOAD_SIZE, MAX_SLIDES, \
+    MULTIPART_OVERHEAD, ERROR, NOT_FOUND, PAYLOAD_TOO_LARGE, UNPROCESSABLE, OK, INTERNAL_ERROR, PENDING, DONE, \
+    FINAL_STATUSES, NO_FILE_ATTACHED, EMPTY_FILENAME, NOT_A_PRESENTATION, FILE_TOO_LARGE, SLIDE_COUNT_OUT_OF_RANGE, \
+    PRESENTATION_EXTENSION, ERROR_FIELD, EMAIL_FIELD, FILE_FIELD, UID_FIELD, FILENAME_FIELD, NOT_FOUND_FIELD, \
+    WRITE_BINARY_MODE, UPLOAD_CHUNK_SIZE, UID_NOT_FOUND, EMAIL_FILENAME_NOT_FOUND, JSON_MIMETYPE, \
+    ACCEPT_ENCODING_HEADER, STATUS_RETRY_AFTER, PRIORITY_FIELD, INVALID_PRIORITY
+from output_store import GZIP_ENCODING
+
+ASYNC_DATABASE_URL = os.environ.get('ASYNC_DATABASE_URL', DATABASE_URL.replace("sqlite://", "sqlite+aiosqlite://", 1))
+WEB_API_HOST = os.environ.get('WEB_API_HOST', '127.0.0.1')
+WEB_API_PORT = int(os.environ.get('WEB_API_PORT', 5000))
+NOT_MODIFIED = 304
+IF_NONE_MATCH_HEADER = 'If-None-Match'
+ETAG_HEADER = 'ETag'
+VARY_HEADER = 'Vary'
+CONTENT_ENCODING_HEADER = 'Content-Encoding'
+RETRY_AFTER_HEADER = 'Retry-After'
+ASYNC_WEB_API_STARTED = "Async web API listening on"
+
+
+class UploadTooLarge(Exception):
+    """
+    Raised while an upload is saved, as soon as it is larger than MAX_UPLOAD_SIZE.
+    """
+
+
+def create_async_database_engine(url=ASYNC_DATABASE_URL, echo=DATABASE_ECHO):
+    """
+    This method creates the async engine of the database, through the aiosqlite driver for sqlite, its connections
+    are tuned like the ones of the synchronous engine.
+    :param: url: url of the database, with an async driver (String)
+    :param: echo: log every sql statement (Boolean)
+    :return: the async engine (AsyncEngine)
+    """
+    database_engine = create_async_engine(url, echo=echo)
+    if database_engine.dialect.name == "sqlite":
+        event.listen(database_engine.sync_engine, "connect", set_sqlite_pragmas)
+    return database_engine
+
+
+def create_sync_database_engine(url=ASYNC_DATABASE_URL, echo=DATABASE_ECHO):
+    """
+    This method creates a synchronous engine on the same database as the async engine, through the default driver of
+    its dialect, for the work run in executors, so both engines always read the same database.
+    :param: url: url of the database, with an async driver (String)
+    :param: echo: log every sql statement (Boolean)
+    :return: the engine (Engine)
+    """
+    url = make_url(url)
+    return create_database_engine(url.set(drivername=url.get_backend_name()), echo=echo)
+
+
+async_engine = create_async_database_engine()
+engine = create_sync_database_engine()
+
+
+def json_error(field, message, status):
+    """
+    :param: field: the field of the message, 'error' or 'not_found' (String)
+    :param: message: the message (String)
+    :param: status: the status code (Integer)
+    :return: a json response with a single field (Response)
+    """
+    return web.json_response({field: message}, status=status)
+
+
+async def save_and_hash_part(part, file_path, max_size=MAX_UPLOAD_SIZE):
+    """
+    This method writes an uploaded file to the destination chunk by chunk as it is received, and hashes the chunks
+    along the way. The writes run in the default executor, so the event loop never waits for the disk.
+    :param: part: the file part of the multipart request (BodyPartReader)
+    :param: file_path: the path the file is saved to (String)
+    :param: max_size: maximum size of the file, in bytes (Integer)
+    :return: sha256 hex digest of the file (String)
+    :raise: UploadTooLarge if the file is larger than max_size, the file is removed
+    """
+    loop = asyncio.get_running_loop()
+    digest = hashlib.sha256()
+    size = 0
+    destination = await loop.run_in_executor(None, open, file_path, WRITE_BINARY_MODE)
+    try:
+        while True:
+            chunk = await part.read_chunk(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_size:
+                break
+            digest.update(chunk)
+            await loop.run_in_executor(None, destination.write, chunk)
+    finally:
+        await loop.run_in_executor(None, destination.close)
+    if size > max_size:
+        await loop.run_in_executor(None, os.remove, file_path)
+        raise UploadTooLarge()
+    return digest.hexdigest()
+
+
+async def find_file_part(request):
+    """
+    :param: request: a multipart request (Request)
+    :return: the part of the 'file' field, or None if there is none (BodyPartReader)
+    """
+    reader = await request.multipart()
+    while True:
+        part = await reader.next()
+        if part is None or part.name == FILE_FIELD:
+            return part
+
+
+async def upload_file(request):
+    """
+    This end-point is the async version of the '/upload' route of the web API, with the same parameters, checks and
+    responses. The file is streamed to the disk without blocking the event loop, and the user and the upload are
+    committed through the async engine. The saved file of an identical file already processed is removed in the
+    default executor once the upload is committed.
+    :param: request: the upload request (Request)
+    :return: UID as a json response (code: 200), or error with the error message as a json response
+    """
+    email = request.query.get(EMAIL_FIELD)
+    priority = read_priority(request.query.get(PRIORITY_FIELD))
+    if priority is None:
+        return json_error(ERROR_FIELD, INVALID_PRIORITY, ERROR)
+    loop = asyncio.get_running_loop()
+    try:
+        part = await find_file_part(request)
+        if part is None:
+            return json_error(ERROR_FIELD, NO_FILE_ATTACHED, ERROR)
+        if not part.filename:
+            return json_error(ERROR_FIELD, EMPTY_FILENAME, ERROR)
+        if os.path.splitext(part.filename)[1].lower() != PRESENTATION_EXTENSION:
+            return json_error(ERROR_FIELD, NOT_A_PRESENTATION, ERROR)
+
+        await loop.run_in_executor(None, lambda: os.makedirs(UPLOAD_FOLDER, exist_ok=True))
+        uid = str(uuid.uuid4())
+        new_filename = f"{uid}{PRESENTATION_EXTENSION}"
+        upload_path = os.path.join(UPLOAD_FOLDER, new_filename)
+        digest = await save_and_hash_part(part, upload_path)
+
+        slides_total = await loop.run_in_executor(None, read_slide_count, upload_path)
+        if slides_total is None or not 0 < slides_total <= MAX_SLIDES:
+            await loop.run_in_executor(None, os.remove, upload_path)
+            if slides_total is None:
+                return json_error(ERROR_FIELD, NOT_A_PRESENTATION, ERROR)
+            return json_error(ERROR_FIELD, SLIDE_COUNT_OUT_OF_RANGE, UNPROCESSABLE)
+
+        async with AsyncSession(async_engine) as session:
+            user_id = await session.run_sync(upsert_user, email) if email else None
+            upload = await session.run_sync(add_upload, user_id, (uid, digest, slides_total), priority, False)
+            queued = upload.status == PENDING
+            await session.commit()
+
+        if queued:
+            notify_new_upload(uid)
+        else:
+            await loop.run_in_executor(None, os.remove, upload_path)
+        return web.json_response({UID_FIELD: uid}, status=OK)
+    except UploadTooLarge:
+        return json_error(ERROR_FIELD, FILE_TOO_LARGE, PAYLOAD_TOO_LARGE)
+    except Exception as e:
+        return json_error(ERROR_FIELD, str(e), INTERNAL_ERROR)
+
+
+def build_done_status_body(upload_id, accepted_encoding):
+    """
+    This method builds the status body of a done upload with build_status_body in a session of the synchronous engine
+    on the same database, to be run in an executor, as reading the stored output may block on the json files of the
+    file store.
+    :param: upload_id: id of a done upload (Integer)
+    :param: accepted_encoding: 'gzip' if the client accepts gzip, None otherwise (String)
+    :return: the body, its entity tag and its content encoding, None if it is not encoded (Tuple)
+    """
+    with Session(engine) as session:
+        return build_status_body(session, session.get(Upload, upload_id), accepted_encoding)
+
+
+async def status_response(request, session, file):
+    """
+    This method answers a status request with the same body, entity tag and content encoding as the web API. The body
+    of a done upload is built in the default executor, as it reads the stored output, the body of any other upload
+    is built by build_status_body on the synchronous view of the async session, as it only reads the database. Gzip
+    is only sent if the Accept-Encoding header gives it a quality above 0. An upload that is neither done nor failed
+    carries the same Retry-After header as in the web API.
+    :param: request: the status request (Request)
+    :param: session: the session of the file (AsyncSession)
+    :param: file: Upload object that has all the metadata of a file.
+    :return: the json response, or an empty 304 if the request already holds that version (Response)
+    """
+    accepts_gzip = parse_accept_header(request.headers.get(ACCEPT_ENCODING_HEADER))[GZIP_ENCODING] > 0
+    accepted_encoding = GZIP_ENCODING if accepts_gzip else None
+    if file.status == DONE:
+        body, etag, content_encoding = await asyncio.get_running_loop().run_in_executor(
+            None, build_done_status_body, file.id, accepted_encoding)
+    else:
+        body, etag, content_encoding = await session.run_sync(build_status_body, file, accepted_encoding)
+    headers = {ETAG_HEADER: quote_etag(etag), VARY_HEADER: ACCEPT_ENCODING_HEADER}
+    if file.status not in FINAL_STATUSES:
+        headers[RETRY_AFTER_HEADER] = str(STATUS_RETRY_AFTER)
+    if parse_etags(request.headers.get(IF_NONE_MATCH_HEADER)).contains(etag):
+        return web.Response(status=NOT_MODIFIED, headers=headers)
+    if content_encoding:
+        headers[CONTENT_ENCODING_HEADER] = content_encoding
+    return web.Response(body=body, status=OK, content_type=JSON_MIMETYPE, headers=headers)
+
+
+async def get_status_by_email_and_filename(request):
+    """
+    This end-point is the async version of the '/status' route of the web API, it finds the latest upload of a file
+    name by the email of its user.
+    :param: request: the status request (Request)
+    :return: json object of the metadata of the file, or a json object with status code 404
+    """
+    email = request.query.get(EMAIL_FIELD)
+    file_name = request.query.get(FILENAME_FIELD)
+    try:
+        async with AsyncSession(async_engine) as session:
+            file = await session.scalar(select(Upload).join(User).filter(
+                User.email == email, Upload.file_name == file_name, User.id == Upload.user_id).order_by(
+                Upload.upload_time.desc()).limit(1))
+            if file:
+                return await status_response(request, session, file)
+
+            return json_error(NOT_FOUND_FIELD, EMAIL_FILENAME_NOT_FOUND, NOT_FOUND)
+
+    except Exception as e:
+        return json_error(ERROR_FIELD, str(e), INTERNAL_ERROR)
+
+
+async def get_status_by_uid(request):
+    """
+    This end-point is the async version of the '/status/<uid>' route of the web API.
+    :param: request: the status request (Request)
+    :return: json object of the metadata of the file, or a json object with status code 404
+    """
+    uid = request.match_info[UID_FIELD]
+    try:
+        async with AsyncSession(async_engine) as session:
+            file = await session.scalar(select(Upload).filter_by(uid=uid).limit(1))
+            if file:
+                return await status_response(request, session, file)
+
+            return json_error(NOT_FOUND_FIELD, UID_NOT_FOUND, NOT_FOUND)
+
+    except Exception as e:
+        return json_error(ERROR_FIELD, str(e), INTERNAL_ERROR)
+
+
+async def dispose_engine(app):
+    """
+    This method closes the connections of the engines when the server stops.
+    :param: app: the application (Application)
+    :return:
+    """
+    await async_engine.dispose()
+    engine.dispose()
+
+
+def create_app():
+    """
+    This method creates the async web API application.
+    :return: the application (Application)
+    """
+    app = web.Application(client_max_size=MAX_UPLOAD_SIZE + MULTIPART_OVERHEAD)
+    app.add_routes([
+        web.post('/upload', upload_file),
+        web.get('/status', get_status_by_email_and_filename),
+        web.get('/status/{uid}', get_status_by_uid),
+    ])
+    app.on_cleanup.append(dispose_engine)
+    return app
+
+
+if __name__ == "__main__":
+    prepare_database(engine)
+    print(f"{ASYNC_WEB_API_STARTED} http://{WEB_API_HOST}:{WEB_API_PORT}")
+    web.run_app(create_app(), host=WEB_API_HOST, port=WEB_API_PORT, print=None)
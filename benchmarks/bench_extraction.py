@@ -0,0 +1,85 @@
+import argparse
+import glob
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from slide_text_extractor import extract_texts, XML_EXTRACTION_ENGINE, PPTX_EXTRACTION_ENGINE
+
+DEFAULT_PATTERN = os.path.join('processed', '*.pptx')
+DEFAULT_REPEAT = 5
+ENGINES = (PPTX_EXTRACTION_ENGINE, XML_EXTRACTION_ENGINE)
+NO_FILES_FOUND = "No presentations found for"
+TEXT_MISMATCH = "The engines extracted different text from"
+
+
+def measure(presentation_path, extraction_engine, repeat):
+    """
+    This method extracts the text of a presentation several times with an engine, and measures the best time and the
+    peak of memory allocated during an extraction.
+    :param: presentation_path: path of a power-point presentation. (String)
+    :param: extraction_engine: 'xml' or 'pptx'. (String)
+    :param: repeat: number of timed extractions. (Integer)
+    :return: the text of the slides, the best time in seconds and the peak memory in bytes. (Tuple)
+    """
+    best_time = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        extract_texts(presentation_path, extraction_engine)
+        best_time = min(best_time, time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        slide_texts = extract_texts(presentation_path, extraction_engine)
+        peak_memory = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return slide_texts, best_time, peak_memory
+
+
+def main():
+    """
+    Compares the python-pptx extraction with the streaming xml extraction on a set of presentations, and checks that
+    both engines extract the same text.
+    :return:
+    """
+    parser = argparse.ArgumentParser(description="Benchmark the slide text extraction engines.")
+    parser.add_argument("files", nargs="*", help=f"presentations to extract, default {DEFAULT_PATTERN}")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="timed extractions per file and engine")
+    args = parser.parse_args()
+
+    files = args.files or sorted(glob.glob(DEFAULT_PATTERN))
+    if not files:
+        print(f"{NO_FILES_FOUND} {DEFAULT_PATTERN}")
+        return 1
+
+    print(f"{'file':<45} {'slides':>6} {'size KB':>8} " +
+          " ".join(f"{engine + ' ms':>9} {engine + ' peak KB':>13}" for engine in ENGINES))
+    totals = {engine: [0.0, 0] for engine in ENGINES}
+    mismatches = 0
+    for presentation_path in files:
+        results = {engine: measure(presentation_path, engine, args.repeat) for engine in ENGINES}
+        slide_texts = [results[engine][0] for engine in ENGINES]
+        if any(texts != slide_texts[0] for texts in slide_texts):
+            mismatches += 1
+            print(f"{TEXT_MISMATCH} {presentation_path}")
+
+        columns = []
+        for engine in ENGINES:
+            _, best_time, peak_memory = results[engine]
+            totals[engine][0] += best_time
+            totals[engine][1] = max(totals[engine][1], peak_memory)
+            columns.append(f"{best_time * 1000:>9.1f} {peak_memory / 1024:>13.0f}")
+        print(f"{os.path.basename(presentation_path):<45} {len(slide_texts[0]):>6} "
+              f"{os.path.getsize(presentation_path) / 1024:>8.0f} " + " ".join(columns))
+
+    print(f"{'total':<45} {'':>6} {'':>8} " +
+          " ".join(f"{totals[engine][0] * 1000:>9.1f} {totals[engine][1] / 1024:>13.0f}" for engine in ENGINES))
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
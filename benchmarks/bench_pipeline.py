@@ -0,0 +1,348 @@
+import argparse
+import itertools
+import os
+import random
+import resource
+import re
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+REPOSITORY_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPOSITORY_FOLDER)
+WORK_FOLDER = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(WORK_FOLDER, 'pipeline.db')}"
+
+from pptx import Presentation
+from sqlalchemy import select, func
+from handle_db import Upload, SlideExplanation, engine, prepare_database
+from fake_completion_server import FakeCompletionServer
+from PythonClient import PythonClient
+
+HOST = '127.0.0.1'
+DEFAULT_DECKS = 12
+DEFAULT_SLIDE_COUNTS = (5, 20, 60)
+DEFAULT_WORDS_PER_SLIDE = (30, 150)
+DEFAULT_TIMEOUT = 600
+POLL_INTERVAL = 0.05
+STARTUP_TIMEOUT = 30
+DONE = 'done'
+DECKS_FOLDER = 'decks'
+LOG_EXTENSION = '.log'
+WRITE_MODE = 'w'
+PROC_STATUS_PATH = "/proc/{pid}/status"
+PEAK_MEMORY_FIELD = "VmHWM:"
+WEB_API_SERVER = "import webAPI; webAPI.webAPI.run(host='{host}', port={port}, threaded=True)"
+VOCABULARY = ("algorithm", "complexity", "recursion", "graph", "vertex", "edge", "memory", "pointer", "thread",
+              "process", "cache", "latency", "network", "protocol", "database", "index", "query", "transaction",
+              "compiler", "parser", "token", "grammar", "function", "closure", "object", "interface", "module",
+              "test", "deployment", "container", "scheduler", "queue", "stack", "heap", "tree", "hash")
+SERVER_DID_NOT_START = "The server did not start listening on port"
+EXPLAINER_DID_NOT_START = "The explainer did not start listening on port"
+TIMED_OUT = "Timed out, decks done:"
+WORKER_METRICS_URL = "http://{host}:{port}/metrics"
+STAGE_SAMPLE = re.compile(r'^explainer_stage_seconds_(sum|count)\{stage="([^"]+)"\} (\S+)$', re.MULTILINE)
+
+
+def free_port(kind=socket.SOCK_STREAM):
+    """
+    :param: kind: SOCK_STREAM for a tcp port, SOCK_DGRAM for an udp port. (Integer)
+    :return: a port that is free right now. (Integer)
+    """
+    with socket.socket(socket.AF_INET, kind) as probe:
+        probe.bind((HOST, 0))
+        return probe.getsockname()[1]
+
+
+def make_deck(path, slides, words_per_slide, seed):
+    """
+    This method writes a synthetic presentation, every slide has a title and a body of random words, and the text of
+    every deck is unique, so neither the explanation cache nor the identical upload detection skip any work.
+    :param: path: where to save the presentation. (String)
+    :param: slides: number of slides. (Integer)
+    :param: words_per_slide: number of words in the body of every slide. (Integer)
+    :param: seed: seed of the random words. (Integer)
+    :return:
+    """
+    generator = random.Random(seed)
+    presentation = Presentation()
+    for number in range(1, slides + 1):
+        slide = presentation.slides.add_slide(presentation.slide_layouts[1])
+        slide.shapes.title.text = f"Deck {seed} slide {number}"
+        slide.placeholders[1].text = " ".join(generator.choice(VOCABULARY) for _ in range(words_per_slide))
+    presentation.save(path)
+
+
+def make_decks(decks, slide_counts, words_per_slide):
+    """
+    This method writes the synthetic decks of the run, cycling through every combination of slide count and words per
+    slide.
+    :param: decks: number of decks. (Integer)
+    :param: slide_counts: the slide counts to cycle through. (List of integers)
+    :param: words_per_slide: the words per slide to cycle through. (List of integers)
+    :return: the paths of the decks. (List of strings)
+    """
+    folder = os.path.join(WORK_FOLDER, DECKS_FOLDER)
+    os.makedirs(folder)
+    shapes = itertools.cycle(itertools.product(slide_counts, words_per_slide))
+    paths = []
+    for seed, (slides, words) in zip(range(decks), shapes):
+        path = os.path.join(folder, f"deck{seed}_{slides}x{words}.pptx")
+        make_deck(path, slides, words, seed)
+        paths.append(path)
+    return paths
+
+
+def start_process(name, arguments, environment):
+    """
+    This method starts a process of the pipeline in the work folder, with its output in a log file of its own.
+    :param: name: name of the process and of its log file. (String)
+    :param: arguments: the command of the process. (List)
+    :param: environment: the environment of the process. (Dictionary)
+    :return: the process. (Popen)
+    """
+    log = open(os.path.join(WORK_FOLDER, name + LOG_EXTENSION), WRITE_MODE)
+    return subprocess.Popen(arguments, cwd=WORK_FOLDER, env=environment, stdout=log, stderr=subprocess.STDOUT)
+
+
+def wait_until(is_ready, process, error):
+    """
+    This method waits until a condition holds, while the process is alive, for at most STARTUP_TIMEOUT seconds.
+    :param: is_ready: the condition. (Callable)
+    :param: process: the process being started. (Popen)
+    :param: error: the message of the error raised if the condition never holds. (String)
+    :return:
+    """
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline and process.poll() is None:
+        if is_ready():
+            return
+        time.sleep(0.1)
+    raise RuntimeError(error)
+
+
+def tcp_port_listening(port):
+    """
+    :return: True if a server accepts connections on the tcp port, false otherwise. (Boolean)
+    """
+    try:
+        socket.create_connection((HOST, port), timeout=1).close()
+        return True
+    except OSError:
+        return False
+
+
+def udp_port_bound(port):
+    """
+    :return: True if a process is bound to the udp port, false otherwise. (Boolean)
+    """
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as probe:
+        try:
+            probe.bind((HOST, port))
+            return False
+        except OSError:
+            return True
+
+
+def peak_memory(pid):
+    """
+    :param: pid: id of a running process. (Integer)
+    :return: the peak resident memory of the process in KB, or None where /proc is not available. (Integer)
+    """
+    try:
+        with open(PROC_STATUS_PATH.format(pid=pid)) as status:
+            for line in status:
+                if line.startswith(PEAK_MEMORY_FIELD):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+def collect(uids, timeout):
+    """
+    This method follows the uploads until all of them are done. The explanations of the slides are dropped once their
+    deck is done, so the finish time of every slide is read while its deck is still processed.
+    :param: uids: uids of the uploads. (List of strings)
+    :param: timeout: maximum number of seconds to wait. (Float)
+    :return: the finish time of every slide, keyed by upload id and slide number, and True if every upload is done.
+    (Tuple)
+    """
+    slide_finish_times = {}
+    deadline = time.monotonic() + timeout
+    while True:
+        with engine.connect() as connection:
+            for upload_id, slide_number, finish_time in connection.execute(select(
+                    SlideExplanation.upload_id, SlideExplanation.slide_number, SlideExplanation.finish_time)):
+                slide_finish_times.setdefault((upload_id, slide_number), finish_time)
+            done = connection.scalar(select(func.count()).select_from(Upload).where(
+                Upload.uid.in_(uids), Upload.status == DONE))
+        if done == len(uids):
+            return slide_finish_times, True
+        if time.monotonic() > deadline:
+            print(f"{TIMED_OUT} {done}/{len(uids)}")
+            return slide_finish_times, False
+        time.sleep(POLL_INTERVAL)
+
+
+def percentiles(values):
+    """
+    :param: values: measured values. (List of floats)
+    :return: the p50, p90, p99 and maximum of the values and their number, formatted. (String)
+    """
+    if not values:
+        return "no samples"
+    values = sorted(values)
+    pick = lambda share: values[min(len(values) - 1, int(len(values) * share))]
+    return (f"p50 {pick(0.5):8.3f}  p90 {pick(0.9):8.3f}  p99 {pick(0.99):8.3f}  max {values[-1]:8.3f}  "
+            f"({len(values)} samples)")
+
+
+def scrape_stage_seconds(port):
+    """
+    This method reads the stage durations from the metrics of the explainer.
+    :param: port: the metrics port of the explainer. (Integer)
+    :return: the total seconds and the count of every stage, keyed by stage, empty if the scrape failed. (Dictionary)
+    """
+    try:
+        with urllib.request.urlopen(WORKER_METRICS_URL.format(host=HOST, port=port), timeout=5) as response:
+            metrics = response.read().decode()
+    except OSError:
+        return {}
+    stages = {}
+    for kind, stage, value in STAGE_SAMPLE.findall(metrics):
+        stages.setdefault(stage, {})[kind] = float(value)
+    return stages
+
+
+def report(uids, slide_finish_times, server, processes, stages):
+    """
+    This method prints the throughput, the latencies and the memory of the run.
+    :param: uids: uids of the uploads. (List of strings)
+    :param: slide_finish_times: the finish time of every slide, keyed by upload id and slide number. (Dictionary)
+    :param: server: the fake completion server. (FakeCompletionServer)
+    :param: processes: the peak memory in KB of every process of the pipeline, keyed by name. (Dictionary)
+    :param: stages: the total seconds and the count of every stage of the explainer, keyed by stage. (Dictionary)
+    :return:
+    """
+    with engine.connect() as connection:
+        uploads = connection.execute(select(Upload.id, Upload.upload_time, Upload.start_time, Upload.finish_time,
+                                            Upload.slides_total, Upload.prompt_tokens, Upload.completion_tokens
+                                            ).where(Upload.uid.in_(uids), Upload.status == DONE)
+                                     ).all()
+    if not uploads:
+        return
+    start_times = {upload.id: upload.start_time for upload in uploads}
+    first_upload = min(upload.upload_time for upload in uploads)
+    last_finish = max(upload.finish_time for upload in uploads)
+    elapsed = (last_finish - first_upload).total_seconds()
+    slides = sum(upload.slides_total or 0 for upload in uploads)
+
+    print(f"decks done         {len(uploads)}/{len(uids)} ({slides} slides) in {elapsed:.1f} s")
+    print(f"throughput         {len(uploads) / elapsed * 60:.1f} uploads/min, {slides / elapsed:.1f} slides/s")
+    print(f"queue wait s       {percentiles([(u.start_time - u.upload_time).total_seconds() for u in uploads])}")
+    print(f"deck latency s     {percentiles([(u.finish_time - u.upload_time).total_seconds() for u in uploads])}")
+    slide_latencies = [(finish_time - start_times[upload_id]).total_seconds()
+                       for (upload_id, _), finish_time in slide_finish_times.items() if start_times.get(upload_id)]
+    print(f"slide latency s    {percentiles(slide_latencies)}")
+    print(f"model requests     {server.requests} sent, {server.rate_limited} rate limited, {server.errors} failed, "
+          f"{server.max_in_flight} in flight at most")
+    prompt_tokens = sum(upload.prompt_tokens or 0 for upload in uploads)
+    completion_tokens = sum(upload.completion_tokens or 0 for upload in uploads)
+    print(f"model tokens       {prompt_tokens} prompt, {completion_tokens} completion, "
+          f"{(prompt_tokens + completion_tokens) / max(1, slides):.0f} per slide")
+    for stage, samples in stages.items():
+        count = int(samples.get('count', 0))
+        mean = samples.get('sum', 0) / count if count else float("nan")
+        print(f"stage {stage:<16}{mean:>8.4f} s mean, {samples.get('sum', 0):>8.2f} s total ({count} samples)")
+    for name, peak in processes.items():
+        print(f"peak memory        {name}: {'n/a' if peak is None else f'{peak / 1024:.1f} MB'}")
+    print(f"peak memory        largest child: {resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024:.1f} MB")
+
+
+def main():
+    """
+    Runs the whole pipeline offline: a fake completion server with the given latency, errors and rate limit, the web
+    API and the explainer on a temporary database and folder, uploads synthetic decks through the client and reports
+    uploads/min, queue wait, deck and slide latency percentiles, the time spent in every stage of the explainer and peak
+    memory. The explainer is configured with its usual environment variables, for example WORKER_CONCURRENCY or
+    MAX_INFLIGHT_REQUESTS, and several explainer processes can share the queue. Only the first one receives the
+    upload notifications, the others scan the database every --scan-interval seconds.
+    :return:
+    """
+    parser = argparse.ArgumentParser(description="End-to-end throughput benchmark of the explainer pipeline.")
+    parser.add_argument("--decks", type=int, default=DEFAULT_DECKS, help="number of decks uploaded")
+    parser.add_argument("--slide-counts", type=int, nargs="+", default=list(DEFAULT_SLIDE_COUNTS))
+    parser.add_argument("--words-per-slide", type=int, nargs="+", default=list(DEFAULT_WORDS_PER_SLIDE))
+    parser.add_argument("--latency", type=float, default=0.2, help="mean model latency in seconds")
+    parser.add_argument("--latency-jitter", type=float, default=0.05, help="model latency standard deviation")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="probability of a 500 answer")
+    parser.add_argument("--rate-limit", type=float, default=None, help="model requests per second before 429s")
+    parser.add_argument("--rate-limit-probability", type=float, default=0.0, help="probability of a 429 answer")
+    parser.add_argument("--retry-after", type=float, default=1, help="Retry-After of the 429 answers in seconds")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT, help="seconds to wait for the decks")
+    parser.add_argument("--workers", type=int, default=1, help="number of explainer processes")
+    parser.add_argument("--scan-interval", type=float, default=1, help="seconds between the scans of the other "
+                                                                       "explainer processes")
+    parser.add_argument("--keep", action="store_true", help="keep the work folder with the logs and the database")
+    args = parser.parse_args()
+
+    prepare_database(engine)
+    deck_paths = make_decks(args.decks, args.slide_counts, args.words_per_slide)
+    server = FakeCompletionServer(HOST, 0, args.latency, args.latency_jitter, args.error_rate, args.rate_limit,
+                                  args.rate_limit_probability, args.retry_after).start()
+    web_port, notify_port, progress_port = free_port(), free_port(socket.SOCK_DGRAM), free_port(socket.SOCK_DGRAM)
+    metrics_ports = [free_port() for _ in range(max(1, args.workers))]
+    environment = dict(os.environ, OPENAI_API_BASE=server.api_base, API_KEY=os.environ.get('API_KEY', 'benchmark'),
+                       EXPLAINER_NOTIFY_PORT=str(notify_port), PROGRESS_NOTIFY_PORT=str(progress_port),
+                       PYTHONPATH=os.pathsep.join([REPOSITORY_FOLDER, os.environ.get('PYTHONPATH', '')]))
+
+    processes = {}
+    stages = {}
+    try:
+        processes["webAPI"] = start_process("webAPI", [sys.executable, "-c", WEB_API_SERVER.format(
+            host=HOST, port=web_port)], environment)
+        for number, metrics_port in enumerate(metrics_ports):
+            name = "pptxApp" if len(metrics_ports) == 1 else f"pptxApp{number + 1}"
+            worker_environment = dict(environment, WORKER_METRICS_PORT=str(metrics_port))
+            if number:
+                worker_environment['FALLBACK_SCAN_INTERVAL'] = str(args.scan_interval)
+            processes[name] = start_process(name, [sys.executable, os.path.join(
+                REPOSITORY_FOLDER, "pptxApp.py")], worker_environment)
+            if not number:
+                # the first explainer binds the notification port, before the others try to
+                wait_until(lambda: udp_port_bound(notify_port), processes[name],
+                           f"{EXPLAINER_DID_NOT_START} {notify_port}")
+        wait_until(lambda: tcp_port_listening(web_port), processes["webAPI"], f"{SERVER_DID_NOT_START} {web_port}")
+
+        client = PythonClient(f"http://{HOST}:{web_port}")
+        uids = [uid for uid in client.upload_many(deck_paths).values() if uid]
+        client.close()
+        slide_finish_times, _ = collect(uids, args.timeout)
+        peaks = {name: peak_memory(process.pid) for name, process in processes.items()}
+        for metrics_port in metrics_ports:
+            for stage, samples in scrape_stage_seconds(metrics_port).items():
+                for kind, value in samples.items():
+                    stages.setdefault(stage, {})[kind] = stages.get(stage, {}).get(kind, 0) + value
+    finally:
+        # interrupted rather than terminated, so the explainer shuts its extraction pool down on its way out
+        for process in processes.values():
+            process.send_signal(signal.SIGINT)
+            process.wait()
+        server.stop()
+
+    report(uids, slide_finish_times, server, peaks, stages)
+    engine.dispose()
+    if args.keep:
+        print(f"Work folder: {WORK_FOLDER}")
+    else:
+        shutil.rmtree(WORK_FOLDER)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+import argparse
+import heapq
+import os
+import random
+import sys
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from job_scheduler import schedule_uploads, FAIR_POLICY, FIFO_POLICY, SCHEDULER_AGING_SLIDES_PER_SECOND
+
+Job = namedtuple('Job', ['id', 'user_id', 'slides_total', 'priority', 'upload_time'])
+
+DEFAULT_WORKERS = 3
+DEFAULT_HEAVY_DECKS = 300
+DEFAULT_LIGHT_USERS = 20
+DEFAULT_LIGHT_DECKS = 3
+DEFAULT_ARRIVAL_WINDOW = 600
+DEFAULT_SECONDS_PER_SLIDE = 0.1
+DEFAULT_DECK_OVERHEAD = 0.5
+DEFAULT_SCAN_SIZE = 5000
+HEAVY_USER = 0
+HEAVY_SLIDES = (20, 400)
+LIGHT_SLIDES = (5, 60)
+START = datetime(2024, 1, 1)
+
+
+def make_workload(heavy_decks, light_users, light_decks, arrival_window, seed):
+    """
+    This method makes a skewed workload: one heavy user uploads all its decks, most of them long, at the start, and
+    every light user uploads a few short decks at random times during the arrival window.
+    :param: heavy_decks: number of decks of the heavy user. (Integer)
+    :param: light_users: number of light users. (Integer)
+    :param: light_decks: number of decks of every light user. (Integer)
+    :param: arrival_window: seconds during which the light users upload. (Float)
+    :param: seed: seed of the random generator. (Integer)
+    :return: the uploads, by upload time. (List of Jobs)
+    """
+    generator = random.Random(seed)
+    jobs = [Job(number, HEAVY_USER, generator.randint(*HEAVY_SLIDES), 0, START + timedelta(milliseconds=number))
+            for number in range(heavy_decks)]
+    for user_id in range(1, light_users + 1):
+        for _ in range(light_decks):
+            upload_time = START + timedelta(seconds=generator.uniform(0, arrival_window))
+            jobs.append(Job(len(jobs), user_id, generator.randint(*LIGHT_SLIDES), 0, upload_time))
+    return sorted(jobs, key=lambda job: job.upload_time)
+
+
+def simulate(jobs, workers, policy, aging_rate, seconds_per_slide, deck_overhead):
+    """
+    This method simulates the explainer on a clock of its own: whenever a worker is free and uploads are pending,
+    the scheduler chooses the next ones, and an upload takes the deck overhead plus a fixed time per slide.
+    :param: jobs: the uploads, by upload time. (List of Jobs)
+    :param: workers: number of uploads processed at the same time. (Integer)
+    :param: policy: the scheduler policy. (String)
+    :param: aging_rate: slides taken off the cost of an upload for every second of waiting. (Float)
+    :param: seconds_per_slide: processing time of a slide. (Float)
+    :param: deck_overhead: processing time of a deck on top of its slides. (Float)
+    :return: the seconds from upload to done of every upload, keyed by job. (Dictionary)
+    """
+    arrivals = list(reversed(jobs))
+    pending = {}
+    running = []
+    running_per_user = {}
+    time_to_done = {}
+    clock = START
+    while arrivals or pending or running:
+        next_times = [running[0][0]] if running else []
+        if arrivals:
+            next_times.append(arrivals[-1].upload_time)
+        clock = max(clock, min(next_times))
+
+        while running and running[0][0] <= clock:
+            finish_time, _, job = heapq.heappop(running)
+            running_per_user[job.user_id] -= 1
+            time_to_done[job] = (finish_time - job.upload_time).total_seconds()
+        while arrivals and arrivals[-1].upload_time <= clock:
+            job = arrivals.pop()
+            pending[job.id] = job
+
+        free_workers = workers - len(running)
+        if free_workers and pending:
+            for job_id in schedule_uploads(list(pending.values()), running_per_user, free_workers, now=clock,
+                                           policy=policy, aging_rate=aging_rate):
+                job = pending.pop(job_id)
+                duration = deck_overhead + job.slides_total * seconds_per_slide
+                heapq.heappush(running, (clock + timedelta(seconds=duration), job.id, job))
+                running_per_user[job.user_id] = running_per_user.get(job.user_id, 0) + 1
+    return time_to_done
+
+
+def percentile(values, fraction):
+    """
+    :return: the value at the given fraction of the sorted values. (Float)
+    """
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else float("nan")
+
+
+def report(name, time_to_done):
+    """
+    This method prints the p50 and p95 time to done of the light users, the heavy user and all the uploads.
+    :return:
+    """
+    groups = {
+        "light": [seconds for job, seconds in time_to_done.items() if job.user_id != HEAVY_USER],
+        "heavy": [seconds for job, seconds in time_to_done.items() if job.user_id == HEAVY_USER],
+        "all": list(time_to_done.values()),
+    }
+    columns = [f"{percentile(values, 0.5):>9.1f} {percentile(values, 0.95):>9.1f}" for values in groups.values()]
+    makespan = max(job.upload_time + timedelta(seconds=seconds) for job, seconds in time_to_done.items()) - START
+    print(f"{name:<22} {' '.join(columns)} {makespan.total_seconds():>10.1f}")
+
+
+def time_scheduling(scan_size, workers, seed):
+    """
+    This method measures a single claim of the fair policy over scan_size pending uploads of many users.
+    :return: the milliseconds of a call. (Float)
+    """
+    jobs = make_workload(scan_size // 2, scan_size // 10, 5, 3600, seed)
+    now = START + timedelta(hours=1)
+    repeats = 20
+    start = time.perf_counter()
+    for _ in range(repeats):
+        schedule_uploads(jobs, {HEAVY_USER: workers}, workers, now=now, policy=FAIR_POLICY)
+    return (time.perf_counter() - start) / repeats * 1000
+
+
+def main():
+    """
+    Simulates a skewed workload, one user dumping hundreds of long decks while many users upload a few short ones,
+    under the fifo and the fair policies of the scheduler, and prints the p50/p95 seconds from upload to done of the
+    light users, the heavy user and all the uploads, and the time the last upload was done.
+    :return:
+    """
+    parser = argparse.ArgumentParser(description="Simulate the scheduling of the upload queue.")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="uploads processed at the same time")
+    parser.add_argument("--heavy-decks", type=int, default=DEFAULT_HEAVY_DECKS, help="decks of the heavy user")
+    parser.add_argument("--light-users", type=int, default=DEFAULT_LIGHT_USERS, help="number of light users")
+    parser.add_argument("--light-decks", type=int, default=DEFAULT_LIGHT_DECKS, help="decks of every light user")
+    parser.add_argument("--arrival-window", type=float, default=DEFAULT_ARRIVAL_WINDOW,
+                        help="seconds during which the light users upload")
+    parser.add_argument("--seconds-per-slide", type=float, default=DEFAULT_SECONDS_PER_SLIDE)
+    parser.add_argument("--deck-overhead", type=float, default=DEFAULT_DECK_OVERHEAD)
+    parser.add_argument("--aging", type=float, default=SCHEDULER_AGING_SLIDES_PER_SECOND,
+                        help="slides taken off the cost of an upload for every second of waiting")
+    parser.add_argument("--scan-size", type=int, default=DEFAULT_SCAN_SIZE, help="pending uploads of a timed claim")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    jobs = make_workload(args.heavy_decks, args.light_users, args.light_decks, args.arrival_window, args.seed)
+    policies = {
+        FIFO_POLICY: (FIFO_POLICY, 0),
+        f"{FAIR_POLICY}, no aging": (FAIR_POLICY, 0),
+        f"{FAIR_POLICY}, aging {args.aging:g}": (FAIR_POLICY, args.aging),
+    }
+    print(f"{len(jobs)} uploads, {args.workers} workers, time to done in seconds")
+    print(f"{'policy':<22} {'light p50':>9} {'p95':>9} {'heavy p50':>9} {'p95':>9} {'all p50':>9} {'p95':>9} "
+          f"{'last done':>10}")
+    for name, (policy, aging_rate) in policies.items():
+        report(name, simulate(jobs, args.workers, policy, aging_rate, args.seconds_per_slide, args.deck_overhead))
+    print(f"one fair claim over {args.scan_size} pending uploads: "
+          f"{time_scheduling(args.scan_size, args.workers, args.seed):.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
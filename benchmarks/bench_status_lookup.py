@@ -0,0 +1,149 @@
+import argparse
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+DATABASE_FOLDER = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(DATABASE_FOLDER, 'bench.db')}"
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from handle_db import User, Upload, engine, prepare_database
+
+DEFAULT_ROWS = 1000000
+DEFAULT_USERS = 10000
+DEFAULT_LOOKUPS = 2000
+INSERT_CHUNK_SIZE = 50000
+PENDING_RATIO = 0.001
+PENDING = 'pending'
+DONE = 'done'
+FILE_EXTENSION = '.pptx'
+CLAIM_LIMIT = 3
+BENCHMARKED_INDEXES = ('ix_uploads_table_status_upload_time', 'ix_uploads_table_user_id_file_name_upload_time')
+
+
+def populate(rows, users):
+    """
+    This method fills the database with users and uploads, a small share of the uploads is pending and every user
+    uploads a few files several times.
+    :param: rows: number of uploads. (Integer)
+    :param: users: number of users. (Integer)
+    :return:
+    """
+    start_time = datetime.now() - timedelta(days=365)
+    with engine.begin() as connection:
+        connection.execute(User.__table__.insert(), [{"id": user_id, "email": f"user{user_id}@example.com"}
+                                                     for user_id in range(1, users + 1)])
+        for chunk_start in range(0, rows, INSERT_CHUNK_SIZE):
+            chunk = []
+            for row in range(chunk_start, min(rows, chunk_start + INSERT_CHUNK_SIZE)):
+                user_id = row % users + 1
+                chunk.append({
+                    "uid": str(uuid.UUID(int=row)),
+                    "file_name": f"deck{row // users % 20}{FILE_EXTENSION}",
+                    "upload_time": start_time + timedelta(seconds=row * 30),
+                    "status": PENDING if random.random() < PENDING_RATIO else DONE,
+                    "user_id": user_id,
+                })
+            connection.execute(Upload.__table__.insert(), chunk)
+    with engine.connect() as connection:
+        connection.execute(text("ANALYZE"))
+
+
+def time_lookups(label, lookup, arguments):
+    """
+    This method times a lookup for every argument and prints the latency percentiles.
+    :param: label: name of the lookup. (String)
+    :param: lookup: function running the lookup in a session. (Callable)
+    :param: arguments: arguments of the lookups. (List)
+    :return:
+    """
+    latencies = []
+    with Session(engine) as session:
+        for argument in arguments:
+            start = time.perf_counter()
+            lookup(session, argument)
+            latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    print(f"{label:<40} mean {statistics.mean(latencies):8.3f} ms   p50 {latencies[len(latencies) // 2]:8.3f} ms   "
+          f"p99 {latencies[int(len(latencies) * 0.99)]:8.3f} ms")
+
+
+def lookup_by_uid(session, uid):
+    """
+    The lookup of the '/status/<uid>' end-point.
+    """
+    return session.query(Upload).filter_by(uid=uid).first()
+
+
+def lookup_by_email_and_filename(session, email_and_file_name):
+    """
+    The lookup of the '/status?email=&filename=' end-point.
+    """
+    email, file_name = email_and_file_name
+    return session.query(Upload).join(User).filter(User.email == email, Upload.file_name == file_name,
+                                                   User.id == Upload.user_id).order_by(
+        Upload.upload_time.desc()).first()
+
+
+def lookup_pending(session, limit):
+    """
+    The lookup of the explainer for the oldest pending uploads.
+    """
+    return session.query(Upload).filter_by(status=PENDING).order_by(Upload.upload_time).limit(limit).all()
+
+
+def run_lookups(rows, users, lookups):
+    """
+    This method runs every lookup on random uploads.
+    :param: rows: number of uploads in the database. (Integer)
+    :param: users: number of users in the database. (Integer)
+    :param: lookups: number of timed lookups of each kind. (Integer)
+    :return:
+    """
+    uids = [str(uuid.UUID(int=random.randrange(rows))) for _ in range(lookups)]
+    files = [(f"user{random.randrange(users) + 1}@example.com", f"deck{random.randrange(20)}{FILE_EXTENSION}")
+             for _ in range(lookups)]
+    time_lookups("status by uid", lookup_by_uid, uids)
+    time_lookups("status by email and filename", lookup_by_email_and_filename, files)
+    time_lookups("oldest pending uploads", lookup_pending, [CLAIM_LIMIT] * lookups)
+
+
+def main():
+    """
+    Fills a temporary database with uploads and times the status lookups of the web API and the explainer, with the
+    indexes of the uploads table and then without them.
+    :return:
+    """
+    parser = argparse.ArgumentParser(description="Benchmark the status lookups on a large uploads table.")
+    parser.add_argument("--rows", type=int, default=DEFAULT_ROWS, help="number of uploads")
+    parser.add_argument("--users", type=int, default=DEFAULT_USERS, help="number of users")
+    parser.add_argument("--lookups", type=int, default=DEFAULT_LOOKUPS, help="timed lookups of each kind")
+    args = parser.parse_args()
+
+    prepare_database(engine)
+    start = time.perf_counter()
+    populate(args.rows, args.users)
+    print(f"Inserted {args.rows} uploads of {args.users} users in {time.perf_counter() - start:.1f} s")
+
+    print("With indexes:")
+    run_lookups(args.rows, args.users, args.lookups)
+
+    with engine.begin() as connection:
+        for index_name in BENCHMARKED_INDEXES:
+            connection.execute(text(f"DROP INDEX {index_name}"))
+    print("Without the (status, upload_time) and (user_id, file_name, upload_time) indexes:")
+    run_lookups(args.rows, args.users, max(1, args.lookups // 100))
+    engine.dispose()
+    shutil.rmtree(DATABASE_FOLDER)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+import argparse
+import asyncio
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+REPOSITORY_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPOSITORY_FOLDER)
+WORK_FOLDER = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(WORK_FOLDER, 'load.db')}"
+
+import aiohttp
+from pptx import Presentation
+from sqlalchemy.orm import Session
+from handle_db import Upload, engine, prepare_database
+from output_store import DatabaseOutputStore
+
+HOST = '127.0.0.1'
+FLASK_PORT = 5101
+ASYNC_PORT = 5102
+DEFAULT_DURATION = 10
+DEFAULT_CONCURRENCY = 50
+DEFAULT_SLIDES = 20
+EXPLANATION_SIZE = 1500
+STARTUP_TIMEOUT = 30
+PENDING = 'pending'
+DONE = 'done'
+STATUS_SCENARIO = 'status-done'
+PENDING_SCENARIO = 'status-pending'
+UPLOAD_SCENARIO = 'upload'
+SCENARIOS = (STATUS_SCENARIO, PENDING_SCENARIO, UPLOAD_SCENARIO)
+DECK_NAME = 'deck.pptx'
+FLASK_SERVER = ("import webAPI; webAPI.webAPI.run(host='{host}', port={port}, threaded=True)")
+SERVER_DID_NOT_START = "The server did not start listening on port"
+
+
+def seed(slides):
+    """
+    This method adds a finished upload with stored explanations and a pending upload to the temporary database, and
+    writes a presentation to upload.
+    :param: slides: number of slides of the presentation and of the explanations. (Integer)
+    :return: the uid of the finished upload, the uid of the pending upload and the path of the presentation. (Tuple)
+    """
+    done_uid, pending_uid = str(uuid.uuid4()), str(uuid.uuid4())
+    with Session(engine) as session:
+        done = Upload(file_name=f"{done_uid}.pptx", status=DONE, uid=done_uid, user_id=None)
+        done.slides_total = done.slides_done = slides
+        pending = Upload(file_name=f"{pending_uid}.pptx", status=PENDING, uid=pending_uid, user_id=None)
+        pending.slides_total = slides
+        session.add_all([done, pending])
+        session.flush()
+        DatabaseOutputStore().save(session, done, {f"slide {number}": "explanation " * (EXPLANATION_SIZE // 12)
+                                                   for number in range(1, slides + 1)})
+        session.commit()
+    engine.dispose()
+
+    presentation = Presentation()
+    for number in range(1, slides + 1):
+        slide = presentation.slides.add_slide(presentation.slide_layouts[1])
+        slide.shapes.title.text = f"Slide {number}"
+        slide.placeholders[1].text = f"Point {number}"
+    deck_path = os.path.join(WORK_FOLDER, DECK_NAME)
+    presentation.save(deck_path)
+    return done_uid, pending_uid, deck_path
+
+
+def start_server(arguments, port):
+    """
+    This method starts a server in the temporary folder, on the temporary database, and waits until it listens.
+    :param: arguments: the command of the server. (List)
+    :param: port: the port the server listens on. (Integer)
+    :return: the server process. (Popen)
+    """
+    environment = dict(os.environ, WEB_API_HOST=HOST, WEB_API_PORT=str(port),
+                       PYTHONPATH=os.pathsep.join([REPOSITORY_FOLDER, os.environ.get('PYTHONPATH', '')]))
+    process = subprocess.Popen(arguments, cwd=WORK_FOLDER, env=environment,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection((HOST, port), timeout=1).close()
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"{SERVER_DID_NOT_START} {port}")
+
+
+def make_request(session, base_url, scenario, done_uid, pending_uid, deck):
+    """
+    :param: session: the client session. (ClientSession)
+    :param: base_url: the url of the server. (String)
+    :param: scenario: the kind of request. (String)
+    :param: done_uid: uid of the finished upload. (String)
+    :param: pending_uid: uid of the pending upload. (String)
+    :param: deck: the content of the presentation to upload. (Bytes)
+    :return: the request to send. (Context manager)
+    """
+    if scenario == STATUS_SCENARIO:
+        return session.get(f"{base_url}/status/{done_uid}")
+    if scenario == PENDING_SCENARIO:
+        return session.get(f"{base_url}/status/{pending_uid}")
+    form = aiohttp.FormData()
+    form.add_field('file', deck, filename=DECK_NAME)
+    return session.post(f"{base_url}/upload", data=form)
+
+
+async def run_load(base_url, scenario, duration, concurrency, done_uid, pending_uid, deck):
+    """
+    This method sends requests from concurrent clients, each one sending its next request as soon as the previous one
+    is answered, for the given duration.
+    :param: base_url: the url of the server. (String)
+    :param: scenario: the kind of request. (String)
+    :param: duration: how long to send requests, in seconds. (Float)
+    :param: concurrency: number of concurrent clients. (Integer)
+    :param: done_uid: uid of the finished upload. (String)
+    :param: pending_uid: uid of the pending upload. (String)
+    :param: deck: the content of the presentation to upload. (Bytes)
+    :return: the latencies of the successful requests in milliseconds and the number of failed requests. (Tuple)
+    """
+    latencies = []
+    errors = 0
+    deadline = time.monotonic() + duration
+
+    async def client(session):
+        nonlocal errors
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            try:
+                async with make_request(session, base_url, scenario, done_uid, pending_uid, deck) as response:
+                    await response.read()
+                    if response.status != 200:
+                        errors += 1
+                        continue
+            except aiohttp.ClientError:
+                errors += 1
+                continue
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        await asyncio.gather(*(client(session) for _ in range(concurrency)))
+    return latencies, errors
+
+
+def report(server, scenario, latencies, errors, duration):
+    """
+    This method prints the throughput and latency percentiles of a run.
+    """
+    latencies.sort()
+    count = len(latencies)
+    p50 = latencies[count // 2] if count else float("nan")
+    p99 = latencies[min(count - 1, int(count * 0.99))] if count else float("nan")
+    print(f"{server:<7} {scenario:<15} {count:>8} {errors:>7} {count / duration:>10.1f} {p50:>9.2f} {p99:>9.2f}")
+
+
+def main():
+    """
+    Starts the Flask web API and the async web API side by side on a temporary database, and loads both with the same
+    concurrent clients, printing requests/sec and p50/p99 latency for every scenario.
+    :return:
+    """
+    parser = argparse.ArgumentParser(description="Load test the Flask web API against the async web API.")
+    parser.add_argument("--duration", type=float, default=DEFAULT_DURATION, help="seconds per server and scenario")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="concurrent clients")
+    parser.add_argument("--slides", type=int, default=DEFAULT_SLIDES, help="slides of the seeded presentation")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    args = parser.parse_args()
+
+    prepare_database(engine)
+    done_uid, pending_uid, deck_path = seed(args.slides)
+    with open(deck_path, 'rb') as file:
+        deck = file.read()
+
+    servers = {
+        "flask": (start_server([sys.executable, "-c", FLASK_SERVER.format(host=HOST, port=FLASK_PORT)], FLASK_PORT),
+                  FLASK_PORT),
+        "async": (start_server([sys.executable, os.path.join(REPOSITORY_FOLDER, "async_web_api.py")], ASYNC_PORT),
+                  ASYNC_PORT),
+    }
+    try:
+        print(f"{'server':<7} {'scenario':<15} {'requests':>8} {'errors':>7} {'req/s':>10} {'p50 ms':>9} {'p99 ms':>9}")
+        for scenario in args.scenarios:
+            for server, (_, port) in servers.items():
+                latencies, errors = asyncio.run(run_load(f"http://{HOST}:{port}", scenario, args.duration,
+                                                         args.concurrency, done_uid, pending_uid, deck))
+                report(server, scenario, latencies, errors, args.duration)
+    finally:
+        for process, _ in servers.values():
+            process.terminate()
+            process.wait()
+        shutil.rmtree(WORK_FOLDER)
+
+
+if __name__ == "__main__":
+    main()
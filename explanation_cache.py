@@ -0,0 +1,217 @@
+import hashlib
+import os
+import threading
+from datetime import datetime
+from sqlalchemy import delete, func, or_, select, update
+from sqlalchemy.orm import Session
+from handle_db import CachedExplanation, dialect_insert
+
+EXPLANATION_CACHE_MAX_ENTRIES = int(os.environ.get('EXPLANATION_CACHE_MAX_ENTRIES', 10000))
+# the entries are counted, and the least recently used ones evicted, once every that many additions, so the cache may
+# hold up to that many entries more than its maximum in between
+EXPLANATION_CACHE_EVICTION_INTERVAL = int(os.environ.get('EXPLANATION_CACHE_EVICTION_INTERVAL', 100))
+KEY_SEPARATOR = "\0"
+ENCODING = "utf-8"
+HITS_FIELD = 'hits'
+MISSES_FIELD = 'misses'
+EVICTIONS_FIELD = 'evictions'
+
+
+def normalize_text(text):
+    """
+    This method receives the text of a slide and normalizes it, so slides that only differ in letter case or in
+    white spaces share the same cache entry.
+    :param: text: text of a slide. (String)
+    :return: normalized text. (String)
+    """
+    return " ".join(text.split()).casefold()
+
+
+def hash_text(text):
+    """
+    This method returns the sha256 hex digest of a text.
+    :param: text: text to hash. (String)
+    :return: hex digest. (String)
+    """
+    return hashlib.sha256(text.encode(ENCODING)).hexdigest()
+
+
+def cache_key(slide_text, model, system_prompt):
+    """
+    This method builds the cache key of a slide out of the normalized slide text, the model and the system prompt.
+    :param: slide_text: text of a slide. (String)
+    :param: model: name of the model. (String)
+    :param: system_prompt: the system prompt sent with the slide. (String)
+    :return: cache key. (String)
+    """
+    return hash_text(KEY_SEPARATOR.join([model, system_prompt, normalize_text(slide_text)]))
+
+
+class ExplanationCache:
+    """
+    This class is a persistent, content addressed cache of slide explanations kept in the explainer's database.
+    Entries are keyed by the normalized slide text, the model and the system prompt, the least recently used entries
+    are evicted once the cache holds more than max_entries rows, checked every eviction_interval additions, and
+    entries generated by another model or system prompt can be invalidated. The slides of a deck are looked up, and
+    the explanations of a request stored, with a single commit each. The class also counts, in memory, the hits and
+    misses of the running process. Its methods block on the database, the explainer calls them in an executor, so
+    the counters are guarded by a lock.
+    """
+    def __init__(self, engine, model, system_prompt, max_entries=EXPLANATION_CACHE_MAX_ENTRIES,
+                 eviction_interval=EXPLANATION_CACHE_EVICTION_INTERVAL):
+        """
+        :param: engine: engine of the database holding the cache table. (Engine)
+        :param: model: the model the explanations are generated with. (String)
+        :param: system_prompt: the system prompt the explanations are generated with. (String)
+        :param: max_entries: maximum number of entries kept in the cache, 0 disables the cache. (Integer)
+        :param: eviction_interval: number of additions between two evictions. (Integer)
+        """
+        self._engine = engine
+        self._model = model
+        self._system_prompt = system_prompt
+        self._prompt_hash = hash_text(system_prompt)
+        self._max_entries = max_entries
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._eviction_interval = max(1, eviction_interval)
+        self._puts_since_eviction = 0
+
+    @property
+    def enabled(self):
+        """
+        :return: True if the cache may hold entries, false otherwise. (Boolean)
+        """
+        return self._max_entries > 0
+
+    def get(self, slide_text):
+        """
+        This method looks up the explanation of a single slide.
+        :param: slide_text: text of a slide. (String)
+        :return: the cached explanation, or None if the slide is not cached. (String)
+        """
+        return self.get_many([slide_text])[0]
+
+    def get_many(self, slide_texts):
+        """
+        This method looks up the explanations of several slides with a single query, and updates the usage of the
+        entries found with a single update.
+        :param: slide_texts: texts of the slides. (List of strings)
+        :return: the cached explanation of every slide, in the same order, None for the slides not cached. (List)
+        """
+        if not self.enabled or not slide_texts:
+            return [None] * len(slide_texts)
+
+        keys = [cache_key(slide_text, self._model, self._system_prompt) for slide_text in slide_texts]
+        with Session(self._engine) as session:
+            cached = dict(session.execute(select(CachedExplanation.key, CachedExplanation.explanation).where(
+                CachedExplanation.key.in_(set(keys)))).all())
+            if cached:
+                session.execute(update(CachedExplanation).where(CachedExplanation.key.in_(cached)).values(
+                    hit_count=CachedExplanation.hit_count + 1, last_used_time=datetime.now()))
+                session.commit()
+
+        explanations = [cached.get(key) for key in keys]
+        hits = sum(explanation is not None for explanation in explanations)
+        with self._lock:
+            self._hits += hits
+            self._misses += len(explanations) - hits
+        return explanations
+
+    def put(self, slide_text, explanation):
+        """
+        This method stores the explanation of a single slide.
+        :param: slide_text: text of a slide. (String)
+        :param: explanation: the cleaned explanation of the slide. (String)
+        :return:
+        """
+        self.put_many({slide_text: explanation})
+
+    def put_many(self, explanations):
+        """
+        This method stores the explanations of several slides with a single upsert, so two processes storing the same
+        slide do not conflict, and every eviction_interval additions evicts the least recently used entries if the
+        cache grew larger than its maximum size.
+        :param: explanations: the cleaned explanation of every slide text. (Dictionary)
+        :return:
+        """
+        if not self.enabled or not explanations:
+            return
+
+        now = datetime.now()
+        # slides whose texts only differ in case or white spaces share a key, a row is upserted once per statement
+        rows = {cache_key(slide_text, self._model, self._system_prompt): explanation
+                for slide_text, explanation in explanations.items()}
+        with Session(self._engine) as session:
+            insert = dialect_insert(session, CachedExplanation).values([
+                dict(key=key, model=self._model, prompt_hash=self._prompt_hash, explanation=explanation, hit_count=0,
+                     created_time=now, last_used_time=now) for key, explanation in rows.items()])
+            session.execute(insert.on_conflict_do_update(index_elements=[CachedExplanation.key], set_={
+                CachedExplanation.explanation: insert.excluded.explanation, CachedExplanation.last_used_time: now}))
+            session.commit()
+            with self._lock:
+                self._puts_since_eviction += len(rows)
+                evict = self._puts_since_eviction >= self._eviction_interval
+                if evict:
+                    self._puts_since_eviction = 0
+            if evict:
+                self._evict(session)
+
+    def _evict(self, session):
+        """
+        This method deletes the least recently used entries above the maximum size of the cache.
+        :param: session: an open database session. (Session)
+        :return:
+        """
+        excess = self._count_entries(session) - self._max_entries
+        if excess <= 0:
+            return
+
+        oldest_keys = select(CachedExplanation.key).order_by(CachedExplanation.last_used_time).limit(excess)
+        session.execute(delete(CachedExplanation).where(CachedExplanation.key.in_(oldest_keys)))
+        session.commit()
+        with self._lock:
+            self._evictions += excess
+
+    @staticmethod
+    def _count_entries(session):
+        return session.scalar(select(func.count()).select_from(CachedExplanation))
+
+    def invalidate_stale_entries(self):
+        """
+        This method deletes every entry that was not generated with the current model and system prompt, it should be
+        called whenever ENGINE_MODEL or the system prompt change.
+        :return: number of deleted entries. (Integer)
+        """
+        with Session(self._engine) as session:
+            result = session.execute(delete(CachedExplanation).where(or_(
+                CachedExplanation.model != self._model, CachedExplanation.prompt_hash != self._prompt_hash)))
+            session.commit()
+            return result.rowcount
+
+    def clear(self):
+        """
+        This method deletes every entry of the cache.
+        :return: number of deleted entries. (Integer)
+        """
+        with Session(self._engine) as session:
+            result = session.execute(delete(CachedExplanation))
+            session.commit()
+            return result.rowcount
+
+    def count_entries(self):
+        """
+        This method counts the entries of the cache, it scans the cache table, so it is only called on demand.
+        :return: the current number of entries. (Integer)
+        """
+        with Session(self._engine) as session:
+            return self._count_entries(session)
+
+    def stats(self):
+        """
+        This method returns the counters of the cache, kept in memory, it does not query the database.
+        :return: hits and misses of the running process, and the entries it evicted. (Dictionary)
+        """
+        with self._lock:
+            return {HITS_FIELD: self._hits, MISSES_FIELD: self._misses, EVICTIONS_FIELD: self._evictions}
@@ -0,0 +1,230 @@
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8089
+COMPLETIONS_PATH = '/v1/chat/completions'
+API_BASE_PATH = '/v1'
+OK = 200
+NOT_FOUND = 404
+TOO_MANY_REQUESTS = 429
+INTERNAL_ERROR = 500
+JSON_CONTENT_TYPE = 'application/json'
+ENCODING = 'utf-8'
+CHARACTERS_PER_TOKEN = 4
+FAKE_SERVER_STARTED = "Fake completion server listening on"
+BATCH_SLIDE_HEADER = re.compile(r"^(slide\d+):$", re.MULTILINE)
+
+
+class FakeCompletionHandler(BaseHTTPRequestHandler):
+    """
+    This class answers the chat completion requests of the openai package like the real API would, after a
+    configurable latency. It injects failures on purpose: a 429 with a Retry-After header once the configured rate
+    limit is exceeded or at random with rate_limit_probability, and a 500 at random with error_rate.
+    The explanation it answers with quotes the last message it received, so callers can check which slide an answer
+    belongs to.
+    """
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        """
+        Answers a single chat completion request.
+        :return:
+        """
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if self.path != COMPLETIONS_PATH:
+            self._send_json(NOT_FOUND, {"error": {"message": "not found", "type": "invalid_request_error"}})
+            return
+
+        server = self.server
+        request = json.loads(body or b"{}")
+        with server.lock:
+            server.requests += 1
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+        try:
+            if server.take_rate_limit_token() is False or random.random() < server.rate_limit_probability:
+                with server.lock:
+                    server.rate_limited += 1
+                self._send_json(TOO_MANY_REQUESTS,
+                                {"error": {"message": "Rate limit reached", "type": "requests"}},
+                                {"Retry-After": str(server.retry_after)})
+                return
+
+            time.sleep(max(0.0, random.gauss(server.latency, server.latency_jitter)))
+            if random.random() < server.error_rate:
+                with server.lock:
+                    server.errors += 1
+                self._send_json(INTERNAL_ERROR, {"error": {"message": "Injected failure", "type": "server_error"}})
+                return
+
+            self._send_json(OK, build_completion(request))
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+    def _send_json(self, status, data, headers=None):
+        """
+        Sends a json response.
+        :param status: HTTP status code (Integer)
+        :param data: body of the response (Dictionary)
+        :param headers: additional headers (Dictionary)
+        :return:
+        """
+        payload = json.dumps(data).encode(ENCODING)
+        self.send_response(status)
+        self.send_header('Content-Type', JSON_CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        """
+        Keeps the output of the benchmarks and tests clean.
+        :return:
+        """
+
+
+def build_completion(request):
+    """
+    This method builds a chat completion answer for a request. A request holding several slides, each under a
+    'slideN:' header, is answered with a JSON object of one explanation per slide, like a batch request expects.
+    :param: request: the body of the chat completion request (Dictionary)
+    :return: the body of the answer (Dictionary)
+    """
+    messages = request.get("messages", [])
+    prompt = messages[-1]["content"] if messages else ""
+    sections = BATCH_SLIDE_HEADER.split(prompt)
+    if len(sections) > 1:
+        content = json.dumps({key: f"Explanation of: {text.strip()}" for key, text in zip(sections[1::2],
+                                                                                         sections[2::2])})
+    else:
+        content = f"Explanation of: {prompt}"
+    prompt_tokens = sum(len(message.get("content", "")) for message in messages) // CHARACTERS_PER_TOKEN + 1
+    completion_tokens = len(content) // CHARACTERS_PER_TOKEN + 1
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": request.get("model", ""),
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                  "total_tokens": prompt_tokens + completion_tokens},
+    }
+
+
+class FakeCompletionServer(ThreadingHTTPServer):
+    """
+    This class is a local stand-in for the chat completion API, used by the tests and the benchmarks to run the
+    explainer offline. It runs in a background thread and counts the requests it received, the failures it injected
+    and the highest number of requests it served at once.
+    """
+    daemon_threads = True
+
+    def __init__(self, host=DEFAULT_HOST, port=0, latency=0.0, latency_jitter=0.0, error_rate=0.0,
+                 rate_limit=None, rate_limit_probability=0.0, retry_after=1):
+        """
+        :param: host: host to listen on (String)
+        :param: port: port to listen on, 0 picks a free port (Integer)
+        :param: latency: mean latency of an answer, in seconds (Float)
+        :param: latency_jitter: standard deviation of the latency, in seconds (Float)
+        :param: error_rate: probability of answering with a 500 (Float)
+        :param: rate_limit: maximum requests per second before answering with a 429, None for no limit (Float)
+        :param: rate_limit_probability: probability of answering with a 429 regardless of the rate (Float)
+        :param: retry_after: the Retry-After of the 429 answers, in seconds (Float)
+        """
+        super().__init__((host, port), FakeCompletionHandler)
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.rate_limit_probability = rate_limit_probability
+        self.retry_after = retry_after
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.rate_limited = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._tokens = rate_limit or 0
+        self._last_refill = time.monotonic()
+        self._thread = None
+
+    @property
+    def api_base(self):
+        """
+        :return: the value to set openai.api_base to (String)
+        """
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}{API_BASE_PATH}"
+
+    def take_rate_limit_token(self):
+        """
+        This method takes a token of the rate limit bucket, which holds at most one second of requests.
+        :return: None if there is no rate limit, True if the request is within the limit, false otherwise (Boolean)
+        """
+        if not self.rate_limit:
+            return None
+        with self.lock:
+            now = time.monotonic()
+            self._tokens = min(self.rate_limit, self._tokens + (now - self._last_refill) * self.rate_limit)
+            self._last_refill = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+    def start(self):
+        """
+        This method starts serving in a background thread.
+        :return: the server itself (FakeCompletionServer)
+        """
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """
+        This method stops the server and closes its socket.
+        :return:
+        """
+        self.shutdown()
+        self.server_close()
+
+
+def main():
+    """
+    Runs the fake completion server in the foreground, point the explainer to it with the OPENAI_API_BASE
+    environment variable.
+    :return:
+    """
+    parser = argparse.ArgumentParser(description="Local fake chat completion server.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--latency", type=float, default=0.5, help="mean latency in seconds")
+    parser.add_argument("--latency-jitter", type=float, default=0.1, help="latency standard deviation in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="probability of a 500 answer")
+    parser.add_argument("--rate-limit", type=float, default=None, help="requests per second before 429 answers")
+    parser.add_argument("--rate-limit-probability", type=float, default=0.0, help="probability of a 429 answer")
+    parser.add_argument("--retry-after", type=float, default=1, help="Retry-After of the 429 answers in seconds")
+    args = parser.parse_args()
+
+    server = FakeCompletionServer(args.host, args.port, args.latency, args.latency_jitter, args.error_rate,
+                                  args.rate_limit, args.rate_limit_probability, args.retry_after)
+    print(f"{FAKE_SERVER_STARTED} {server.api_base}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,24 @@
+import os
 import uuid
-from datetime import datetime
-from sqlalchemy import ForeignKey, String, Integer, UUID, create_engine, DateTime, CheckConstraint
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import ForeignKey, String, Integer, UUID, create_engine, DateTime, CheckConstraint, inspect, text, \
+    UniqueConstraint, Index, LargeBinary, event, select, update, or_, and_, literal, func
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
 from sqlalchemy.orm import sessionmaker, mapped_column, relationship, DeclarativeBase
 from sqlalchemy.ext.declarative import declarative_base
 
+# SQLite serves the processes of a single host, explainers running on several hosts have to share a server database,
+# such as PostgreSQL, the write-ahead log of SQLite does not work over a network file system
+DATABASE_URL = os.environ.get('DATABASE_URL', "sqlite:///db/my_database.db")
+DATABASE_ECHO = bool(int(os.environ.get('DATABASE_ECHO', 0)))
+DATABASE_BUSY_TIMEOUT = float(os.environ.get('DATABASE_BUSY_TIMEOUT', 30))
+SQLITE_JOURNAL_MODE = os.environ.get('SQLITE_JOURNAL_MODE', 'WAL')
+SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')
+SQLITE_CACHE_SIZE_KB = int(os.environ.get('SQLITE_CACHE_SIZE_KB', 16 * 1024))
+PENDING_STATUS = 'pending'
+PROCESSING_STATUS = 'processing'
+FAILED_STATUS = 'failed'
 
 Base = declarative_base()
 
@@ -28,40 +43,84 @@ class User(Base):
 class Upload(Base):
     """
     This class also inherits from the Base class and also represents another table in the database, this table holds
-    7 attributes, and established another bidirectional relationship with the user table, Multiple upload could belong
+    10 attributes, and established another bidirectional relationship with the user table, Multiple upload could belong
     to a single user. The attribute that this table holds:
     -id: generated id of the upload, which is set to a primary key.
     -uid: generated universal unique ID of the upload.
     -file_name: the name of the file uploaded.
     -upload_time: the time the file was uploaded.
+    -start_time: the time the explainer claimed the file, None while it is pending.
     -finish_time: the time the file finished uploading.
     -status: the current status the file is holding.
     -user_id: the id of the user, which is set as a foreign key.
+    -digest: sha256 hex digest of the uploaded file, used to find identical uploads.
+    -source_uid: uid of an earlier identical upload whose output this upload reuses, None if it was processed itself.
+    -slides_total: number of slides in the uploaded presentation, None until it is known.
+    -priority: the uploads with a higher priority are processed first, 0 by default.
+    -prompt_tokens: tokens sent to the model to explain the upload, None until it is processed.
+    -completion_tokens: tokens answered by the model for the upload, None until it is processed.
+    -slides_failed: number of slides whose explanation is an error message, None until it is processed. Only the
+    uploads processed without any failed slide are reused by identical uploads.
+    -attempts: the number of times an explainer claimed the upload.
+    -lease_owner: the id of the explainer processing the upload, None if no explainer holds it.
+    -lease_expires: the time the lease of the explainer ends unless it is renewed, past it the upload may be claimed
+    by another explainer. It is taken from the clock of the database, in UTC, unlike the other times of the upload.
+    The upload also holds the explanations of the slides finished so far while it is being processed.
+    The status and the upload time are indexed together for the explainer, which looks for the oldest pending uploads,
+    and the user, the file name and the upload time for the lookup of the latest upload of a file by the email of its
+    user. The status and the lease expiry are indexed together for the lookup of the expired leases.
     """
     __tablename__ = "uploads_table"
+    __table_args__ = (Index('ix_uploads_table_status_upload_time', 'status', 'upload_time'),
+                      Index('ix_uploads_table_user_id_file_name_upload_time', 'user_id', 'file_name', 'upload_time'),
+                      Index('ix_uploads_table_status_lease_expires', 'status', 'lease_expires'))
 
     id = mapped_column(Integer, primary_key=True, unique=True)
     uid = mapped_column(String, nullable=False, unique=True)
     file_name = mapped_column(String, default="Default_file")
     upload_time = mapped_column(DateTime, nullable=False)
+    start_time = mapped_column(DateTime)
     finish_time = mapped_column(DateTime)
     status = mapped_column(String, nullable=False)
     user_id = mapped_column(Integer, ForeignKey('users_table.id'), default="N/A", nullable=False)
     user = relationship('User', back_populates="uploads")
+    digest = mapped_column(String(64), index=True)
+    source_uid = mapped_column(String)
+    slides_total = mapped_column(Integer)
+    priority = mapped_column(Integer, default=0)
+    prompt_tokens = mapped_column(Integer)
+    completion_tokens = mapped_column(Integer)
+    slides_failed = mapped_column(Integer)
+    attempts = mapped_column(Integer, default=0)
+    lease_owner = mapped_column(String)
+    lease_expires = mapped_column(DateTime)
+    slide_explanations = relationship('SlideExplanation', order_by='SlideExplanation.slide_number',
+                                      cascade="all, delete-orphan")
 
-    def __init__(self, file_name, status, uid, user_id=None):
+    def __init__(self, file_name, status, uid, user_id=None, digest=None, priority=0):
         """
         Custom Constructor for the database that only receives desired objects.
         :param: file_name: the name of the uploaded file (String)
         :param: status: the current status of a file (String)
         :param: uid: the uid of the file (String)
         :param: user_id: optional variable of the user id, if the user does not exist then its none.
+        :param: digest: optional sha256 hex digest of the uploaded file (String)
+        :param: priority: optional priority of the upload, higher is processed first (Integer)
         """
         self.file_name = file_name
         self.status = status
         self.upload_time = datetime.now()
         self.uid = uid
         self.user_id = user_id
+        self.digest = digest
+        self.priority = priority
+
+    def set_upload_start_time(self):
+        """
+        This method sets the time when the explainer started processing a file
+        :return:
+        """
+        self.start_time = datetime.now()
 
     def set_upload_finish_time(self):
         """
@@ -78,6 +137,46 @@ class Upload(Base):
         """
         self.status = status
 
+    def set_token_usage(self, prompt_tokens, completion_tokens):
+        """
+        This method records the tokens of the model requests of the upload
+        :param prompt_tokens: tokens sent to the model (Integer)
+        :param completion_tokens: tokens answered by the model (Integer)
+        :return:
+        """
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+
+    def set_slides_failed(self, slides_failed):
+        """
+        This method records the number of slides of the upload that could not be explained
+        :param slides_failed: number of slides whose explanation is an error message (Integer)
+        :return:
+        """
+        self.slides_failed = slides_failed
+
+    def release_lease(self):
+        """
+        This method clears the lease of the upload, once its explainer is done with it
+        :return:
+        """
+        self.lease_owner = None
+        self.lease_expires = None
+
+    def retry_or_fail(self, max_attempts):
+        """
+        This method queues the upload again after an attempt to process it failed or was interrupted, or fails it for
+        good once it was attempted max_attempts times, so a file that can not be processed is not retried forever.
+        :param max_attempts: the number of attempts after which the upload fails (Integer)
+        :return:
+        """
+        if (self.attempts or 0) >= max_attempts:
+            self.status = FAILED_STATUS
+            self.set_upload_finish_time()
+        else:
+            self.status = PENDING_STATUS
+            self.start_time = None
+
     def get_upload_path(self):
         """
         This method returns the path of a certain file in the 'uploads' folder, according to its uid.
@@ -85,11 +184,306 @@ class Upload(Base):
         """
         return f"uploads/{self.uid}.pptx"
 
+    def reuse_output_of(self, source_upload):
+        """
+        This method marks the upload as a duplicate of an earlier finished upload with the same content, the upload
+        is done right away and resolves to the output of the source upload.
+        :param source_upload: finished upload with the same digest (Upload)
+        :return:
+        """
+        self.source_uid = source_upload.get_output_uid()
+        self.slides_total = source_upload.slides_total
+        self.slides_failed = source_upload.slides_failed
+        self.set_upload_finish_time()
+
+    def get_output_uid(self):
+        """
+        This method returns the uid the explanations of the upload are saved under, which is the uid of the upload
+        itself, or the uid of the identical upload it reuses.
+        :return: uid of the output (String)
+        """
+        return self.source_uid or self.uid
+
+
+class SlideExplanation(Base):
+    """
+    This class represents the table of the slide explanations finished while an upload is being processed, each
+    explanation is committed as soon as its slide is done, so the progress of an upload can be reported and the
+    finished slides can be read before the whole presentation is done. The attributes the table holds:
+    -id: generated id of the explanation, which is set to a primary key.
+    -upload_id: the id of the upload, which is set as a foreign key.
+    -slide_number: the number of the slide in the presentation, starting from 1.
+    -explanation: the explanation of the slide.
+    -finish_time: the time the slide was explained.
+    """
+    __tablename__ = "slide_explanations_table"
+    __table_args__ = (UniqueConstraint('upload_id', 'slide_number'),)
+
+    id = mapped_column(Integer, primary_key=True)
+    upload_id = mapped_column(Integer, ForeignKey('uploads_table.id'), nullable=False)
+    slide_number = mapped_column(Integer, nullable=False)
+    explanation = mapped_column(String, nullable=False)
+    finish_time = mapped_column(DateTime, nullable=False)
+
+    def __init__(self, upload_id, slide_number, explanation):
+        """
+        :param: upload_id: the id of the upload the slide belongs to (Integer)
+        :param: slide_number: the number of the slide, starting from 1 (Integer)
+        :param: explanation: the explanation of the slide (String)
+        """
+        self.upload_id = upload_id
+        self.slide_number = slide_number
+        self.explanation = explanation
+        self.finish_time = datetime.now()
+
+
+class CachedExplanation(Base):
+    """
+    This class represents the explanation cache table in the database. Every row holds the explanation of a slide,
+    keyed by a hash of the normalized text of the slide together with the model and the system prompt that produced
+    it, so identical slides are only sent to the API once. The attributes the table holds:
+    -key: sha256 hash of the model, the system prompt and the normalized slide text, set to primary key.
+    -model: the model that generated the explanation.
+    -prompt_hash: sha256 hash of the system prompt the explanation was generated with.
+    -explanation: the cleaned explanation of the slide.
+    -hit_count: how many times the entry was served from the cache.
+    -created_time: the time the entry was added.
+    -last_used_time: the last time the entry was added or served, used to evict the least recently used entries.
+    """
+    __tablename__ = "explanation_cache_table"
+
+    key = mapped_column(String(64), primary_key=True)
+    model = mapped_column(String, nullable=False)
+    prompt_hash = mapped_column(String(64), nullable=False)
+    explanation = mapped_column(String, nullable=False)
+    hit_count = mapped_column(Integer, default=0, nullable=False)
+    created_time = mapped_column(DateTime, nullable=False)
+    last_used_time = mapped_column(DateTime, nullable=False, index=True)
+
+
+class StoredOutput(Base):
+    """
+    This class represents the table of the explanations of the finished uploads, kept compressed in the database
+    instead of a json file per upload, when the database output store is used. The attributes the table holds:
+    -upload_id: the id of the upload the explanations belong to, set to primary key and foreign key.
+    -encoding: the content coding of the content, for example 'gzip'.
+    -content: the compressed json object of the explanations of the slides.
+    -size: the size of the json object before compression, in bytes.
+    -created_time: the time the explanations were stored.
+    """
+    __tablename__ = "outputs_table"
+
+    upload_id = mapped_column(Integer, ForeignKey('uploads_table.id'), primary_key=True)
+    encoding = mapped_column(String(16), nullable=False)
+    content = mapped_column(LargeBinary, nullable=False)
+    size = mapped_column(Integer, nullable=False)
+    created_time = mapped_column(DateTime, nullable=False)
+
+    def __init__(self, upload_id, encoding, content, size):
+        """
+        :param: upload_id: the id of the upload the explanations belong to (Integer)
+        :param: encoding: the content coding of the content (String)
+        :param: content: the compressed explanations (Bytes)
+        :param: size: the size of the explanations before compression (Integer)
+        """
+        self.upload_id = upload_id
+        self.encoding = encoding
+        self.content = content
+        self.size = size
+        self.created_time = datetime.now()
+
 
-engine = create_engine("sqlite:///db/my_database.db", echo=True)
+def prepare_database(engine):
+    """
+    This method creates the missing tables and brings the existing ones up to date with the models. Every entry point
+    calls it once on startup, importing this module never writes to the database.
+    :param engine: engine of the database (Engine)
+    :return:
+    """
+    Base.metadata.create_all(engine)
+    migrate_schema(engine)
+
+
+def migrate_schema(engine):
+    """
+    This method brings the tables of an existing database up to date with the models, create_all only creates missing
+    tables, so columns and indexes that were added to the models later on are added here.
+    :param engine: engine of the database (Engine)
+    :return:
+    """
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            existing_columns = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing_columns:
+                    column_type = column.type.compile(dialect=engine.dialect)
+                    connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+            for index in table.indexes:
+                index.create(connection, checkfirst=True)
+
+
+def upsert_user(session, email):
+    """
+    This method finds the user with the given email, or creates it if it does not exist yet, within the transaction
+    of the given session, so a new user and its upload are committed together. Concurrent uploads of a new email do
+    not fail on the unique email, the insert is skipped if another request created the user first.
+    :param session: an open database session (Session)
+    :param email: email of the user (String)
+    :return: id of the user (Integer)
+    """
+    session.execute(dialect_insert(session, User).values(email=email).on_conflict_do_nothing(
+        index_elements=[User.email]))
+    return session.scalar(select(User.id).filter_by(email=email))
+
+
+def dialect_insert(session, model):
+    """
+    :param session: an open database session (Session)
+    :param model: the model to insert into (Class)
+    :return: the insert statement of the database of the session, which can skip the rows that already exist (Insert)
+    """
+    if session.get_bind().dialect.name == "postgresql":
+        return postgresql_insert(model)
+    return sqlite_insert(model)
+
+
+def database_now(session):
+    """
+    This method reads the current time from the database, in UTC, so the leases of the explainers sharing the
+    database are all written and compared against the same clock, whatever the clock and the timezone of their hosts.
+    :param session: an open database session (Session)
+    :return: the current time of the database, in UTC, without a timezone (Datetime)
+    """
+    if session.get_bind().dialect.name == "sqlite":
+        return datetime.fromisoformat(session.scalar(select(func.strftime('%Y-%m-%d %H:%M:%f', 'now'))))
+    now = session.scalar(select(func.now()))
+    if now.tzinfo is not None:
+        now = now.astimezone(timezone.utc).replace(tzinfo=None)
+    return now
+
+
+def claimable_uploads(now):
+    """
+    :param now: the current time of the database (Datetime)
+    :return: the condition of the uploads an explainer may claim, the pending ones and the ones whose explainer
+    stopped renewing its lease. (ColumnElement)
+    """
+    return or_(Upload.status == PENDING_STATUS,
+               and_(Upload.status == PROCESSING_STATUS, Upload.lease_expires < now))
+
+
+def claim_upload(session, upload_id, owner, lease_seconds, now=None, max_attempts=None):
+    """
+    This method claims an upload for an explainer, with a single conditional update, so when several explainers
+    choose the same upload only one of them gets it, whatever process or host they run on. The session should not
+    have read anything in its transaction yet, so the update is the one deciding. Every claim counts as an attempt.
+    :param session: an open database session (Session)
+    :param upload_id: id of the upload to claim (Integer)
+    :param owner: id of the explainer (String)
+    :param lease_seconds: seconds the lease lasts unless it is renewed (Float)
+    :param now: the current time of the database, read from the database by default (Datetime)
+    :param max_attempts: the upload is not claimed once it was attempted that many times, None for no limit (Integer)
+    :return: True if the upload was claimed, False if another explainer got it first (Boolean)
+    """
+    now = now or database_now(session)
+    condition = claimable_uploads(now)
+    if max_attempts is not None:
+        condition = and_(condition, func.coalesce(Upload.attempts, 0) < max_attempts)
+    result = session.execute(update(Upload).where(Upload.id == upload_id, condition).values(
+        status=PROCESSING_STATUS, lease_owner=owner, lease_expires=now + timedelta(seconds=lease_seconds),
+        start_time=datetime.now(), attempts=func.coalesce(Upload.attempts, 0) + 1))
+    return result.rowcount == 1
+
+
+def fail_abandoned_upload(session, upload_id, max_attempts, now=None):
+    """
+    This method fails for good an upload that was attempted max_attempts times already, and whose last explainer
+    stopped renewing its lease, with a single conditional update, like claim_upload. A file that stops every
+    explainer that processes it thus ends up failed instead of being claimed over and over.
+    :param session: an open database session (Session)
+    :param upload_id: id of the upload (Integer)
+    :param max_attempts: the number of attempts after which the upload fails (Integer)
+    :param now: the current time of the database, read from the database by default (Datetime)
+    :return: True if the upload failed, False if it was claimed or finished in the meantime (Boolean)
+    """
+    now = now or database_now(session)
+    result = session.execute(update(Upload).where(
+        Upload.id == upload_id, Upload.status == PROCESSING_STATUS, Upload.lease_expires < now,
+        func.coalesce(Upload.attempts, 0) >= max_attempts).values(
+        status=FAILED_STATUS, lease_owner=None, lease_expires=None, finish_time=datetime.now()))
+    return result.rowcount == 1
+
+
+def renew_leases(session, owner, upload_ids, lease_seconds, now=None):
+    """
+    This method extends the leases an explainer still holds on the given uploads.
+    :param session: an open database session (Session)
+    :param owner: id of the explainer (String)
+    :param upload_ids: ids of the uploads the explainer is processing (List of integers)
+    :param lease_seconds: seconds the leases last from now (Float)
+    :param now: the current time of the database, read from the database by default (Datetime)
+    :return: the ids of the uploads the explainer still holds (Set of integers)
+    """
+    now = now or database_now(session)
+    session.execute(update(Upload).where(
+        Upload.id.in_(upload_ids), Upload.lease_owner == owner, Upload.status == PROCESSING_STATUS).values(
+        lease_expires=now + timedelta(seconds=lease_seconds)))
+    return set(session.scalars(select(Upload.id).where(Upload.id.in_(upload_ids), Upload.lease_owner == owner)))
+
+
+def save_slide_explanation(session, upload_id, slide_number, explanation, owner):
+    """
+    This method saves the explanation of a slide of an upload with a single statement, and only while the given
+    explainer holds the lease of the upload, so an explainer that lost the upload to another one stops writing its
+    slides. A slide that is saved already is left as it is, instead of failing on the unique slide number.
+    :param session: an open database session (Session)
+    :param upload_id: id of the upload the slide belongs to (Integer)
+    :param slide_number: number of the slide, starting from 1 (Integer)
+    :param explanation: the explanation of the slide (String)
+    :param owner: id of the explainer (String)
+    :return: True if the explanation was saved, False otherwise (Boolean)
+    """
+    lease_held = select(Upload.id).where(Upload.id == upload_id, Upload.lease_owner == owner).exists()
+    values = select(literal(upload_id), literal(slide_number), literal(explanation), literal(datetime.now()))
+    result = session.execute(dialect_insert(session, SlideExplanation).from_select(
+        ['upload_id', 'slide_number', 'explanation', 'finish_time'], values.where(lease_held)).on_conflict_do_nothing(
+        index_elements=['upload_id', 'slide_number']))
+    return result.rowcount == 1
+
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """
+    This method tunes every new connection to the database: the write-ahead log lets the web API read while the
+    explainer writes, synchronous NORMAL only syncs the log at checkpoints, which is safe in WAL mode, and the busy
+    timeout makes a writer wait for the lock instead of failing with 'database is locked'.
+    :param dbapi_connection: the new sqlite3 connection (Connection)
+    :param connection_record: unused (ConnectionRecord)
+    :return:
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+    cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA busy_timeout={int(DATABASE_BUSY_TIMEOUT * 1000)}")
+    cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+    cursor.close()
+
+
+def create_database_engine(url=DATABASE_URL, echo=DATABASE_ECHO):
+    """
+    This method creates the engine of the database, sqlite connections are tuned with set_sqlite_pragmas.
+    :param url: url of the database (String)
+    :param echo: log every sql statement (Boolean)
+    :return: the engine (Engine)
+    """
+    database_engine = create_engine(url, echo=echo)
+    if database_engine.dialect.name == "sqlite":
+        event.listen(database_engine, "connect", set_sqlite_pragmas)
+    return database_engine
+
+
+engine = create_database_engine()
 Session = sessionmaker(bind=engine)
 session = Session()
 
-Base.metadata.create_all(engine)
-
 
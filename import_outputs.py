@@ -0,0 +1,85 @@
+import argparse
+import json
+import os
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from handle_db import Upload, StoredOutput, engine, prepare_database
+from output_store import DatabaseOutputStore, OUTPUTS_FOLDER, OUTPUT_EXTENSION, OUTPUT_COMPRESSION_LEVEL
+
+COMMIT_EVERY = 500
+READ_BINARY_MODE = 'rb'
+IMPORTED = "imported"
+ALREADY_STORED = "already stored"
+WITHOUT_UPLOAD = "without an upload"
+UNREADABLE = "unreadable"
+REMOVED_FILES = "Removed the imported files."
+
+
+def import_outputs(folder=OUTPUTS_FOLDER, remove_files=False, compression_level=OUTPUT_COMPRESSION_LEVEL):
+    """
+    This method imports the json files of the outputs folder into the outputs table, compressed. A file is matched to
+    its upload by the uid in its name, files whose upload is not found or whose explanations are already in the table
+    are skipped, so the import can be run again safely.
+    :param: folder: the outputs folder. (String)
+    :param: remove_files: remove every file once it is imported and committed. (Boolean)
+    :param: compression_level: gzip compression level, from 1 to 9. (Integer)
+    :return: the number of files imported, already stored, without an upload and unreadable. (Dictionary)
+    """
+    store = DatabaseOutputStore(compression_level=compression_level)
+    counts = {IMPORTED: 0, ALREADY_STORED: 0, WITHOUT_UPLOAD: 0, UNREADABLE: 0}
+    imported_paths = []
+    file_names = sorted(name for name in os.listdir(folder) if name.endswith(OUTPUT_EXTENSION))
+    with Session(engine) as session:
+        stored_ids = set(session.scalars(select(StoredOutput.upload_id)))
+        for file_name in file_names:
+            uid = file_name[:-len(OUTPUT_EXTENSION)]
+            upload = session.query(Upload).filter_by(uid=uid).first()
+            if upload is None:
+                counts[WITHOUT_UPLOAD] += 1
+                continue
+            if upload.id in stored_ids:
+                counts[ALREADY_STORED] += 1
+                continue
+
+            file_path = os.path.join(folder, file_name)
+            try:
+                with open(file_path, READ_BINARY_MODE) as file:
+                    slide_explanations = json.load(file)
+            except ValueError:
+                counts[UNREADABLE] += 1
+                continue
+
+            store.save(session, upload, slide_explanations)
+            stored_ids.add(upload.id)
+            imported_paths.append(file_path)
+            counts[IMPORTED] += 1
+            if counts[IMPORTED] % COMMIT_EVERY == 0:
+                session.commit()
+        session.commit()
+
+    if remove_files:
+        for file_path in imported_paths:
+            os.remove(file_path)
+    return counts
+
+
+def main():
+    """
+    Imports the existing outputs folder into the database output store.
+    :return:
+    """
+    parser = argparse.ArgumentParser(description="Import the json outputs folder into the compressed outputs table.")
+    parser.add_argument("--folder", default=OUTPUTS_FOLDER, help="the outputs folder")
+    parser.add_argument("--remove-files", action="store_true", help="remove the files once they are imported")
+    parser.add_argument("--compression-level", type=int, default=OUTPUT_COMPRESSION_LEVEL, help="gzip level, 1 to 9")
+    args = parser.parse_args()
+
+    prepare_database(engine)
+    counts = import_outputs(args.folder, args.remove_files, args.compression_level)
+    print(", ".join(f"{label}: {count}" for label, count in counts.items()))
+    if args.remove_files:
+        print(REMOVED_FILES)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+import asyncio
+import os
+import socket
+import threading
+from collections import OrderedDict
+
+NOTIFY_HOST = os.environ.get('EXPLAINER_NOTIFY_HOST', '127.0.0.1')
+NOTIFY_PORT = int(os.environ.get('EXPLAINER_NOTIFY_PORT', 5055))
+PROGRESS_NOTIFY_HOST = os.environ.get('PROGRESS_NOTIFY_HOST', '127.0.0.1')
+PROGRESS_NOTIFY_PORT = int(os.environ.get('PROGRESS_NOTIFY_PORT', 5056))
+NEW_UPLOAD_MESSAGE = "upload"
+PROGRESS_MESSAGE = "progress"
+ENCODING = "utf-8"
+DATAGRAM_SIZE = 1024
+MAX_TRACKED_UPLOADS = 10000
+
+
+def send_notification(message, host=NOTIFY_HOST, port=NOTIFY_PORT):
+    """
+    This method sends a single datagram to a listener. Notifications are best effort, the listeners keep scanning
+    the database periodically, so a notification that could not be sent is only a delay and never raises.
+    :param: message: the content of the notification (String)
+    :param: host: host the listener is bound to (String)
+    :param: port: port the listener is bound to (Integer)
+    :return: True if the notification was sent, false otherwise (Boolean)
+    """
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as notifier:
+            notifier.sendto(message.encode(ENCODING), (host, port))
+        return True
+    except OSError:
+        return False
+
+
+def notify_new_upload(uid):
+    """
+    This method tells the explainer that a new pending upload was committed, so it can pick it up right away.
+    :param: uid: uid of the new upload (String)
+    :return: True if the notification was sent, false otherwise (Boolean)
+    """
+    return send_notification(f"{NEW_UPLOAD_MESSAGE} {uid}", NOTIFY_HOST, NOTIFY_PORT)
+
+
+def notify_progress(uid):
+    """
+    This method tells the web API that an upload made progress, a slide was explained or its status changed, so the
+    clients waiting on it are answered right away.
+    :param: uid: uid of the upload (String)
+    :return: True if the notification was sent, false otherwise (Boolean)
+    """
+    return send_notification(f"{PROGRESS_MESSAGE} {uid}", PROGRESS_NOTIFY_HOST, PROGRESS_NOTIFY_PORT)
+
+
+class JobNotificationListener(asyncio.DatagramProtocol):
+    """
+    This class receives the notifications sent by notify_new_upload on a local UDP socket, and sets an event the
+    explainer's main loop waits on. The event starts set, so the first scan happens as soon as the explainer starts.
+    """
+    def __init__(self):
+        self._new_upload = asyncio.Event()
+        self._new_upload.set()
+        self._transport = None
+
+    def connection_made(self, transport):
+        """
+        Keeps the transport of the socket so it can be closed later.
+        :param transport: the datagram transport (DatagramTransport)
+        :return:
+        """
+        self._transport = transport
+
+    def datagram_received(self, data, addr):
+        """
+        Wakes up the main loop on every notification.
+        :param data: content of the notification (Bytes)
+        :param addr: address of the sender (Tuple)
+        :return:
+        """
+        self._new_upload.set()
+
+    async def wait(self):
+        """
+        This method waits until a notification was received since the last call to clear.
+        :return:
+        """
+        await self._new_upload.wait()
+
+    def clear(self):
+        """
+        This method forgets the received notifications, it is called right before the database is scanned, so
+        notifications received during the scan wake the loop up again.
+        :return:
+        """
+        self._new_upload.clear()
+
+    def close(self):
+        """
+        This method closes the socket of the listener.
+        :return:
+        """
+        if self._transport is not None:
+            self._transport.close()
+
+
+async def start_listener(host=NOTIFY_HOST, port=NOTIFY_PORT):
+    """
+    This method binds a JobNotificationListener to the given address. The port is not shared, so only the first
+    explainer started on a host receives the notifications, and binding raises an OSError in the others, which rely
+    on their periodic scans. With a shared port the kernel would hand every notification to any of the explainers,
+    a busy one as well, while an idle one sleeps until its next scan.
+    :param: host: host to bind to (String)
+    :param: port: port to bind to (Integer)
+    :return: the bound listener (JobNotificationListener)
+    """
+    loop = asyncio.get_running_loop()
+    _, listener = await loop.create_datagram_endpoint(JobNotificationListener, local_addr=(host, port))
+    return listener
+
+
+class ProgressListener:
+    """
+    This class receives the notifications sent by notify_progress on a local UDP socket, in a background thread of
+    the web API. It keeps a version number for every upload that is bumped on each notification, and lets request
+    threads block until the version of the upload they watch changes.
+    Only the latest MAX_TRACKED_UPLOADS uploads are tracked, an upload that was forgotten simply starts over at 0.
+    """
+    def __init__(self, host=PROGRESS_NOTIFY_HOST, port=PROGRESS_NOTIFY_PORT):
+        """
+        :param: host: host to bind to (String)
+        :param: port: port to bind to (Integer)
+        """
+        self._address = (host, port)
+        self._versions = OrderedDict()
+        self._condition = threading.Condition()
+
+    def start(self):
+        """
+        This method binds the socket and starts the background thread, it raises an OSError if the address could not
+        be bound.
+        :return:
+        """
+        receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            receiver.bind(self._address)
+        except OSError:
+            receiver.close()
+            raise
+        threading.Thread(target=self._receive, args=(receiver,), daemon=True).start()
+
+    def _receive(self, receiver):
+        """
+        This method runs in the background thread and bumps the version of every upload it is notified about.
+        :param receiver: the bound socket (Socket)
+        :return:
+        """
+        while True:
+            data, _ = receiver.recvfrom(DATAGRAM_SIZE)
+            kind, _, uid = data.decode(ENCODING, errors="ignore").partition(" ")
+            if kind != PROGRESS_MESSAGE or not uid:
+                continue
+            with self._condition:
+                self._versions[uid] = self._versions.pop(uid, 0) + 1
+                if len(self._versions) > MAX_TRACKED_UPLOADS:
+                    self._versions.popitem(last=False)
+                self._condition.notify_all()
+
+    def version(self, uid):
+        """
+        :param uid: uid of an upload (String)
+        :return: the current version of the upload (Integer)
+        """
+        with self._condition:
+            return self._versions.get(uid, 0)
+
+    def wait_for_change(self, uid, version, timeout):
+        """
+        This method blocks until the version of the upload differs from the given one, or until the timeout passed.
+        :param uid: uid of an upload (String)
+        :param version: the version the caller has already seen (Integer)
+        :param timeout: maximum number of seconds to wait (Float)
+        :return: True if the upload changed, false if the timeout passed (Boolean)
+        """
+        with self._condition:
+            return self._condition.wait_for(lambda: self._versions.get(uid, 0) != version, timeout)
@@ -0,0 +1,86 @@
+import heapq
+import os
+from datetime import datetime
+
+FAIR_POLICY = 'fair'
+FIFO_POLICY = 'fifo'
+SCHEDULER_POLICY = os.environ.get('SCHEDULER_POLICY', FAIR_POLICY)
+# a waiting deck counts as this many slides shorter for every second it waited, so the long decks are not starved by
+# a steady stream of short ones, 0 orders the decks of a user by size only
+SCHEDULER_AGING_SLIDES_PER_SECOND = float(os.environ.get('SCHEDULER_AGING_SLIDES_PER_SECOND', 0.5))
+# the size assumed for a deck whose number of slides is unknown
+SCHEDULER_UNKNOWN_SLIDES = int(os.environ.get('SCHEDULER_UNKNOWN_SLIDES', 20))
+UNKNOWN_POLICY = "Unknown scheduler policy:"
+
+
+def job_cost(job, now, aging_rate=SCHEDULER_AGING_SLIDES_PER_SECOND):
+    """
+    This method returns the cost of a pending upload, its number of slides, lowered the longer it waits.
+    :param: job: a pending upload, with its slides_total and upload_time. (Upload or row)
+    :param: now: the current time. (Datetime)
+    :param: aging_rate: slides taken off the cost for every second of waiting. (Float)
+    :return: the cost, the cheapest upload is processed first. (Float)
+    """
+    slides = job.slides_total if job.slides_total is not None else SCHEDULER_UNKNOWN_SLIDES
+    return slides - aging_rate * (now - job.upload_time).total_seconds()
+
+
+def job_order(job, now, aging_rate=SCHEDULER_AGING_SLIDES_PER_SECOND):
+    """
+    :return: the sort key of a pending upload among the uploads of its user: the highest priority first, then the
+    lowest cost, then the oldest. (Tuple)
+    """
+    return -(job.priority or 0), job_cost(job, now, aging_rate), job.upload_time, job.id
+
+
+def schedule_uploads(pending_jobs, running_per_user, limit, now=None, policy=SCHEDULER_POLICY,
+                     aging_rate=SCHEDULER_AGING_SLIDES_PER_SECOND):
+    """
+    This method chooses the pending uploads to process next. With the fifo policy they are taken by upload time. With
+    the fair policy every user has a queue of its own, ordered by job_order, and the next upload is always taken from
+    the user with the fewest uploads processing, counting the ones chosen so far, so a user with hundreds of decks
+    cannot starve the others, and the short decks of a user go before its long ones. An upload with a higher priority
+    goes before the uploads of every user with a lower one. The anonymous uploads share a single queue.
+    :param: pending_jobs: the pending uploads, with their id, user_id, slides_total, priority and upload_time. (List)
+    :param: running_per_user: the number of uploads processing right now, keyed by user id. (Dictionary)
+    :param: limit: maximum number of uploads to choose. (Integer)
+    :param: now: the current time, the time of the call by default. (Datetime)
+    :param: policy: FAIR_POLICY or FIFO_POLICY. (String)
+    :param: aging_rate: slides taken off the cost of an upload for every second of waiting. (Float)
+    :return: the ids of the chosen uploads, in the order they should start. (List of integers)
+    """
+    if policy == FIFO_POLICY:
+        return [job.id for job in sorted(pending_jobs, key=lambda job: (job.upload_time, job.id))[:limit]]
+    if policy != FAIR_POLICY:
+        raise ValueError(f"{UNKNOWN_POLICY} {policy}")
+
+    now = now or datetime.now()
+    queues = {}
+    for job in pending_jobs:
+        queues.setdefault(job.user_id, []).append(job)
+
+    heap = []
+    for user_number, (user_id, jobs) in enumerate(queues.items()):
+        jobs.sort(key=lambda job: job_order(job, now, aging_rate), reverse=True)
+        heap.append(user_entry(jobs, running_per_user.get(user_id, 0), now, aging_rate, user_number))
+    heapq.heapify(heap)
+
+    chosen = []
+    while heap and len(chosen) < limit:
+        _, load, _, user_number, jobs = heapq.heappop(heap)
+        chosen.append(jobs.pop().id)
+        if jobs:
+            heapq.heappush(heap, user_entry(jobs, load + 1, now, aging_rate, user_number))
+    return chosen
+
+
+def user_entry(jobs, load, now, aging_rate, user_number):
+    """
+    :param: jobs: the pending uploads of a user, the next one last. (List)
+    :param: load: the number of uploads of the user processing or chosen already. (Integer)
+    :param: user_number: a number unique to the user, which breaks the ties without comparing the user ids. (Integer)
+    :return: the heap entry of the user, ordered by the priority of its next upload, then its load, then the order
+    of its next upload. (Tuple)
+    """
+    priority, *order = job_order(jobs[-1], now, aging_rate)
+    return priority, load, tuple(order), user_number, jobs
@@ -0,0 +1,306 @@
+import math
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+ENCODING = 'utf-8'
+METRICS_PATH = '/metrics'
+OK = 200
+NOT_FOUND = 404
+COUNTER_TYPE = 'counter'
+GAUGE_TYPE = 'gauge'
+HISTOGRAM_TYPE = 'histogram'
+# from a millisecond to ten minutes, wide enough for clean_text as well as the processing of a whole deck
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+WRONG_LABELS = "Wrong labels for metric"
+
+
+def format_value(value):
+    """
+    :param: value: a sample value. (Float)
+    :return: the value in the Prometheus text format. (String)
+    """
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if math.isnan(value):
+        return "NaN"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+def format_labels(names, values):
+    """
+    :param: names: names of the labels. (Tuple)
+    :param: values: values of the labels, in the same order. (Tuple)
+    :return: the label set in the Prometheus text format, empty without labels. (String)
+    """
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        escaped = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{name}="{escaped}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class Metric(ABC):
+    """
+    This class is the base of the metrics, a named family of samples, one per combination of label values. The
+    values are updated under a lock, so the metrics can be shared by the request threads of the web API, and read
+    by the thread that serves them.
+    """
+    metric_type = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        """
+        :param: name: name of the metric. (String)
+        :param: documentation: the help text of the metric. (String)
+        :param: labelnames: names of the labels of the metric. (Tuple)
+        :param: registry: the registry the metric is exposed by, None for the default REGISTRY. (Registry)
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        (REGISTRY if registry is None else registry).register(self)
+
+    def _key(self, labels):
+        """
+        :param: labels: the value of every label of the metric. (Dictionary)
+        :return: the label values in the order of the label names. (Tuple)
+        """
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{WRONG_LABELS} {self.name}: {sorted(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    @abstractmethod
+    def samples(self):
+        """
+        :return: the name suffix, label names, label values and value of every sample of the metric. (List of tuples)
+        """
+
+    def render(self):
+        """
+        :return: the metric in the Prometheus text format. (String)
+        """
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        for suffix, names, values, value in self.samples():
+            lines.append(f"{self.name}{suffix}{format_labels(names, values)} {format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    """
+    This class counts events, its values only go up. A counter can also read a count kept somewhere else at every
+    scrape, through a function returning the value, or a value for every tuple of label values.
+    """
+    metric_type = COUNTER_TYPE
+
+    def __init__(self, name, documentation, labelnames=(), registry=None, function=None):
+        """
+        :param: function: returns the value of the counter when it is read, None to count with inc. (Callable)
+        """
+        super().__init__(name, documentation, labelnames, registry)
+        self._values = {}
+        self._function = function
+
+    def inc(self, amount=1, **labels):
+        """
+        :param: amount: how much to add, never negative. (Float)
+        :param: labels: the value of every label of the metric.
+        :return:
+        """
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels):
+        """
+        :return: the current value of the counter. (Float)
+        """
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        values = read_function(self._function) if self._function else self._snapshot()
+        return [("", self.labelnames, key, value) for key, value in sorted(values.items())]
+
+    def _snapshot(self):
+        with self._lock:
+            return dict(self._values)
+
+
+class Gauge(Counter):
+    """
+    This class holds values that go up and down, set directly, moved with inc and dec, or read at every scrape
+    through a function, like the number of uploads of every status.
+    """
+    metric_type = GAUGE_TYPE
+
+    def set(self, value, **labels):
+        """
+        :param: value: the new value. (Float)
+        :param: labels: the value of every label of the metric.
+        :return:
+        """
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def dec(self, amount=1, **labels):
+        """
+        :param: amount: how much to subtract. (Float)
+        :param: labels: the value of every label of the metric.
+        :return:
+        """
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    """
+    This class counts observed values, usually durations in seconds, in cumulative buckets, along with their sum and
+    their count, so the percentiles and the mean of every label set can be computed from the scrapes.
+    """
+    metric_type = HISTOGRAM_TYPE
+
+    def __init__(self, name, documentation, labelnames=(), registry=None, buckets=DEFAULT_BUCKETS):
+        """
+        :param: buckets: the upper bounds of the buckets, in increasing order. (Tuple)
+        """
+        super().__init__(name, documentation, labelnames, registry)
+        self._buckets = tuple(sorted(buckets))
+        self._values = {}
+
+    def observe(self, value, **labels):
+        """
+        :param: value: the observed value. (Float)
+        :param: labels: the value of every label of the metric.
+        :return:
+        """
+        key = self._key(labels)
+        # the last count holds the values above the largest bound
+        index = next((index for index, bound in enumerate(self._buckets) if value <= bound), len(self._buckets))
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self._buckets) + 1), 0.0))
+            counts[index] += 1
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        """
+        This method observes the duration of the block it wraps, in seconds, whether it succeeds or fails.
+        :param: labels: the value of every label of the metric.
+        :return:
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels):
+        """
+        :return: the number of observed values. (Integer)
+        """
+        with self._lock:
+            counts, _ = self._values.get(self._key(labels), ([], 0.0))
+            return sum(counts)
+
+    def samples(self):
+        with self._lock:
+            values = {key: (list(counts), total) for key, (counts, total) in self._values.items()}
+        samples = []
+        bucket_names = self.labelnames + ("le",)
+        for key, (counts, total) in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self._buckets, counts):
+                cumulative += count
+                samples.append(("_bucket", bucket_names, key + (format_value(bound),), cumulative))
+            samples.append(("_bucket", bucket_names, key + ("+Inf",), sum(counts)))
+            samples.append(("_sum", self.labelnames, key, total))
+            samples.append(("_count", self.labelnames, key, sum(counts)))
+        return samples
+
+
+def read_function(function):
+    """
+    :param: function: the function of a metric read at every scrape. (Callable)
+    :return: the value of every tuple of label values, the empty tuple for a metric without labels. (Dictionary)
+    """
+    value = function()
+    if isinstance(value, dict):
+        return {tuple(str(label) for label in key) if isinstance(key, tuple) else (str(key),): sample
+                for key, sample in value.items()}
+    return {(): value}
+
+
+class Registry:
+    """
+    This class holds the metrics of a process and renders all of them for a scrape.
+    """
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        """
+        :param: metric: the metric to expose. (Metric)
+        :return:
+        """
+        with self._lock:
+            self._metrics.append(metric)
+
+    def render(self):
+        """
+        :return: every metric in the Prometheus text format. (Bytes)
+        """
+        with self._lock:
+            metrics = list(self._metrics)
+        return ("\n".join(metric.render() for metric in metrics) + "\n").encode(ENCODING)
+
+
+REGISTRY = Registry()
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """
+    This class answers the scrapes of the '/metrics' path with the metrics of the registry of its server.
+    """
+    def do_GET(self):
+        """
+        Answers a single scrape.
+        :return:
+        """
+        if self.path.split("?")[0] != METRICS_PATH:
+            self.send_error(NOT_FOUND)
+            return
+        payload = self.server.registry.render()
+        self.send_response(OK)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        """
+        Keeps the output of the process clean.
+        :return:
+        """
+
+
+def start_metrics_server(host, port, registry=REGISTRY):
+    """
+    This method serves the metrics of a registry on the '/metrics' path in a background thread, for the processes
+    that have no web server of their own. It raises an OSError if the address could not be bound.
+    :param: host: host to listen on. (String)
+    :param: port: port to listen on. (Integer)
+    :param: registry: the registry to serve. (Registry)
+    :return: the running server. (ThreadingHTTPServer)
+    """
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    server.registry = registry
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
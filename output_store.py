@@ -0,0 +1,236 @@
+import gzip
+import json
+import os
+from sqlalchemy import select
+from handle_db import StoredOutput, Upload
+
+FILES_BACKEND = 'files'
+DATABASE_BACKEND = 'database'
+OUTPUT_STORE_BACKEND = os.environ.get('OUTPUT_STORE_BACKEND', DATABASE_BACKEND)
+OUTPUT_COMPRESSION_LEVEL = int(os.environ.get('OUTPUT_COMPRESSION_LEVEL', 6))
+OUTPUTS_FOLDER = 'outputs'
+OUTPUT_EXTENSION = '.json'
+GZIP_ENCODING = 'gzip'
+ENCODING = 'utf-8'
+JSON_INDENT = 4
+WRITE_BINARY_MODE = 'wb'
+READ_BINARY_MODE = 'rb'
+UNKNOWN_BACKEND = "Unknown output store backend:"
+
+
+def compress(data, compression_level=OUTPUT_COMPRESSION_LEVEL):
+    """
+    This method compresses data with gzip. The header holds no modification time, so the same data is always
+    compressed to the same bytes.
+    :param: data: data to compress. (Bytes)
+    :param: compression_level: gzip compression level, from 1 to 9. (Integer)
+    :return: the gzip member of the data. (Bytes)
+    """
+    return gzip.compress(data, compresslevel=compression_level, mtime=0)
+
+
+def serialize_explanations(slide_explanations):
+    """
+    :param: slide_explanations: the explanation of every slide key. (Dictionary)
+    :return: the compact json object of the explanations. (Bytes)
+    """
+    return json.dumps(slide_explanations, separators=(",", ":")).encode(ENCODING)
+
+
+class FileOutputStore:
+    """
+    This class keeps the explanations of every finished upload in a json file of its own, named after the uid of the
+    upload, in the outputs folder.
+    """
+    def __init__(self, folder=OUTPUTS_FOLDER):
+        """
+        :param: folder: the folder of the json files. (String)
+        """
+        self._folder = folder
+
+    def path(self, upload):
+        """
+        :param: upload: a finished upload. (Upload)
+        :return: path of the json file of the explanations of the upload. (String)
+        """
+        return os.path.join(self._folder, upload.get_output_uid() + OUTPUT_EXTENSION)
+
+    def save(self, session, upload, slide_explanations):
+        """
+        This method writes the explanations of an upload to its json file.
+        :param: session: unused, the file is written right away. (Session)
+        :param: upload: the processed upload. (Upload)
+        :param: slide_explanations: the explanation of every slide key. (Dictionary)
+        :return: where the explanations were saved. (String)
+        """
+        os.makedirs(self._folder, exist_ok=True)
+        output_path = self.path(upload)
+        with open(output_path, WRITE_BINARY_MODE) as file:
+            file.write(json.dumps(slide_explanations, indent=JSON_INDENT).encode(ENCODING))
+        return output_path
+
+    def version(self, session, upload):
+        """
+        :param: session: unused. (Session)
+        :param: upload: a finished upload. (Upload)
+        :return: the modification time of the json file, or None if there is no file. (Integer)
+        """
+        try:
+            return os.stat(self.path(upload)).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def versions(self, session, uploads):
+        """
+        :param: session: unused. (Session)
+        :param: uploads: finished uploads. (List of Upload)
+        :return: the version of every upload, keyed by its uid. (Dictionary)
+        """
+        return {upload.uid: self.version(session, upload) for upload in uploads}
+
+    def read(self, session, upload):
+        """
+        :param: session: unused. (Session)
+        :param: upload: a finished upload. (Upload)
+        :return: the json object of the explanations. (Bytes)
+        """
+        with open(self.path(upload), READ_BINARY_MODE) as file:
+            return file.read()
+
+    def read_compressed(self, session, upload):
+        """
+        :param: session: unused. (Session)
+        :param: upload: a finished upload. (Upload)
+        :return: the gzip compressed json object of the explanations. (Bytes)
+        """
+        return compress(self.read(session, upload))
+
+
+class DatabaseOutputStore:
+    """
+    This class keeps the explanations of every finished upload gzip compressed in the outputs table, keyed by the id
+    of the upload, so the outputs take neither an inode nor an open() each, and the compressed bytes can be sent as
+    they are to the clients that accept gzip. Uploads whose explanations are not in the table yet, for example
+    because they were saved by the file store before, are read from the fallback store.
+    """
+    def __init__(self, fallback=None, compression_level=OUTPUT_COMPRESSION_LEVEL):
+        """
+        :param: fallback: the store of the explanations that are not in the table. (FileOutputStore)
+        :param: compression_level: gzip compression level, from 1 to 9. (Integer)
+        """
+        self._fallback = fallback
+        self._compression_level = compression_level
+
+    def save(self, session, upload, slide_explanations):
+        """
+        This method adds the compressed explanations of an upload to the session, they are committed together with
+        the done status of the upload.
+        :param: session: the session of the upload. (Session)
+        :param: upload: the processed upload. (Upload)
+        :param: slide_explanations: the explanation of every slide key. (Dictionary)
+        :return: where the explanations were saved. (String)
+        """
+        data = serialize_explanations(slide_explanations)
+        session.merge(StoredOutput(upload.id, GZIP_ENCODING, compress(data, self._compression_level), len(data)))
+        return f"{StoredOutput.__tablename__}:{upload.id}"
+
+    def version(self, session, upload):
+        """
+        :param: session: an open database session. (Session)
+        :param: upload: a finished upload. (Upload)
+        :return: the time the explanations were stored, or None if they are found nowhere. (Datetime)
+        """
+        created_time = session.scalar(select(StoredOutput.created_time).filter_by(
+            upload_id=self._output_upload_id(session, upload)))
+        if created_time is None and self._fallback is not None:
+            return self._fallback.version(session, upload)
+        return created_time
+
+    def versions(self, session, uploads):
+        """
+        This method finds the version of many uploads at once, with a query for the uploads whose output they reuse
+        and a query for the stored outputs, instead of a query or two for every upload.
+        :param: session: an open database session. (Session)
+        :param: uploads: finished uploads. (List of Upload)
+        :return: the version of every upload, keyed by its uid, None if its explanations are found nowhere.
+        (Dictionary)
+        """
+        source_uids = {upload.source_uid for upload in uploads if upload.source_uid}
+        source_ids = {}
+        if source_uids:
+            source_ids = dict(session.execute(select(Upload.uid, Upload.id).where(Upload.uid.in_(source_uids))).all())
+        output_ids = {upload.uid: source_ids.get(upload.source_uid) if upload.source_uid else upload.id
+                      for upload in uploads}
+        created_times = {}
+        if output_ids:
+            created_times = dict(session.execute(select(StoredOutput.upload_id, StoredOutput.created_time).where(
+                StoredOutput.upload_id.in_(set(output_ids.values())))).all())
+
+        versions = {}
+        for upload in uploads:
+            version = created_times.get(output_ids[upload.uid])
+            if version is None and self._fallback is not None:
+                version = self._fallback.version(session, upload)
+            versions[upload.uid] = version
+        return versions
+
+    def read(self, session, upload):
+        """
+        :param: session: an open database session. (Session)
+        :param: upload: a finished upload. (Upload)
+        :return: the json object of the explanations. (Bytes)
+        """
+        stored_output = self._load(session, upload)
+        if stored_output is None:
+            return self._fallback.read(session, upload)
+        return gzip.decompress(stored_output.content)
+
+    def read_compressed(self, session, upload):
+        """
+        :param: session: an open database session. (Session)
+        :param: upload: a finished upload. (Upload)
+        :return: the gzip compressed json object of the explanations, as stored. (Bytes)
+        """
+        stored_output = self._load(session, upload)
+        if stored_output is None:
+            return self._fallback.read_compressed(session, upload)
+        return stored_output.content
+
+    def _load(self, session, upload):
+        """
+        :param: session: an open database session. (Session)
+        :param: upload: a finished upload. (Upload)
+        :return: the stored explanations of the upload, or None if they are not in the table. (StoredOutput)
+        :raise: FileNotFoundError if they are not in the table and there is no fallback.
+        """
+        stored_output = session.get(StoredOutput, self._output_upload_id(session, upload))
+        if stored_output is None and self._fallback is None:
+            raise FileNotFoundError(f"{StoredOutput.__tablename__}:{upload.id}")
+        return stored_output
+
+    @staticmethod
+    def _output_upload_id(session, upload):
+        """
+        :param: session: an open database session. (Session)
+        :param: upload: a finished upload. (Upload)
+        :return: the id of the upload the explanations are stored under, which is the upload itself, or the identical
+        upload it reuses. (Integer)
+        """
+        if upload.source_uid:
+            return session.scalar(select(Upload.id).filter_by(uid=upload.source_uid))
+        return upload.id
+
+
+def create_output_store(backend=OUTPUT_STORE_BACKEND, folder=OUTPUTS_FOLDER):
+    """
+    This method creates the output store of the given backend, the database store falls back to the json files of
+    the folder for the outputs that were not imported into the database.
+    :param: backend: 'database' or 'files'. (String)
+    :param: folder: the folder of the json files. (String)
+    :return: the output store. (DatabaseOutputStore or FileOutputStore)
+    """
+    if backend == DATABASE_BACKEND:
+        return DatabaseOutputStore(fallback=FileOutputStore(folder))
+    if backend == FILES_BACKEND:
+        return FileOutputStore(folder)
+    raise ValueError(f"{UNKNOWN_BACKEND} {backend}")
@@ -1,20 +1,31 @@
+import multiprocessing
 import shutil
-from sqlalchemy.orm import Session
-from pptx import Presentation
+import socket
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from sqlalchemy import select, func, or_
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session, object_session
 import openai
-import json
 import os
 import re
 import asyncio
-from handle_db import Upload, engine
+from handle_db import Upload, SlideExplanation, engine, claim_upload, claimable_uploads, renew_leases, \
+    save_slide_explanation, database_now, fail_abandoned_upload, prepare_database
+from job_scheduler import schedule_uploads
+from presentation_context import PresentationContext, SYSTEM_PROMPT, estimate_tokens, CONTENT_FIELD
+from explanation_cache import ExplanationCache, HITS_FIELD, MISSES_FIELD
+from job_notifier import JobNotificationListener, start_listener, notify_progress
+from rate_limiter import AdaptiveRateLimiter
+from slide_batcher import plan_batches, build_batch_messages, parse_batch_response
+from output_store import create_output_store
+from slide_text_extractor import extract_texts_timed, XML_EXTRACTION_ENGINE
+from metrics import Counter, Gauge, Histogram, start_metrics_server
 
 openai.api_key = os.environ.get('API_KEY')
-CONTENT = [
-    {"role": "system", "content": "Can you explain the slides in basic english, and provide examples if needed!"}
-]
 ERROR_MESSAGE = "Something is wrong:"
 ENGINE_MODEL = "gpt-3.5-turbo"
-WRITE_TO_FILE_MODE = 'w'
 UPLOADS_FOLDER = 'uploads'
 OUTPUTS_FOLDER = 'outputs'
 PROCESSED_FOLDER = 'processed'
@@ -22,22 +33,246 @@ EXPLANATION_SAVED = "Explanations saved to"
 EXPLANATION_SAVED_ERROR = "Error saving explanations:"
 PATH_NOT_FOUND = "the path you provided does not exist."
 PROCESS_SLIDE_ERROR = "Error processing slide:"
+BATCH_FALLBACK = "Could not split the batched explanation, explaining the slides one by one:"
 MOVED_FILE = "Moved file:"
 PROCESSING_FILE = "Processing file:"
 DONE_STATUS = 'done'
 PROCESSING_STATUS = 'processing'
 PENDING_STATUS = 'pending'
+FAILED_STATUS = 'failed'
 PROCESS_FILE_ERROR = "Error processing file"
 EXPLAINER_STARTED_MESSAGE = "Explainer started."
 CHOICES = "choices"
 FIRST_ELEMENT = 0
+SLIDE_CONCURRENCY = int(os.environ.get('SLIDE_CONCURRENCY', 5))
+WORKER_CONCURRENCY = int(os.environ.get('WORKER_CONCURRENCY', 3))
+# the scheduler chooses among the first claimable uploads of every user only, highest priority then oldest first,
+# which bounds the cost of every claim without a user with a long queue hiding the uploads of the others. A claim
+# never takes more than WORKER_CONCURRENCY uploads, so a short window is enough to choose the short decks from
+SCHEDULER_USER_WINDOW = int(os.environ.get('SCHEDULER_USER_WINDOW', 20))
+# an explainer holds a lease on every upload it processes and renews it every LEASE_RENEW_INTERVAL seconds, the
+# uploads of an explainer that stopped renewing for LEASE_SECONDS are claimed by the others
+LEASE_SECONDS = int(os.environ.get('LEASE_SECONDS', 60))
+LEASE_RENEW_INTERVAL = LEASE_SECONDS / 3
+# unique to every explainer sharing the database, and stable across the restarts of an explainer: on startup an
+# explainer only queues again the uploads leased under its own WORKER_ID. The default holds the process id, which
+# changes on every restart, so the uploads a restarted explainer was processing wait for their leases to expire
+WORKER_ID = os.environ.get('EXPLAINER_WORKER_ID', f"{socket.gethostname()}-{os.getpid()}")
+WORKER_ID_NOT_SET = "EXPLAINER_WORKER_ID is not set, the uploads interrupted by a restart resume once their " \
+                    "leases expire, running as"
+# an upload that failed, or whose explainer stopped, that many times is failed for good instead of being retried
+MAX_UPLOAD_ATTEMPTS = int(os.environ.get('MAX_UPLOAD_ATTEMPTS', 3))
+MAX_INFLIGHT_REQUESTS = int(os.environ.get('MAX_INFLIGHT_REQUESTS', 10))
+# the model rate limiter starts with that many requests in flight, it halves them on a rate limit error and grows
+# them back after the successful requests, never above MAX_INFLIGHT_REQUESTS. Set it lower to start slowly
+INITIAL_INFLIGHT_REQUESTS = int(os.environ.get('INITIAL_INFLIGHT_REQUESTS', MAX_INFLIGHT_REQUESTS))
+MODEL_REQUEST_TIMEOUT = float(os.environ.get('MODEL_REQUEST_TIMEOUT', 60))
+EXTRACTION_ENGINE = os.environ.get('EXTRACTION_ENGINE', XML_EXTRACTION_ENGINE)
+EXTRACT_GROUP_SHAPES = bool(int(os.environ.get('EXTRACT_GROUP_SHAPES', 0)))
+EXTRACT_TABLES = bool(int(os.environ.get('EXTRACT_TABLES', 0)))
+EXTRACT_NOTES = bool(int(os.environ.get('EXTRACT_NOTES', 0)))
+EXTRACTION_PROCESSES = int(os.environ.get('EXTRACTION_PROCESSES', min(WORKER_CONCURRENCY, os.cpu_count() or 1)))
+# the processes of the extraction pool are never forked from the explainer, whose threads may hold locks. With
+# forkserver, the default where it is available, the main module is imported once by the server process, and the
+# workers are forked from it, with spawn every worker imports the main module, and so its database setup, itself
+EXTRACTION_START_METHOD = os.environ.get('EXTRACTION_START_METHOD', 'forkserver' if 'forkserver' in
+                                         multiprocessing.get_all_start_methods() else 'spawn')
+EXTRACTION_POOL_BROKEN = "The extraction process pool broke, starting a new one:"
+# only one explainer per host receives the upload notifications, the others find the new uploads with this scan
+FALLBACK_SCAN_INTERVAL = float(os.environ.get('FALLBACK_SCAN_INTERVAL', 60))
+LISTENER_ERROR = "Could not listen for upload notifications, falling back to periodic scans:"
+UPDATE_STATUS_ERROR = "Error updating the status of upload"
+CACHE_STATS = "Explanation cache:"
+CACHE_INVALIDATED = "Invalidated stale cache entries:"
+CACHE_ENTRIES = "Explanation cache entries:"
+CACHE_ERROR_MESSAGE = "The explanation cache failed, going on without it:"
+TOKENS_USED = "Tokens used:"
+UPLOADS_RECOVERED = "Interrupted uploads queued again:"
+UPLOAD_FAILED = "Failed for good after too many attempts, upload"
+LEASE_LOST = "Lost the lease of upload"
+LEASE_RENEW_ERROR = "Could not renew the leases:"
+WORKER_METRICS_HOST = os.environ.get('WORKER_METRICS_HOST', '127.0.0.1')
+WORKER_METRICS_PORT = int(os.environ.get('WORKER_METRICS_PORT', 5057))
+METRICS_SERVER_STARTED = "Serving metrics on"
+METRICS_SERVER_ERROR = "Could not serve metrics:"
+USAGE = "usage"
+PROMPT_TOKENS = "prompt_tokens"
+COMPLETION_TOKENS = "completion_tokens"
+PROMPT_KIND = 'prompt'
+COMPLETION_KIND = 'completion'
+QUEUE_WAIT_STAGE = 'queue_wait'
+DECK_LOAD_STAGE = 'deck_load'
+TEXT_EXTRACTION_STAGE = 'text_extraction'
+MODEL_CALL_STAGE = 'model_call'
+CLEAN_TEXT_STAGE = 'clean_text'
+SAVE_STAGE = 'save'
+MOVE_STAGE = 'move'
+SLIDE_ERROR = 'slide'
+BATCH_ERROR = 'batch'
+FILE_ERROR = 'file'
+SAVE_ERROR = 'save'
+CACHE_ERROR = 'cache'
+STATUS_UPDATE_ERROR = 'status_update'
+MODEL_SOURCE = 'model'
+CACHE_SOURCE = 'cache'
+CHECKPOINT_SOURCE = 'checkpoint'
+DONE_RESULT = 'done'
+FAILED_RESULT = 'failed'
+HIT_RESULT = 'hit'
+MISS_RESULT = 'miss'
+EXPLANATION_CACHE = ExplanationCache(engine, ENGINE_MODEL, SYSTEM_PROMPT)
+OUTPUT_STORE = create_output_store(folder=OUTPUTS_FOLDER)
+# the process pool the decks are loaded and parsed in, started on the first extraction
+extraction_executor = None
+# shared by every file processed by the worker, paces and retries the model requests of all decks, and never lets
+# more than MAX_INFLIGHT_REQUESTS of them in flight
+MODEL_RATE_LIMITER = AdaptiveRateLimiter(initial_concurrency=INITIAL_INFLIGHT_REQUESTS,
+                                         max_concurrency=MAX_INFLIGHT_REQUESTS)
+# the metrics of the worker, served on WORKER_METRICS_PORT, the number of uploads of every status is served by the
+# web API, so it is counted once however many workers run
+STAGE_SECONDS = Histogram('explainer_stage_seconds', "Seconds spent in every stage of the processing of an upload.",
+                          ('stage',))
+SLIDES_EXPLAINED = Counter('explainer_slides_total', "Slides explained, by the source of the explanation.",
+                           ('source',))
+MODEL_TOKENS = Counter('explainer_model_tokens_total', "Tokens of the model requests, by kind.", ('kind',))
+SLIDES_SPLIT = Counter('explainer_slides_split_total', "Slides too long for a single request, explained in parts.")
+ERRORS = Counter('explainer_errors_total', "Errors of the explainer, by the stage they happened in.", ('stage',))
+UPLOADS_PROCESSED = Counter('explainer_uploads_processed_total', "Uploads processed, by result.", ('result',))
+UPLOADS_FAILED = Counter('explainer_uploads_failed_total', "Uploads failed for good after too many attempts.")
+UPLOADS_PROCESSING = Gauge('explainer_uploads_processing', "Uploads processed by the worker right now.")
+CLAIM_CONFLICTS = Counter('explainer_claim_conflicts_total', "Uploads claimed by another explainer first.")
+LEASES_RECLAIMED = Counter('explainer_leases_reclaimed_total', "Uploads claimed after the lease of another explainer "
+                                                                "expired.")
+LEASES_LOST = Counter('explainer_leases_lost_total', "Uploads claimed by another explainer while they were processed.")
+MODEL_REQUESTS = Counter('explainer_model_requests_total', "Model requests sent, retries included.",
+                         function=lambda: MODEL_RATE_LIMITER.requests)
+MODEL_RETRIES = Counter('explainer_model_retries_total', "Model requests retried after a transient failure.",
+                        function=lambda: MODEL_RATE_LIMITER.retries)
+MODEL_THROTTLED = Counter('explainer_model_throttled_total', "Model requests answered with a rate limit.",
+                          function=lambda: MODEL_RATE_LIMITER.throttled)
+MODEL_FAILURES = Counter('explainer_model_failures_total', "Model requests that failed for good.",
+                         function=lambda: MODEL_RATE_LIMITER.failures)
+MODEL_IN_FLIGHT = Gauge('explainer_model_requests_in_flight', "Model requests in flight.",
+                        function=lambda: MODEL_RATE_LIMITER.in_flight)
+MODEL_CONCURRENCY_LIMIT = Gauge('explainer_model_concurrency_limit', "Current concurrency limit of the model requests.",
+                                function=lambda: MODEL_RATE_LIMITER.concurrency_limit)
 
 
-async def parse_presentation(presentation_path):
+def read_cache_lookups():
+    """
+    :return: the hits and misses of the explanation cache. (Dictionary)
+    """
+    stats = EXPLANATION_CACHE.stats()
+    return {HIT_RESULT: stats[HITS_FIELD], MISS_RESULT: stats[MISSES_FIELD]}
+
+
+CACHE_LOOKUPS = Counter('explainer_cache_lookups_total', "Lookups of the explanation cache, by result.", ('result',),
+                        function=read_cache_lookups)
+
+
+class SlideProgress:
+    """
+    This class records the progress of an upload while its slides are being explained. The number of slides is saved
+    on the upload as soon as it is known, and the explanation of every slide is committed as soon as it is done, each
+    in a short session of its own, so the web API can report the finished slides while the rest are still explained.
+    The slides explained by a single request are committed together. The web API is notified after every change, to
+    answer the clients waiting on the upload.
+    The explanations committed also serve as checkpoints: if the explainer stopped in the middle of the upload, the
+    slides explained before are read back instead of being explained again.
+    """
+    def __init__(self, upload_id, uid):
+        """
+        :param: upload_id: id of the upload being processed (Integer)
+        :param: uid: uid of the upload being processed (String)
+        """
+        self._upload_id = upload_id
+        self._uid = uid
+
+    def start(self, slides_total):
+        """
+        This method saves the number of slides of the upload.
+        :param: slides_total: number of slides in the presentation (Integer)
+        :return:
+        """
+        with Session(engine) as session:
+            session.query(Upload).filter_by(id=self._upload_id).update({Upload.slides_total: slides_total})
+            session.commit()
+        notify_progress(self._uid)
+
+    def load_checkpoints(self):
+        """
+        This method reads the explanations of the slides already explained by an earlier, interrupted, run of the
+        upload. The slides that failed are dropped, so they are explained again.
+        :return: the explanation of every slide number already explained (Dictionary)
+        """
+        with Session(engine) as session:
+            checkpoints = session.query(SlideExplanation).filter_by(upload_id=self._upload_id).all()
+            explanations = {}
+            for checkpoint in checkpoints:
+                if checkpoint.explanation.startswith(ERROR_MESSAGE):
+                    session.delete(checkpoint)
+                else:
+                    explanations[checkpoint.slide_number] = checkpoint.explanation
+            session.commit()
+        return explanations
+
+    def slide_done(self, slide_number, explanation):
+        """
+        This method saves the explanation of a single slide, unless another explainer claimed the upload in the
+        meantime.
+        :param: slide_number: number of the slide, starting from 1 (Integer)
+        :param: explanation: the explanation of the slide (String)
+        :return:
+        """
+        self.slides_done({slide_number: explanation})
+
+    def slides_done(self, explanations):
+        """
+        This method saves the explanations of several slides in a single commit, unless another explainer claimed the
+        upload in the meantime.
+        :param: explanations: the explanation of every slide number done (Dictionary)
+        :return:
+        """
+        with Session(engine) as session:
+            for slide_number, explanation in explanations.items():
+                save_slide_explanation(session, self._upload_id, slide_number, explanation, WORKER_ID)
+            session.commit()
+        notify_progress(self._uid)
+
+
+class TokenUsage:
+    """
+    This class adds up the tokens of the model requests of a single upload, as counted by the API, or counted locally
+    if the answer does not say.
+    """
+    def __init__(self):
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    def add(self, prompt_tokens, completion_tokens):
+        """
+        :param: prompt_tokens: tokens of the messages of a request. (Integer)
+        :param: completion_tokens: tokens of its answer. (Integer)
+        :return:
+        """
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+
+
+async def parse_presentation(presentation_path, concurrency=SLIDE_CONCURRENCY, progress=None, usage=None):
     """
     This method receives a path for a pptx presentation, checks if the path is found in the operating system, if so,
-    parses the data to slides. The method, returns a list of explanations.
+    parses the data to slides. Slides already in the explanation cache are served from it, consecutive short slides
+    are packed into shared requests, and the requests are sent concurrently, at most 'concurrency' requests of the
+    same deck at once. The explanations are returned in the order of the slides. If a progress is given it is told
+    the number of slides, and every explanation as soon as it is done, and the slides it already holds the
+    explanation of, from an interrupted run of the upload, are not explained again. A slide too long for a single
+    request is explained in parts, one request after the other. The progress is recorded, and the cache read, in the
+    default executor, so their commits do not hold up the event loop.
     :param: presentation_path: path of a power-point presentation. (String)
+    :param: concurrency: maximum number of requests of the deck sent at the same time. (Integer)
+    :param: progress: optional recorder of the finished slides. (SlideProgress)
+    :param: usage: optional tally of the tokens of the requests. (TokenUsage)
     :return: list of explanations. (List of strings)
     """
     # check if path is available
@@ -45,63 +280,283 @@ async def parse_presentation(presentation_path):
         print(f"{ERROR_MESSAGE} {PATH_NOT_FOUND}")
         return []
 
-    prs = Presentation(presentation_path)
-    explanations = []
-    for slide in prs.slides:
-        explanation = await parse_slide_of_pptx(slide)
-        explanations.append(explanation)
+    context = PresentationContext(await extract_texts_in_pool(presentation_path))
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    loop = asyncio.get_running_loop()
+    checkpoints = {}
+    if progress is not None:
+        await loop.run_in_executor(None, progress.start, len(context))
+        checkpoints = await loop.run_in_executor(None, progress.load_checkpoints)
+    explanations = [None] * len(context)
+
+    async def record_explanations(slide_explanations):
+        for slide_index, explanation in slide_explanations.items():
+            explanations[slide_index] = explanation
+        if progress is not None:
+            await loop.run_in_executor(None, progress.slides_done, {
+                slide_index + 1: explanation for slide_index, explanation in slide_explanations.items()})
+
+    unexplained_slides = []
+    for slide_index in range(len(context)):
+        if slide_index + 1 in checkpoints:
+            explanations[slide_index] = checkpoints[slide_index + 1]
+            SLIDES_EXPLAINED.inc(source=CHECKPOINT_SOURCE)
+        else:
+            unexplained_slides.append(slide_index)
+    uncached_slides = []
+    cached_explanations = {}
+    lookups = await loop.run_in_executor(None, read_cached_explanations,
+                                         [context.slide_text(slide_index) for slide_index in unexplained_slides])
+    for slide_index, cached_explanation in zip(unexplained_slides, lookups):
+        if cached_explanation is None:
+            uncached_slides.append(slide_index)
+        else:
+            cached_explanations[slide_index] = cached_explanation
+    if cached_explanations:
+        await record_explanations(cached_explanations)
+        SLIDES_EXPLAINED.inc(len(cached_explanations), source=CACHE_SOURCE)
+
+    async def explain_slide(slide_index):
+        async with semaphore:
+            explanation = await parse_slide_of_pptx(context, slide_index, usage)
+        await record_explanations({slide_index: explanation})
+        SLIDES_EXPLAINED.inc(source=MODEL_SOURCE)
+
+    async def explain_batch(batch):
+        if len(batch) == 1:
+            await explain_slide(batch[0])
+            return
+
+        async with semaphore:
+            batch_explanations = await parse_slides_of_pptx(context, batch, usage)
+        if batch_explanations is None:
+            await asyncio.gather(*(explain_slide(slide_index) for slide_index in batch))
+            return
+        await record_explanations(batch_explanations)
+        SLIDES_EXPLAINED.inc(len(batch_explanations), source=MODEL_SOURCE)
+
+    await asyncio.gather(*(explain_batch(batch) for batch in plan_batches(context, uncached_slides)))
     return explanations
 
 
-async def parse_slide_of_pptx(slide):
+def read_cached_explanations(slide_texts):
+    """
+    This method looks the slides of a deck up in the explanation cache, with a single query. It blocks on the
+    database, so it is called in an executor. The cache only saves requests, so an error of its database is logged
+    and counted, and the slides are explained as if they were not cached.
+    :param: slide_texts: texts of the slides. (List of strings)
+    :return: the cached explanation of every slide, in the same order, None for the slides not cached. (List)
+    """
+    try:
+        return EXPLANATION_CACHE.get_many(slide_texts)
+    except SQLAlchemyError as error:
+        ERRORS.inc(stage=CACHE_ERROR)
+        print(f"{CACHE_ERROR_MESSAGE} {str(error)}")
+        return [None] * len(slide_texts)
+
+
+def store_cached_explanations(explanations):
+    """
+    This method adds the explanations of the slides of a request to the explanation cache, with a single commit. It
+    blocks on the database, so it is called in an executor. The explanations were paid for already, so an error of
+    the cache is logged and counted, and never fails the slides.
+    :param: explanations: the cleaned explanation of every slide text. (Dictionary)
+    :return:
+    """
+    try:
+        EXPLANATION_CACHE.put_many(explanations)
+    except SQLAlchemyError as error:
+        ERRORS.inc(stage=CACHE_ERROR)
+        print(f"{CACHE_ERROR_MESSAGE} {str(error)}")
+
+
+async def cache_explanations(explanations):
     """
-    This method receives a single slide, the method parses the data on that slide, it calls another method to get the
-    response and return it to the parse_presentation method. It throws an error if an exception occurred.
-    :param: slide: A single slide from the power-point. (slide object)
+    This method adds the explanations of the slides of a request to the explanation cache in the default executor,
+    so a locked cache table does not hold up the other decks.
+    :param: explanations: the cleaned explanation of every slide text. (Dictionary)
+    :return:
+    """
+    await asyncio.get_running_loop().run_in_executor(None, store_cached_explanations, explanations)
+
+
+def get_extraction_executor():
+    """
+    This method returns the process pool of the extractions, and starts it on the first call, with the
+    EXTRACTION_START_METHOD start method.
+    :return: the process pool, or None if EXTRACTION_PROCESSES is 0. (ProcessPoolExecutor)
+    """
+    global extraction_executor
+    if extraction_executor is None and EXTRACTION_PROCESSES > 0:
+        extraction_executor = ProcessPoolExecutor(max_workers=EXTRACTION_PROCESSES,
+                                                  mp_context=multiprocessing.get_context(EXTRACTION_START_METHOD))
+    return extraction_executor
+
+
+def shutdown_extraction_executor():
+    """
+    This method stops the process pool of the extractions, if it was started.
+    :return:
+    """
+    global extraction_executor
+    if extraction_executor is not None:
+        extraction_executor.shutdown(cancel_futures=True)
+        extraction_executor = None
+
+
+async def extract_texts_in_pool(presentation_path):
+    """
+    This method extracts the text of the slides of a presentation with the configured engine, outside of the event
+    loop, so the model requests of the other files keep flowing while a large deck is parsed. The deck is loaded and
+    parsed in a process of the extraction pool and only the plain text of the slides is sent back, several decks are
+    parsed on several cores at once. With EXTRACTION_PROCESSES set to 0 the deck is parsed in a thread instead.
+    If a process of the pool died, the pool is replaced for the next files and the error is raised. The time spent
+    loading the deck and extracting its text in the pool are recorded apart.
+    :param: presentation_path: path of a power-point presentation. (String)
+    :return: the text of every slide, in the order of the slides. (List of strings)
+    """
+    global extraction_executor
+    executor = get_extraction_executor()
+    loop = asyncio.get_running_loop()
+    try:
+        slide_texts, load_seconds, extraction_seconds = await loop.run_in_executor(
+            executor, extract_texts_timed, presentation_path, EXTRACTION_ENGINE, EXTRACT_GROUP_SHAPES,
+            EXTRACT_TABLES, EXTRACT_NOTES)
+    except BrokenProcessPool as error:
+        print(f"{EXTRACTION_POOL_BROKEN} {str(error)}")
+        if extraction_executor is executor:
+            extraction_executor = None
+            executor.shutdown(wait=False)
+        raise
+    STAGE_SECONDS.observe(load_seconds, stage=DECK_LOAD_STAGE)
+    STAGE_SECONDS.observe(extraction_seconds, stage=TEXT_EXTRACTION_STAGE)
+    return slide_texts
+
+
+async def parse_slide_of_pptx(context, slide_index, usage=None):
+    """
+    This method receives the context of a presentation and the index of a single slide, it calls another method to get
+    the response and return it to the parse_presentation method. It throws an error if an exception occurred.
+    :param: context: the conversation context of the presentation. (PresentationContext)
+    :param: slide_index: zero based index of the slide in the deck. (Integer)
+    :param: usage: optional tally of the tokens of the requests. (TokenUsage)
     :return: The explanation if the processing went well, an error, otherwise. (List of Strings)
     """
     try:
-        response = await request_completion(slide)
+        response = await request_completion(context, slide_index, usage)
         return response
     except Exception as error:
+        ERRORS.inc(stage=SLIDE_ERROR)
         error_message = f"{ERROR_MESSAGE} {PROCESS_SLIDE_ERROR} {str(error)}"
         return error_message
 
 
-def parse_text_of_slide(slide):
+async def parse_slides_of_pptx(context, batch, usage=None):
     """
-    This method receives a slide, and extracts all the extractable text found in that slide. In addition, it cleans
-    the data using the strip function.
-    :param: slide: A single slide from the power-point. (Slide Object)
-    :return: Explanation response. (String)
+    This method receives the context of a presentation and a batch of consecutive short slides, and explains all of
+    them with a single request. If the request fails, or its answer can not be split reliably into one explanation
+    per slide, it returns None so the slides are explained one by one instead.
+    :param: context: the conversation context of the presentation. (PresentationContext)
+    :param: batch: zero based indexes of the slides. (List of integers)
+    :param: usage: optional tally of the tokens of the requests. (TokenUsage)
+    :return: the explanation of every slide index, or None. (Dictionary)
     """
-    slide_text = []
-    for shape in slide.shapes:
-        if not shape.has_text_frame:
-            continue
-        for paragraph in shape.text_frame.paragraphs:
-            for run in paragraph.runs:
-                slide_text.append(run.text.strip())
-    return " ".join(slide_text)
+    try:
+        explanations = await request_batch_completion(context, batch, usage)
+    except Exception as error:
+        ERRORS.inc(stage=BATCH_ERROR)
+        explanations = None
+        print(f"{BATCH_FALLBACK} {str(error)}")
+    return explanations
 
 
-async def request_completion(slide):
+async def request_completion(context, slide_index, usage=None):
     """
-    This method receives a slide object, sends a request to the openai API asking the server to explain the content
-    of that slide, the method returns the response from the API.
-    :param: slide: Slide: a single slide from the power-point. (Slide Object)
+    This method receives the context of a presentation and the index of a slide, sends a request to the openai API
+    asking the server to explain the content of that slide, along with a bounded window of the slides preceding it.
+    Requests go through the shared rate limiter, which retries transient failures, and the explanation is added to
+    the explanation cache. The method returns the response from the API.
+    A slide too long to fit the context window of the model along with its answer is split into parts, and the
+    explanations of the parts are joined, instead of sending a request bound to fail.
+    :param: context: the conversation context of the presentation. (PresentationContext)
+    :param: slide_index: zero based index of the slide in the deck. (Integer)
+    :param: usage: optional tally of the tokens of the requests. (TokenUsage)
     :return: Response of the API.
     """
-    CONTENT.append({"role": "user", "content": parse_text_of_slide(slide)})
-    response = await openai.ChatCompletion.acreate(
-        model=ENGINE_MODEL,
-        messages=CONTENT
-    )
-    content = response[CHOICES][FIRST_ELEMENT].message.content
-    cleaned_content = clean_text(content)
+    slide_text = context.slide_text(slide_index)
+    if context.is_oversized(slide_index):
+        SLIDES_SPLIT.inc()
+        explanations = [clean_text(await send_request(messages, usage))
+                        for messages in context.part_messages_for(slide_index)]
+        cleaned_content = " ".join(explanations)
+    else:
+        cleaned_content = clean_text(await send_request(context.messages_for(slide_index), usage))
+    await cache_explanations({slide_text: cleaned_content})
     return cleaned_content
 
 
+async def send_request(messages, usage=None):
+    """
+    This method sends a single request to the openai API through the shared rate limiter, and counts its tokens.
+    :param: messages: chat messages of the request. (List of dictionaries)
+    :param: usage: optional tally of the tokens of the requests. (TokenUsage)
+    :return: the content of the answer. (String)
+    """
+    with STAGE_SECONDS.time(stage=MODEL_CALL_STAGE):
+        response = await MODEL_RATE_LIMITER.call(lambda: openai.ChatCompletion.acreate(
+            model=ENGINE_MODEL,
+            messages=messages,
+            request_timeout=MODEL_REQUEST_TIMEOUT
+        ))
+    content = response[CHOICES][FIRST_ELEMENT].message.content
+    count_tokens(response, messages, content, usage)
+    return content
+
+
+async def request_batch_completion(context, batch, usage=None):
+    """
+    This method receives the context of a presentation and a batch of slides, sends a single request to the openai
+    API asking for a structured answer with the explanation of every slide, and splits the answer back per slide.
+    The explanations are added to the explanation cache.
+    :param: context: the conversation context of the presentation. (PresentationContext)
+    :param: batch: zero based indexes of the slides. (List of integers)
+    :param: usage: optional tally of the tokens of the requests. (TokenUsage)
+    :return: the explanation of every slide index, or None if the answer could not be split. (Dictionary)
+    """
+    answers = parse_batch_response(await send_request(build_batch_messages(context, batch), usage), batch)
+    if answers is None:
+        print(f"{BATCH_FALLBACK} {batch}")
+        return None
+
+    explanations = {slide_index: clean_text(answer) for slide_index, answer in answers.items()}
+    await cache_explanations({context.slide_text(slide_index): explanation
+                              for slide_index, explanation in explanations.items()})
+    return explanations
+
+
+def count_tokens(response, messages, content, usage=None):
+    """
+    This method adds the tokens of a model request to the MODEL_TOKENS counter and to the tally of its upload, as
+    counted by the API, or counted locally if the response does not say.
+    :param: response: Response of the API.
+    :param: messages: chat messages of the request. (List of dictionaries)
+    :param: content: the content of the answer. (String)
+    :param: usage: optional tally of the tokens of the requests. (TokenUsage)
+    :return:
+    """
+    response_usage = response.get(USAGE) or {}
+    prompt_tokens = response_usage.get(PROMPT_TOKENS)
+    if prompt_tokens is None:
+        prompt_tokens = sum(estimate_tokens(message[CONTENT_FIELD]) for message in messages)
+    completion_tokens = response_usage.get(COMPLETION_TOKENS)
+    if completion_tokens is None:
+        completion_tokens = estimate_tokens(content)
+    MODEL_TOKENS.inc(prompt_tokens, kind=PROMPT_KIND)
+    MODEL_TOKENS.inc(completion_tokens, kind=COMPLETION_KIND)
+    if usage is not None:
+        usage.add(prompt_tokens, completion_tokens)
+
+
 def clean_text(text):
     """
     This method receives the response retrieved from the openai API and cleans it, in other words, gets rid of
@@ -109,22 +564,22 @@ def clean_text(text):
     :param: text: Response from API. (string)
     :return: clean Version of the response. (string)
     """
-    cleaned_text = re.sub(r"\n", "", text)
-    cleaned_text = cleaned_text.encode("ascii", "ignore").decode("utf-8")
-    return cleaned_text.strip()
+    with STAGE_SECONDS.time(stage=CLEAN_TEXT_STAGE):
+        cleaned_text = re.sub(r"\n", "", text)
+        cleaned_text = cleaned_text.encode("ascii", "ignore").decode("utf-8")
+        return cleaned_text.strip()
 
 
-def save_explanations(explanations, file_path):
+def save_explanations(explanations, file_processing):
     """
-    This method receives a list of strings, each string representing an explanation. It creates a JSON file and appends
-    the explanations to the file, using the original file name.
+    This method receives a list of strings, each string representing an explanation. It builds a JSON object of the
+    explanations keyed by slide, and saves it to the OUTPUT_STORE under the upload being processed, either as a json
+    file or compressed in the database, depending on OUTPUT_STORE_BACKEND. An error saving the output is logged and
+    raised again, so the upload is not marked done without its output.
     :param: explanations: List of explanations retrieved from the API. (List of strings)
-    :param: file_path: Path of the original file. (String)
+    :param: file_processing: upload object representing the file being processed (Upload)
     :return:
     """
-    file_name = os.path.basename(file_path)
-    presentation_name, extension = os.path.splitext(file_name)
-    output_file = os.path.join(OUTPUTS_FOLDER, f"{presentation_name}.json")
     slide_explanations = {}
 
     for slide_num, explanation in enumerate(explanations, start=1):
@@ -132,14 +587,13 @@ def save_explanations(explanations, file_path):
         slide_explanations[slide_key] = explanation
 
     try:
-        if not os.path.exists(OUTPUTS_FOLDER):
-            os.makedirs(OUTPUTS_FOLDER)
-
-        with open(output_file, WRITE_TO_FILE_MODE) as file:
-            json.dump(slide_explanations, file, indent=4)
-        print(f"{EXPLANATION_SAVED} {output_file}")
-    except IOError as error:
+        with STAGE_SECONDS.time(stage=SAVE_STAGE):
+            output = OUTPUT_STORE.save(object_session(file_processing), file_processing, slide_explanations)
+        print(f"{EXPLANATION_SAVED} {output}")
+    except (IOError, SQLAlchemyError) as error:
+        ERRORS.inc(stage=SAVE_ERROR)
         print(f"{EXPLANATION_SAVED_ERROR} {str(error)}")
+        raise
 
 
 def move_file(file_path, destination_folder):
@@ -154,57 +608,379 @@ def move_file(file_path, destination_folder):
     file_name = os.path.basename(file_path)
     destination_path = os.path.join(destination_folder, file_name)
 
-    if not os.path.exists(destination_folder):
-        os.makedirs(destination_folder)
+    with STAGE_SECONDS.time(stage=MOVE_STAGE):
+        if not os.path.exists(destination_folder):
+            os.makedirs(destination_folder)
 
-    shutil.move(file_path, destination_path)
+        shutil.move(file_path, destination_path)
     print(f"{MOVED_FILE} {file_path} to {destination_path}")
 
 
-async def process_file(file_path, file_processing):
+async def process_file(file_path, upload_id, uid):
     """
-    This method receives a file_path, calls the needed functions to explain the contents of the power-point, save and
-    moves the processed file. it throws an exception if it could not process a file.
-    :param: file_processing: upload object representing the file being processed (Upload)
+    This method receives a file_path and explains the contents of the power-point. The explanations of the slides
+    are recorded one by one while the file is processed, and dropped only once the whole output is saved, so a file
+    whose output could not be saved is resumed from them. It logs and counts the error if it could not explain the
+    file.
     :param: file_path: a file path from the 'uploads' folder (string)
-    :return:
+    :param: upload_id: id of the upload being processed (Integer)
+    :param: uid: uid of the upload being processed (String)
+    :return: the explanations and the tokens of their requests, or None if the file failed (Tuple)
     """
     print(f"{PROCESSING_FILE} {file_path}")
     try:
-        explanations = await parse_presentation(file_path)
-        save_explanations(explanations, file_path)
+        usage = TokenUsage()
+        explanations = await parse_presentation(file_path, progress=SlideProgress(upload_id, uid), usage=usage)
+        return explanations, usage
+    except Exception as error:
+        count_file_error(error)
+        return None
+
+
+def complete_file(file_path, file_processing, explanations, usage):
+    """
+    This method saves the explanations of a file, moves the processed file and marks its upload done. The tokens of
+    the requests of the file, and the number of slides that could not be explained, are saved with the upload. It
+    blocks on the database and the disk, so it is called in an executor. It logs and counts the error if it could
+    not save the file.
+    :param: file_path: a file path from the 'uploads' folder (string)
+    :param: file_processing: upload object representing the file being processed (Upload)
+    :param: explanations: the explanation of every slide (List of strings)
+    :param: usage: the tokens of the requests of the file (TokenUsage)
+    :return: True if the file was saved, False if it failed (Boolean)
+    """
+    try:
+        file_processing.set_token_usage(usage.prompt_tokens, usage.completion_tokens)
+        print(f"{TOKENS_USED} {usage.prompt_tokens} prompt, {usage.completion_tokens} completion")
+        file_processing.set_slides_failed(sum(explanation.startswith(ERROR_MESSAGE) for explanation in explanations))
+        save_explanations(explanations, file_processing)
         move_file(file_path, PROCESSED_FOLDER)
 
         file_processing.set_file_status(DONE_STATUS)
         file_processing.set_upload_finish_time()
+        file_processing.slide_explanations.clear()
+        UPLOADS_PROCESSED.inc(result=DONE_RESULT)
+        print(f"{CACHE_STATS} {EXPLANATION_CACHE.stats()}")
+        return True
     except Exception as error:
-        error_message = f"{ERROR_MESSAGE} {PROCESS_FILE_ERROR} {str(error)}"
-        print(error_message)
+        count_file_error(error)
+        return False
+
+
+def count_file_error(error):
+    """
+    This method logs and counts a file that could not be processed.
+    :param: error: the error that failed the file (Exception)
+    :return:
+    """
+    ERRORS.inc(stage=FILE_ERROR)
+    UPLOADS_PROCESSED.inc(result=FAILED_RESULT)
+    error_message = f"{ERROR_MESSAGE} {PROCESS_FILE_ERROR} {str(error)}"
+    print(error_message)
+
+
+def claim_pending_uploads(limit):
+    """
+    This method chooses at most 'limit' claimable uploads with the scheduler, among the SCHEDULER_USER_WINDOW first
+    ones of every user, by priority then age, and claims them for the explainer with a lease, so they are not picked
+    up again, recording the time they were claimed. The claimable uploads are the pending ones, and the ones left
+    processing by an explainer whose lease expired. The scheduler is given the uploads every user has processing
+    under a live lease, so it shares the workers fairly between the users and favors the short decks. An abandoned
+    upload that was attempted MAX_UPLOAD_ATTEMPTS times already is failed for good instead of being claimed again.
+    Every upload is claimed with a conditional update, an upload another explainer claimed in the meantime is
+    skipped, so any number of explainers can share the database. The leases follow the clock of the database, so
+    the clocks of the explainers do not have to agree.
+    :param: limit: maximum number of uploads to claim (Integer)
+    :return: ids of the claimed uploads (List of integers)
+    """
+    now = datetime.now()
+    with Session(engine) as session:
+        lease_now = database_now(session)
+        user_window = select(Upload.id, func.row_number().over(
+            partition_by=Upload.user_id, order_by=(func.coalesce(Upload.priority, 0).desc(), Upload.upload_time))
+            .label('position')).where(claimable_uploads(lease_now)).subquery()
+        candidates = session.execute(
+            select(Upload.id, Upload.user_id, Upload.slides_total, Upload.priority, Upload.upload_time, Upload.uid,
+                   Upload.status, Upload.attempts).join(user_window, user_window.c.id == Upload.id)
+            .where(user_window.c.position <= SCHEDULER_USER_WINDOW).order_by(Upload.upload_time)).all()
+        running_per_user = dict(session.execute(
+            select(Upload.user_id, func.count(Upload.id)).where(
+                Upload.status == PROCESSING_STATUS, Upload.lease_expires >= lease_now).group_by(Upload.user_id)).all())
+    exhausted = [candidate for candidate in candidates
+                 if candidate.status == PROCESSING_STATUS and (candidate.attempts or 0) >= MAX_UPLOAD_ATTEMPTS]
+    candidates = {candidate.id: candidate for candidate in candidates}
+    for candidate in exhausted:
+        del candidates[candidate.id]
+    chosen_ids = schedule_uploads(list(candidates.values()), running_per_user, limit, now=now)
+
+    claimed = []
+    failed = []
+    with Session(engine) as session:
+        for candidate in exhausted:
+            if fail_abandoned_upload(session, candidate.id, MAX_UPLOAD_ATTEMPTS):
+                failed.append(candidate.uid)
+        for upload_id in chosen_ids:
+            if claim_upload(session, upload_id, WORKER_ID, LEASE_SECONDS, max_attempts=MAX_UPLOAD_ATTEMPTS):
+                claimed.append(upload_id)
+            else:
+                CLAIM_CONFLICTS.inc()
+        session.commit()
+
+    for uid in failed:
+        UPLOADS_FAILED.inc()
+        print(f"{UPLOAD_FAILED} {uid}")
+        notify_progress(uid)
+
+    for upload_id in claimed:
+        candidate = candidates[upload_id]
+        if candidate.status == PROCESSING_STATUS:
+            LEASES_RECLAIMED.inc()
+        STAGE_SECONDS.observe((now - candidate.upload_time).total_seconds(), stage=QUEUE_WAIT_STAGE)
+        notify_progress(candidate.uid)
+    return claimed
+
+
+async def process_upload(upload_id):
+    """
+    This method receives the id of a claimed upload, processes its file and commits its new status in a session of
+    its own, so the outcome of one upload never affects the uploads processed next to it. The file is restored
+    before, and the output saved and the status committed after, the slides are explained, in the default executor,
+    so the file moves, the compression of the output and the commits of one upload never hold up the event loop.
+    The processing is cancelled as soon as the renewal of the leases finds out another explainer claimed the upload.
+    :param: upload_id: id of an upload with the processing status (Integer)
+    :return:
+    """
+    UPLOADS_PROCESSING.inc()
+    loop = asyncio.get_running_loop()
+    try:
+        file_path, uid = await loop.run_in_executor(None, start_upload, upload_id)
+        explained = await process_file(file_path, upload_id, uid)
+        await loop.run_in_executor(None, finish_upload, upload_id, file_path, explained)
+    except Exception as error:
+        ERRORS.inc(stage=STATUS_UPDATE_ERROR)
+        print(f"{ERROR_MESSAGE} {UPDATE_STATUS_ERROR} {upload_id}: {str(error)}")
+    finally:
+        UPLOADS_PROCESSING.dec()
+
+
+def start_upload(upload_id):
+    """
+    This method puts the file of a claimed upload back in the 'uploads' folder if it was moved already.
+    :param: upload_id: id of an upload with the processing status (Integer)
+    :return: the path of the file and the uid of the upload (Tuple)
+    """
+    with Session(engine) as session:
+        upload = session.get(Upload, upload_id)
+        restore_upload_file(upload)
+        return upload.get_upload_path(), upload.uid
+
+
+def finish_upload(upload_id, file_path, explained):
+    """
+    This method saves the output of an explained upload and commits its new status, in a single session. The lease
+    of the upload is released with its new status, and nothing is committed if another explainer claimed the upload
+    in the meantime, after the lease expired. An upload that failed is queued again, unless it was attempted
+    MAX_UPLOAD_ATTEMPTS times, then it is failed for good, and none of its changes but the status are committed.
+    :param: upload_id: id of an upload with the processing status (Integer)
+    :param: file_path: the path of the file of the upload (String)
+    :param: explained: the explanations and the tokens of their requests, or None if the file failed (Tuple)
+    :return:
+    """
+    with Session(engine) as session:
+        upload = session.get(Upload, upload_id)
+        if explained is None or not complete_file(file_path, upload, *explained):
+            session.rollback()
+            upload.retry_or_fail(MAX_UPLOAD_ATTEMPTS)
+            if upload.status == FAILED_STATUS:
+                UPLOADS_FAILED.inc()
+                print(f"{UPLOAD_FAILED} {upload.uid}")
+        session.flush()
+        # the flush holds the write lock, so the owner read here can not change before the commit
+        if session.scalar(select(Upload.lease_owner).where(Upload.id == upload_id)) != WORKER_ID:
+            session.rollback()
+            LEASES_LOST.inc()
+            print(f"{LEASE_LOST} {upload_id}")
+            return
+        upload.release_lease()
+        session.commit()
+        notify_progress(upload.uid)
+
+
+async def wait_for_work(listener, running_tasks, worker_concurrency):
+    """
+    This method waits until there might be work for a free worker: a new upload was announced while a worker is free,
+    a running file is done, or FALLBACK_SCAN_INTERVAL seconds passed, which is a safety net for lost notifications.
+    :param: listener: the listener for new uploads (JobNotificationListener)
+    :param: running_tasks: tasks of the files currently processed (Set of tasks)
+    :param: worker_concurrency: maximum number of files processed at the same time (Integer)
+    :return:
+    """
+    waiters = set(running_tasks)
+    new_upload = None
+    # while every worker is busy, a notification is kept for later instead of waking the loop for nothing
+    if len(running_tasks) < worker_concurrency:
+        new_upload = asyncio.create_task(listener.wait())
+        waiters.add(new_upload)
+
+    await asyncio.wait(waiters, timeout=FALLBACK_SCAN_INTERVAL, return_when=asyncio.FIRST_COMPLETED)
+    if new_upload is not None:
+        new_upload.cancel()
+
 
+def recover_interrupted_uploads():
+    """
+    This method queues again the uploads left processing by an earlier run of this explainer, which holds the same
+    WORKER_ID if EXPLAINER_WORKER_ID is set, and the uploads left processing without a lease, which were claimed
+    before the leases, so they are not stuck in the processing status forever. Every claim counted as an attempt, an
+    upload attempted MAX_UPLOAD_ATTEMPTS times already is failed for good instead, so a file that stops the explainer
+    is not retried on every restart. The uploads of the other explainers are left alone, they are claimed once their
+    lease expires. The slides explained before the interruption are kept as checkpoints.
+    :return: the number of uploads queued again (Integer)
+    """
+    with Session(engine) as session:
+        interrupted_uploads = session.query(Upload).filter(
+            Upload.status == PROCESSING_STATUS,
+            or_(Upload.lease_owner == WORKER_ID, Upload.lease_owner.is_(None))).all()
+        uids = [upload.uid for upload in interrupted_uploads]
+        queued = 0
+        for upload in interrupted_uploads:
+            upload.release_lease()
+            upload.retry_or_fail(MAX_UPLOAD_ATTEMPTS)
+            if upload.status == FAILED_STATUS:
+                UPLOADS_FAILED.inc()
+                print(f"{UPLOAD_FAILED} {upload.uid}")
+            else:
+                queued += 1
+        session.commit()
+
+    for uid in uids:
+        notify_progress(uid)
+    return queued
 
-async def main_loop():
+
+def restore_upload_file(upload):
+    """
+    This method puts the file of an upload back in the 'uploads' folder, if an interrupted explainer moved it to the
+    'processed' folder already.
+    :param: upload: the upload about to be processed (Upload)
+    :return:
     """
-    This method keeps running in an infinite loop, each iteration it searches for all pending files using sql queries
-    for each file found, it retrieves it from the 'uploads' folder, updates its status to processing and then
-    waits for it to be processed.
+    upload_path = upload.get_upload_path()
+    processed_path = os.path.join(PROCESSED_FOLDER, os.path.basename(upload_path))
+    if not os.path.exists(upload_path) and os.path.exists(processed_path):
+        move_file(processed_path, os.path.dirname(upload_path))
+
 
+async def renew_leases_periodically(leased_uploads):
+    """
+    This method renews the leases of the uploads the explainer is processing every LEASE_RENEW_INTERVAL seconds, as
+    long as the explainer runs, so the other explainers do not claim them. The processing of an upload whose lease
+    was lost, because another explainer claimed it after it expired, is cancelled, so the upload is not explained
+    twice at once.
+    :param: leased_uploads: the task processing every upload the explainer holds, keyed by upload id (Dictionary)
     :return:
     """
+    loop = asyncio.get_running_loop()
     while True:
-        await asyncio.sleep(10)
-        with Session(engine) as session:
-            pending_files = session.query(Upload).filter_by(status=PENDING_STATUS).all()
-            if pending_files:
-                for pending_file in pending_files:
-                    pending_file.set_file_status(PROCESSING_STATUS)
-                    session.add(pending_file)
-                    session.commit()
-                    file_path = pending_file.get_upload_path()
-                    await process_file(file_path, pending_file)
-                    session.add(pending_file)
-                    session.commit()
+        await asyncio.sleep(LEASE_RENEW_INTERVAL)
+        upload_ids = list(leased_uploads)
+        if not upload_ids:
+            continue
+        try:
+            held = await loop.run_in_executor(None, renew_worker_leases, upload_ids)
+        except Exception as error:
+            print(f"{LEASE_RENEW_ERROR} {str(error)}")
+            continue
+        for upload_id in set(upload_ids) - held:
+            task = leased_uploads.pop(upload_id, None)
+            if task is not None:
+                task.cancel()
+                LEASES_LOST.inc()
+                print(f"{LEASE_LOST} {upload_id}")
+
+
+def renew_worker_leases(upload_ids):
+    """
+    This method renews the leases the explainer holds on the given uploads.
+    :param: upload_ids: ids of the uploads the explainer processes (List of integers)
+    :return: ids of the uploads whose lease is still held (Set of integers)
+    """
+    with Session(engine) as session:
+        held = renew_leases(session, WORKER_ID, upload_ids, LEASE_SECONDS)
+        session.commit()
+    return held
+
+
+def start_worker_metrics_server():
+    """
+    This method serves the metrics of the worker on WORKER_METRICS_PORT, unless it is 0.
+    :return: the running server, or None if the metrics are not served. (ThreadingHTTPServer)
+    """
+    if not WORKER_METRICS_PORT:
+        return None
+    try:
+        server = start_metrics_server(WORKER_METRICS_HOST, WORKER_METRICS_PORT)
+    except OSError as error:
+        print(f"{METRICS_SERVER_ERROR} {str(error)}")
+        return None
+    print(f"{METRICS_SERVER_STARTED} http://{WORKER_METRICS_HOST}:{WORKER_METRICS_PORT}/metrics")
+    return server
+
+
+async def main_loop(worker_concurrency=WORKER_CONCURRENCY):
+    """
+    This method keeps running in an infinite loop, each iteration it claims as many pending files as there are free
+    workers, updates their status to processing and starts processing them concurrently, at most
+    'worker_concurrency' files are processed at once. The model requests of all of them share the global
+    MODEL_RATE_LIMITER. The loop wakes up as soon as the web API announces a new upload or a file is done,
+    and scans the database every FALLBACK_SCAN_INTERVAL seconds in case a notification was lost. The metrics of the
+    worker are served on WORKER_METRICS_PORT while the loop runs. The uploads interrupted by an earlier run are
+    queued again before the first claim, and resume from their first unexplained slide. The leases of the uploads
+    being processed are renewed in the background. The extraction pool is created before the loop starts any thread.
+    The claims and the recovery query the database in the default executor, so they do not hold up the running files.
+    :param: worker_concurrency: maximum number of files processed at the same time (Integer)
+    :return:
+    """
+    get_extraction_executor()
+    loop = asyncio.get_running_loop()
+    try:
+        listener = await start_listener()
+    except OSError as error:
+        print(f"{LISTENER_ERROR} {str(error)}")
+        listener = JobNotificationListener()
+    metrics_server = start_worker_metrics_server()
+    if 'EXPLAINER_WORKER_ID' not in os.environ:
+        print(f"{WORKER_ID_NOT_SET} {WORKER_ID}")
+    print(f"{UPLOADS_RECOVERED} {await loop.run_in_executor(None, recover_interrupted_uploads)}")
+
+    running_tasks = set()
+    leased_uploads = {}
+    lease_renewal = asyncio.create_task(renew_leases_periodically(leased_uploads))
+    try:
+        while True:
+            await wait_for_work(listener, running_tasks, worker_concurrency)
+
+            free_workers = worker_concurrency - len(running_tasks)
+            if free_workers <= 0:
+                continue
+            listener.clear()
+            for upload_id in await loop.run_in_executor(None, claim_pending_uploads, free_workers):
+                task = asyncio.create_task(process_upload(upload_id))
+                running_tasks.add(task)
+                leased_uploads[upload_id] = task
+                task.add_done_callback(running_tasks.discard)
+                task.add_done_callback(lambda _, upload_id=upload_id: leased_uploads.pop(upload_id, None))
+    finally:
+        lease_renewal.cancel()
+        listener.close()
+        shutdown_extraction_executor()
+        if metrics_server is not None:
+            metrics_server.shutdown()
 
 
 if __name__ == "__main__":
     print(EXPLAINER_STARTED_MESSAGE)
+    prepare_database(engine)
+    print(f"{CACHE_INVALIDATED} {EXPLANATION_CACHE.invalidate_stale_entries()}")
+    print(f"{CACHE_ENTRIES} {EXPLANATION_CACHE.count_entries()}")
     asyncio.run(main_loop())
@@ -0,0 +1,244 @@
+import os
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+SYSTEM_PROMPT = "Can you explain the slides in basic english, and provide examples if needed!"
+SYSTEM_ROLE = "system"
+USER_ROLE = "user"
+ROLE_FIELD = "role"
+CONTENT_FIELD = "content"
+CONTEXT_WINDOW_SLIDES = int(os.environ.get('CONTEXT_WINDOW_SLIDES', 3))
+CONTEXT_TOKEN_BUDGET = int(os.environ.get('CONTEXT_TOKEN_BUDGET', 1500))
+CHARACTERS_PER_TOKEN = 4
+TOKENIZER_ENCODING = os.environ.get('TOKENIZER_ENCODING', 'cl100k_base')
+# the context window of the model, shared by the prompt and the answer
+MODEL_CONTEXT_TOKENS = int(os.environ.get('MODEL_CONTEXT_TOKENS', 4096))
+COMPLETION_TOKEN_RESERVE = int(os.environ.get('COMPLETION_TOKEN_RESERVE', 1024))
+# the system prompt, the part headers and the formatting of the messages
+PROMPT_OVERHEAD_TOKENS = 100
+# a slide longer than this is split into parts explained one by one, so its request always fits the context window
+# along with the preceding slides and the answer
+MAX_SLIDE_TOKENS = int(os.environ.get('MAX_SLIDE_TOKENS', MODEL_CONTEXT_TOKENS - COMPLETION_TOKEN_RESERVE -
+                                      CONTEXT_TOKEN_BUDGET - PROMPT_OVERHEAD_TOKENS))
+PART_HEADER = "Part {number} of {count} of a slide too long to be sent at once, explain this part:"
+_encoding = None
+_encoding_loaded = False
+
+
+def get_encoding():
+    """
+    This method loads the tokenizer of the model on the first call, if the optional tiktoken package is installed and
+    its encoding can be loaded.
+    :return: the encoding, or None to fall back to the estimation. (Encoding)
+    """
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        _encoding_loaded = True
+        try:
+            _encoding = tiktoken.get_encoding(TOKENIZER_ENCODING) if tiktoken else None
+        except Exception:
+            # the encoding files are downloaded on their first use, which fails offline
+            _encoding = None
+    return _encoding
+
+
+def estimate_tokens(text):
+    """
+    This method receives a text and returns the number of tokens the model will count for it, counted with the
+    tokenizer of the model when tiktoken is installed, or estimated otherwise, using the average of about four
+    characters per token of english text.
+    :param: text: the text to measure. (String)
+    :return: number of tokens. (Integer)
+    """
+    encoding = get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return len(text) // CHARACTERS_PER_TOKEN + 1
+
+
+def cut_word(word, max_tokens):
+    """
+    This method cuts a single word longer than a part into pieces of as many characters as fit in max_tokens tokens,
+    measured with estimate_tokens, so the cuts follow the tokenizer when it is installed.
+    :param: word: the word to cut. (String)
+    :param: max_tokens: maximum tokens of a piece. (Integer)
+    :return: the pieces, in order. (List of strings)
+    """
+    pieces = []
+    while word:
+        # the longest prefix within the limit, of at least one character
+        shortest, longest = 1, len(word)
+        while shortest < longest:
+            middle = (shortest + longest + 1) // 2
+            if estimate_tokens(word[:middle]) <= max_tokens:
+                shortest = middle
+            else:
+                longest = middle - 1
+        pieces.append(word[:shortest])
+        word = word[shortest:]
+    return pieces
+
+
+def split_text(text, max_tokens):
+    """
+    This method splits a text into parts of at most max_tokens tokens, between lines when possible, then between
+    words, and between characters for a single word longer than a part. Words of the same line are joined back with
+    spaces, and lines with new lines.
+    :param: text: the text to split. (String)
+    :param: max_tokens: maximum tokens of a part. (Integer)
+    :return: the parts, in order. (List of strings)
+    """
+    # every piece is kept with the separator that preceded it in the text
+    pieces = []
+    for line in text.splitlines():
+        if estimate_tokens(line) <= max_tokens:
+            pieces.append(("\n", line))
+            continue
+        separator = "\n"
+        for word in line.split():
+            if estimate_tokens(word) <= max_tokens:
+                pieces.append((separator, word))
+            else:
+                pieces.extend((separator if index == 0 else "", cut)
+                              for index, cut in enumerate(cut_word(word, max_tokens)))
+            separator = " "
+
+    parts = []
+    part = ""
+    part_tokens = 0
+    for separator, piece in pieces:
+        tokens = estimate_tokens(piece)
+        if part_tokens and part_tokens + tokens > max_tokens:
+            parts.append(part)
+            part, part_tokens = "", 0
+        part = part + separator + piece if part_tokens else piece
+        part_tokens += tokens
+    if part_tokens:
+        parts.append(part)
+    return parts
+
+
+def build_message(role, content):
+    """
+    This method receives a role and a content and returns a single chat message in the format the openai API expects.
+    :param: role: role of the message, system or user. (String)
+    :param: content: text of the message. (String)
+    :return: chat message. (Dictionary)
+    """
+    return {ROLE_FIELD: role, CONTENT_FIELD: content}
+
+
+class PresentationContext:
+    """
+    This class holds the conversation context of a single presentation. It receives the text of every slide of the
+    deck once, and builds the messages sent for each slide out of the system prompt, a bounded window of the slides
+    preceding it, and the slide itself. The window is limited both by a number of slides and by a token budget, so the
+    prompt size does not grow with the size of the deck. The tokens of every slide are counted once, and the slides
+    longer than max_slide_tokens are sent in parts.
+    The context never changes after it was created, and the messages of a slide only depend on its position in the
+    deck, so slides and decks explained at the same time can safely share it.
+    """
+    def __init__(self, slide_texts, system_prompt=SYSTEM_PROMPT, window=CONTEXT_WINDOW_SLIDES,
+                 token_budget=CONTEXT_TOKEN_BUDGET, max_slide_tokens=MAX_SLIDE_TOKENS):
+        """
+        :param: slide_texts: the extracted text of each slide, in the order of the slides. (List of strings)
+        :param: system_prompt: the instruction sent to the model before the slides. (String)
+        :param: window: maximum number of preceding slides sent with a slide. (Integer)
+        :param: token_budget: maximum tokens of preceding slides sent with a slide. (Integer)
+        :param: max_slide_tokens: maximum tokens of a slide sent in a single request. (Integer)
+        """
+        self._slide_texts = tuple(slide_texts)
+        self._slide_tokens = tuple(estimate_tokens(text) for text in self._slide_texts)
+        self._max_slide_tokens = max(1, max_slide_tokens)
+        self._system_prompt = system_prompt
+        self._window = max(0, window)
+        self._token_budget = max(0, token_budget)
+
+    def __len__(self):
+        """
+        :return: number of slides in the context (Integer)
+        """
+        return len(self._slide_texts)
+
+    @property
+    def system_prompt(self):
+        """
+        Getter for the system prompt of the context
+        :return: the system prompt (String)
+        """
+        return self._system_prompt
+
+    def slide_text(self, slide_index):
+        """
+        This method returns the extracted text of a slide.
+        :param: slide_index: zero based index of the slide in the deck. (Integer)
+        :return: the text of the slide. (String)
+        """
+        return self._slide_texts[slide_index]
+
+    def slide_tokens(self, slide_index):
+        """
+        :param: slide_index: zero based index of the slide in the deck. (Integer)
+        :return: the number of tokens of the text of the slide. (Integer)
+        """
+        return self._slide_tokens[slide_index]
+
+    def is_oversized(self, slide_index):
+        """
+        :param: slide_index: zero based index of the slide in the deck. (Integer)
+        :return: True if the slide is too long to be sent in a single request. (Boolean)
+        """
+        return self._slide_tokens[slide_index] > self._max_slide_tokens
+
+    def preceding_texts(self, slide_index):
+        """
+        This method collects the texts of the slides preceding the given slide, starting from the closest one, until
+        either the window or the token budget is exhausted. Slides without text are skipped.
+        :param: slide_index: zero based index of the slide in the deck. (Integer)
+        :return: texts of the preceding slides, in the order of the slides. (List of strings)
+        """
+        preceding = []
+        used_tokens = 0
+        first_index = max(0, slide_index - self._window)
+        for index in range(slide_index - 1, first_index - 1, -1):
+            text = self._slide_texts[index]
+            if not text.strip():
+                continue
+            tokens = self._slide_tokens[index]
+            if used_tokens + tokens > self._token_budget:
+                break
+            used_tokens += tokens
+            preceding.append(text)
+        preceding.reverse()
+        return preceding
+
+    def messages_for(self, slide_index):
+        """
+        This method builds the list of messages sent to the API to explain a single slide.
+        :param: slide_index: zero based index of the slide in the deck. (Integer)
+        :return: chat messages. (List of dictionaries)
+        """
+        messages = [build_message(SYSTEM_ROLE, self._system_prompt)]
+        for text in self.preceding_texts(slide_index):
+            messages.append(build_message(USER_ROLE, text))
+        messages.append(build_message(USER_ROLE, self._slide_texts[slide_index]))
+        return messages
+
+    def part_messages_for(self, slide_index):
+        """
+        This method builds the requests of an oversized slide, one per part of its text, each with the system prompt
+        and the preceding slides, like the request of a whole slide.
+        :param: slide_index: zero based index of the slide in the deck. (Integer)
+        :return: chat messages of every part. (List of lists of dictionaries)
+        """
+        parts = split_text(self._slide_texts[slide_index], self._max_slide_tokens)
+        requests = []
+        for number, part in enumerate(parts, start=1):
+            messages = self.messages_for(slide_index)[:-1]
+            header = PART_HEADER.format(number=number, count=len(parts))
+            messages.append(build_message(USER_ROLE, f"{header}\n{part}"))
+            requests.append(messages)
+        return requests
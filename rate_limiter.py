@@ -0,0 +1,240 @@
+import asyncio
+import os
+import random
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+import openai
+
+RATE_LIMIT_REQUESTS_PER_SECOND = float(os.environ.get('RATE_LIMIT_REQUESTS_PER_SECOND', 5))
+RATE_LIMIT_MAX_REQUESTS_PER_SECOND = float(os.environ.get('RATE_LIMIT_MAX_REQUESTS_PER_SECOND', 50))
+RATE_LIMIT_BURST = int(os.environ.get('RATE_LIMIT_BURST', 10))
+INITIAL_CONCURRENCY = int(os.environ.get('RATE_LIMIT_INITIAL_CONCURRENCY', 4))
+MIN_CONCURRENCY = 1
+MIN_REQUESTS_PER_SECOND = 0.1
+MAX_RETRIES = int(os.environ.get('MODEL_MAX_RETRIES', 5))
+BASE_BACKOFF = float(os.environ.get('MODEL_BASE_BACKOFF', 1.0))
+MAX_BACKOFF = float(os.environ.get('MODEL_MAX_BACKOFF', 60.0))
+DECREASE_FACTOR = 0.5
+DECREASE_COOLDOWN = 1.0
+RATE_INCREASE_STEP = float(os.environ.get('RATE_LIMIT_INCREASE_STEP', 0.5))
+RETRY_AFTER_HEADERS = ("retry-after", "Retry-After")
+SERVER_ERROR = 500
+RETRYABLE_ERRORS = (openai.error.RateLimitError, openai.error.Timeout, openai.error.APIConnectionError,
+                    openai.error.ServiceUnavailableError, openai.error.TryAgain, asyncio.TimeoutError)
+
+
+def is_retryable(error):
+    """
+    This method decides if a failed model request is worth retrying: rate limits, timeouts, connection problems and
+    server side errors are transient, any other error (a bad request, a wrong key) would fail the same way again.
+    :param: error: the exception raised by the request. (Exception)
+    :return: True if the request should be retried, false otherwise. (Boolean)
+    """
+    if isinstance(error, RETRYABLE_ERRORS):
+        return True
+    http_status = getattr(error, "http_status", None)
+    return isinstance(error, openai.error.APIError) and http_status is not None and http_status >= SERVER_ERROR
+
+
+def parse_retry_after(value):
+    """
+    This method parses a Retry-After header, which holds either a number of seconds or an HTTP date.
+    :param: value: the value of the header, or None. (String)
+    :return: number of seconds to wait, or None if there is no valid header. (Float)
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_time = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_time.tzinfo is None:
+        retry_time = retry_time.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_time - datetime.now(timezone.utc)).total_seconds())
+
+
+def error_retry_after(error):
+    """
+    This method reads the Retry-After header of a failed request.
+    :param: error: the exception raised by the request. (Exception)
+    :return: number of seconds to wait, or None if the server did not say. (Float)
+    """
+    headers = getattr(error, "headers", None) or {}
+    return parse_retry_after(next((headers.get(name) for name in RETRY_AFTER_HEADERS if headers.get(name)), None))
+
+
+class AdaptiveRateLimiter:
+    """
+    This class sits in front of every model request of the worker. It combines three mechanisms:
+    1) a token bucket that spaces the requests to the current rate, with a small burst allowance.
+    2) a concurrency limit on the requests in flight.
+    3) retries of transient failures, with jittered exponential backoff, honoring the Retry-After of the server.
+    Both the rate and the concurrency limit follow AIMD: they grow a little after every successful request and are
+    halved whenever the API answers with a rate limit error, so they settle around the real limit of the account.
+    A Retry-After answer also pauses every request of the limiter, not only the one that was throttled. Rate limit
+    errors received within DECREASE_COOLDOWN seconds of a decrease belong to the same burst and are only counted once.
+    """
+    def __init__(self, rate=RATE_LIMIT_REQUESTS_PER_SECOND, max_rate=RATE_LIMIT_MAX_REQUESTS_PER_SECOND,
+                 burst=RATE_LIMIT_BURST, initial_concurrency=INITIAL_CONCURRENCY, max_concurrency=None,
+                 max_retries=MAX_RETRIES, base_backoff=BASE_BACKOFF, max_backoff=MAX_BACKOFF):
+        """
+        :param: rate: initial number of requests started per second. (Float)
+        :param: max_rate: the rate never grows above this number of requests per second. (Float)
+        :param: burst: maximum number of requests that can be started at once after an idle period. (Integer)
+        :param: initial_concurrency: initial number of requests allowed in flight. (Integer)
+        :param: max_concurrency: the concurrency limit never grows above it, None for initial_concurrency * 4.
+        (Integer)
+        :param: max_retries: number of retries of a request before its error is raised. (Integer)
+        :param: base_backoff: backoff of the first retry, in seconds, doubled on every retry. (Float)
+        :param: max_backoff: maximum backoff of a retry, in seconds. (Float)
+        """
+        self._rate = rate
+        self._max_rate = max(rate, max_rate)
+        self._burst = max(1, burst)
+        self._tokens = float(self._burst)
+        self._last_refill = time.monotonic()
+        self._max_concurrency = max_concurrency or initial_concurrency * 4
+        self._concurrency_limit = float(min(initial_concurrency, self._max_concurrency))
+        self._in_flight = 0
+        self._max_retries = max_retries
+        self._base_backoff = base_backoff
+        self._max_backoff = max_backoff
+        self._paused_until = 0.0
+        self._last_decrease = float("-inf")
+        self._slot_freed = None
+        self.requests = 0
+        self.retries = 0
+        self.throttled = 0
+        self.failures = 0
+
+    @property
+    def rate(self):
+        """
+        :return: the current number of requests started per second (Float)
+        """
+        return self._rate
+
+    @property
+    def concurrency_limit(self):
+        """
+        :return: the current number of requests allowed in flight (Integer)
+        """
+        return int(self._concurrency_limit)
+
+    @property
+    def in_flight(self):
+        """
+        :return: the number of requests in flight (Integer)
+        """
+        return self._in_flight
+
+    async def call(self, request_factory):
+        """
+        This method runs a model request under the limits, and retries it while it fails with a transient error.
+        :param: request_factory: function returning a new awaitable of the request on every call. (Callable)
+        :return: the result of the request.
+        """
+        for attempt in range(self._max_retries + 1):
+            await self._acquire()
+            try:
+                result = await request_factory()
+            except Exception as error:
+                self._release()
+                if not is_retryable(error) or attempt == self._max_retries:
+                    self.failures += 1
+                    raise
+                retry_after = error_retry_after(error)
+                if isinstance(error, openai.error.RateLimitError):
+                    self._on_throttled(retry_after)
+                self.retries += 1
+                await asyncio.sleep(self._backoff(attempt, retry_after))
+            except BaseException:
+                self._release()
+                raise
+            else:
+                self._on_success()
+                self._release()
+                return result
+
+    def _backoff(self, attempt, retry_after):
+        """
+        This method computes the delay before a retry, a random delay up to the exponential backoff of the attempt
+        (full jitter), and never less than the Retry-After of the server.
+        :param: attempt: zero based number of the failed attempt. (Integer)
+        :param: retry_after: the Retry-After of the server, or None. (Float)
+        :return: delay in seconds. (Float)
+        """
+        delay = random.uniform(0, min(self._max_backoff, self._base_backoff * 2 ** attempt))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    async def _acquire(self):
+        """
+        This method waits until a request may start: the limiter is not paused, a slot below the concurrency limit
+        is free and the token bucket holds a token.
+        :return:
+        """
+        while self._in_flight >= self.concurrency_limit:
+            if self._slot_freed is None:
+                self._slot_freed = asyncio.Event()
+            await self._slot_freed.wait()
+        self._in_flight += 1
+
+        try:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self._burst, self._tokens + (now - self._last_refill) * self._rate)
+                self._last_refill = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    self.requests += 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self._rate)
+        except BaseException:
+            self._release()
+            raise
+
+    def _release(self):
+        """
+        This method frees the slot of a finished request and wakes up the requests waiting for one.
+        :return:
+        """
+        self._in_flight -= 1
+        if self._slot_freed is not None:
+            slot_freed, self._slot_freed = self._slot_freed, None
+            slot_freed.set()
+
+    def _on_success(self):
+        """
+        Additive increase: the concurrency limit grows by about one slot per window of successful requests, and the
+        rate by a small step.
+        :return:
+        """
+        self._concurrency_limit = min(self._max_concurrency, self._concurrency_limit + 1 / self._concurrency_limit)
+        self._rate = min(self._max_rate, self._rate + RATE_INCREASE_STEP)
+
+    def _on_throttled(self, retry_after):
+        """
+        Multiplicative decrease: the concurrency limit and the rate are halved, and the limiter is paused for the
+        Retry-After of the server.
+        :param: retry_after: the Retry-After of the server, or None. (Float)
+        :return:
+        """
+        self.throttled += 1
+        now = time.monotonic()
+        if retry_after is not None:
+            self._paused_until = max(self._paused_until, now + retry_after)
+        if now - self._last_decrease < DECREASE_COOLDOWN:
+            return
+        self._last_decrease = now
+        self._concurrency_limit = max(MIN_CONCURRENCY, self._concurrency_limit * DECREASE_FACTOR)
+        self._rate = max(MIN_REQUESTS_PER_SECOND, self._rate * DECREASE_FACTOR)
@@ -0,0 +1,108 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+STATUS_CACHE_MAX_ENTRIES = int(os.environ.get('STATUS_CACHE_MAX_ENTRIES', 256))
+STATUS_CACHE_MAX_BYTES = int(os.environ.get('STATUS_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+HITS_FIELD = 'hits'
+MISSES_FIELD = 'misses'
+ENTRIES_FIELD = 'entries'
+SIZE_FIELD = 'bytes'
+EVICTIONS_FIELD = 'evictions'
+
+
+def compute_etag(body):
+    """
+    This method computes the entity tag of a response body, which changes whenever the body changes.
+    :param: body: the serialized response. (Bytes)
+    :return: the entity tag, without quotes. (String)
+    """
+    return hashlib.sha256(body).hexdigest()[:32]
+
+
+class ResponseCache:
+    """
+    This class is a bounded, thread safe, in-memory LRU cache of serialized responses. Every entry is stored under a
+    key together with a version, for example the modification time of the file the response was built from, and a
+    lookup with another version is a miss, so a changed file is never served from the cache. The least recently used
+    entries are evicted once the cache holds more than max_entries responses or more than max_bytes bytes.
+    """
+    def __init__(self, max_entries=STATUS_CACHE_MAX_ENTRIES, max_bytes=STATUS_CACHE_MAX_BYTES):
+        """
+        :param: max_entries: maximum number of responses kept in the cache, 0 disables the cache. (Integer)
+        :param: max_bytes: maximum total size of the responses kept in the cache. (Integer)
+        """
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self):
+        """
+        :return: True if the cache keeps responses, false otherwise. (Boolean)
+        """
+        return self._max_entries > 0 and self._max_bytes > 0
+
+    def get(self, key, version):
+        """
+        This method looks a response up, and marks it as the most recently used one.
+        :param: key: the key of the response, for example the uid of an upload. (String)
+        :param: version: the version the response must have been built from. (Any comparable value)
+        :return: the body and the entity tag of the response, or None on a miss. (Tuple)
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1], entry[2]
+
+    def put(self, key, version, body):
+        """
+        This method stores a response, replacing any other version of it, and evicts the least recently used
+        responses that do not fit anymore. A response larger than the whole cache is not stored.
+        :param: key: the key of the response. (String)
+        :param: version: the version the response was built from. (Any comparable value)
+        :param: body: the serialized response. (Bytes)
+        :return: the entity tag of the response. (String)
+        """
+        etag = compute_etag(body)
+        if not self.enabled or len(body) > self._max_bytes:
+            return etag
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous[1])
+            self._entries[key] = (version, body, etag)
+            self._size += len(body)
+            while len(self._entries) > self._max_entries or self._size > self._max_bytes:
+                _, (_, evicted_body, _) = self._entries.popitem(last=False)
+                self._size -= len(evicted_body)
+                self.evictions += 1
+        return etag
+
+    def clear(self):
+        """
+        This method removes every response from the cache.
+        :return:
+        """
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self):
+        """
+        :return: the hits, misses, evictions, entries and total size of the cache. (Dictionary)
+        """
+        with self._lock:
+            return {HITS_FIELD: self.hits, MISSES_FIELD: self.misses, EVICTIONS_FIELD: self.evictions,
+                    ENTRIES_FIELD: len(self._entries), SIZE_FIELD: self._size}
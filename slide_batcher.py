@@ -0,0 +1,113 @@
+import json
+import os
+from presentation_context import build_message, SYSTEM_ROLE, USER_ROLE
+
+SHORT_SLIDE_TOKENS = int(os.environ.get('SHORT_SLIDE_TOKENS', 60))
+BATCH_TOKEN_BUDGET = int(os.environ.get('BATCH_TOKEN_BUDGET', 400))
+MAX_BATCH_SLIDES = int(os.environ.get('MAX_BATCH_SLIDES', 8))
+SLIDE_KEY_PREFIX = "slide"
+BATCH_INSTRUCTIONS = "You will receive several slides at once. Explain every slide separately, and answer only with " \
+                     "a JSON object that has exactly one key per slide, named as in the slide headers (for example " \
+                     "\"slide3\"), whose value is the explanation of that slide as a string."
+OPENING_BRACE = "{"
+CLOSING_BRACE = "}"
+
+
+def slide_key(slide_index):
+    """
+    This method returns the key of a slide in the output, slide numbers start from 1.
+    :param: slide_index: zero based index of the slide in the deck. (Integer)
+    :return: the key of the slide, for example 'slide3'. (String)
+    """
+    return f"{SLIDE_KEY_PREFIX}{slide_index + 1}"
+
+
+def is_short_slide(context, slide_index, short_slide_tokens=SHORT_SLIDE_TOKENS):
+    """
+    This method decides if a slide is short enough to be packed with its neighbours into a single request.
+    :param: context: the conversation context of the presentation. (PresentationContext)
+    :param: slide_index: zero based index of the slide in the deck. (Integer)
+    :param: short_slide_tokens: maximum tokens of a short slide. (Integer)
+    :return: True if the slide is short, false otherwise. (Boolean)
+    """
+    return context.slide_tokens(slide_index) <= short_slide_tokens
+
+
+def plan_batches(context, slide_indexes, token_budget=BATCH_TOKEN_BUDGET, max_batch_slides=MAX_BATCH_SLIDES,
+                 short_slide_tokens=SHORT_SLIDE_TOKENS):
+    """
+    This method groups the slides that have to be explained into requests. Consecutive short slides are packed
+    together as long as their tokens fit the token budget, every other slide gets a request of its own.
+    :param: context: the conversation context of the presentation. (PresentationContext)
+    :param: slide_indexes: zero based indexes of the slides to explain, in the order of the slides. (List of integers)
+    :param: token_budget: maximum tokens of the slides packed into one request. (Integer)
+    :param: max_batch_slides: maximum number of slides packed into one request. (Integer)
+    :param: short_slide_tokens: maximum tokens of a short slide. (Integer)
+    :return: the slide indexes of every request. (List of lists of integers)
+    """
+    batches = []
+    batch = []
+    batch_tokens = 0
+    for slide_index in slide_indexes:
+        if not is_short_slide(context, slide_index, short_slide_tokens):
+            if batch:
+                batches.append(batch)
+                batch, batch_tokens = [], 0
+            batches.append([slide_index])
+            continue
+
+        tokens = context.slide_tokens(slide_index)
+        is_consecutive = batch and batch[-1] == slide_index - 1
+        if batch and (not is_consecutive or batch_tokens + tokens > token_budget or len(batch) >= max_batch_slides):
+            batches.append(batch)
+            batch, batch_tokens = [], 0
+        batch.append(slide_index)
+        batch_tokens += tokens
+
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def build_batch_messages(context, batch):
+    """
+    This method builds the messages of a request that explains several slides at once. The preceding slides of the
+    first slide of the batch are sent as context, like for a single slide.
+    :param: context: the conversation context of the presentation. (PresentationContext)
+    :param: batch: zero based indexes of the slides of the request. (List of integers)
+    :return: chat messages. (List of dictionaries)
+    """
+    messages = [build_message(SYSTEM_ROLE, f"{context.system_prompt} {BATCH_INSTRUCTIONS}")]
+    for text in context.preceding_texts(batch[0]):
+        messages.append(build_message(USER_ROLE, text))
+    slides = "\n\n".join(f"{slide_key(slide_index)}:\n{context.slide_text(slide_index)}" for slide_index in batch)
+    messages.append(build_message(USER_ROLE, slides))
+    return messages
+
+
+def parse_batch_response(content, batch):
+    """
+    This method splits the answer to a batch request back into one explanation per slide. The answer is only trusted
+    if it holds a JSON object with a non empty string for every slide of the batch.
+    :param: content: the content of the answer. (String)
+    :param: batch: zero based indexes of the slides of the request. (List of integers)
+    :return: the explanation of every slide index, or None if the answer could not be parsed reliably. (Dictionary)
+    """
+    start = content.find(OPENING_BRACE)
+    end = content.rfind(CLOSING_BRACE)
+    if start == -1 or end < start:
+        return None
+    try:
+        answers = json.loads(content[start:end + 1])
+    except ValueError:
+        return None
+    if not isinstance(answers, dict):
+        return None
+
+    explanations = {}
+    for slide_index in batch:
+        explanation = answers.get(slide_key(slide_index))
+        if not isinstance(explanation, str) or not explanation.strip():
+            return None
+        explanations[slide_index] = explanation
+    return explanations
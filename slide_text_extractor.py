@@ -0,0 +1,308 @@
+import posixpath
+import time
+import zipfile
+import zlib
+from lxml.etree import iterparse, XMLSyntaxError
+from pptx import Presentation
+
+PRESENTATION_PART = "ppt/presentation.xml"
+CONTENT_TYPES_PART = "[Content_Types].xml"
+REQUIRED_PARTS = (CONTENT_TYPES_PART, PRESENTATION_PART)
+PACKAGE_ROOT = "/"
+RELS_FOLDER = "_rels"
+RELS_EXTENSION = ".rels"
+PRESENTATIONML = "{http://schemas.openxmlformats.org/presentationml/2006/main}"
+DRAWINGML = "{http://schemas.openxmlformats.org/drawingml/2006/main}"
+RELATIONSHIPS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+PACKAGE_RELATIONSHIPS = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+SLIDE_ID_TAG = f"{PRESENTATIONML}sldId"
+SHAPE_TREE_TAG = f"{PRESENTATIONML}spTree"
+SHAPE_TAG = f"{PRESENTATIONML}sp"
+GROUP_SHAPE_TAG = f"{PRESENTATIONML}grpSp"
+GRAPHIC_FRAME_TAG = f"{PRESENTATIONML}graphicFrame"
+SHAPE_TEXT_BODY_TAG = f"{PRESENTATIONML}txBody"
+PLACEHOLDER_TAG = f"{PRESENTATIONML}ph"
+TABLE_TAG = f"{DRAWINGML}tbl"
+TABLE_CELL_TEXT_BODY_TAG = f"{DRAWINGML}txBody"
+PARAGRAPH_TAG = f"{DRAWINGML}p"
+RUN_TAG = f"{DRAWINGML}r"
+RUN_TEXT_TAG = f"{DRAWINGML}t"
+RELATIONSHIP_TAG = f"{PACKAGE_RELATIONSHIPS}Relationship"
+RELATIONSHIP_ID_ATTRIBUTE = f"{RELATIONSHIPS}id"
+NOTES_SLIDE_RELATIONSHIP = "/notesSlide"
+BODY_PLACEHOLDER = "body"
+RUN_TEXT_PATH = [PARAGRAPH_TAG, RUN_TAG, RUN_TEXT_TAG]
+SHAPE_TEXT_PATH = [SHAPE_TAG, SHAPE_TEXT_BODY_TAG]
+TABLE_CELL_TEXT_PATH = [GRAPHIC_FRAME_TAG, f"{DRAWINGML}graphic", f"{DRAWINGML}graphicData", TABLE_TAG,
+                        f"{DRAWINGML}tr", f"{DRAWINGML}tc", TABLE_CELL_TEXT_BODY_TAG]
+PARSED_TAGS = (RUN_TEXT_TAG, SHAPE_TAG, GROUP_SHAPE_TAG, GRAPHIC_FRAME_TAG)
+BODY_PLACEHOLDER_PATH = f"{PRESENTATIONML}nvSpPr/{PRESENTATIONML}nvPr/{PLACEHOLDER_TAG}"
+END_EVENT = "end"
+TEXT_SEPARATOR = " "
+XML_EXTRACTION_ENGINE = 'xml'
+PPTX_EXTRACTION_ENGINE = 'pptx'
+
+
+def resolve_target(source_part, target):
+    """
+    This method resolves the target of a relationship, relative to the part the relationship belongs to, into the
+    name of a part inside the zip file.
+    :param: source_part: name of the part the relationship belongs to, for example 'ppt/presentation.xml' (String)
+    :param: target: target of the relationship, for example 'slides/slide1.xml' (String)
+    :return: name of the target part, for example 'ppt/slides/slide1.xml' (String)
+    """
+    if target.startswith(PACKAGE_ROOT):
+        return target.lstrip(PACKAGE_ROOT)
+    return posixpath.normpath(posixpath.join(posixpath.dirname(source_part), target))
+
+
+def rels_part_name(part_name):
+    """
+    :param: part_name: name of a part, for example 'ppt/slides/slide1.xml' (String)
+    :return: name of the relationships part of the part, for example 'ppt/slides/_rels/slide1.xml.rels' (String)
+    """
+    folder, file_name = posixpath.split(part_name)
+    return posixpath.join(folder, RELS_FOLDER, file_name + RELS_EXTENSION)
+
+
+def read_relationships(archive, part_name):
+    """
+    This method reads the relationships of a part.
+    :param: archive: the opened presentation. (ZipFile)
+    :param: part_name: name of the part. (String)
+    :return: the target part name and the type of every relationship id. (Dictionary)
+    """
+    relationships = {}
+    try:
+        rels = archive.open(rels_part_name(part_name))
+    except KeyError:
+        return relationships
+    with rels:
+        for _, element in iterparse(rels):
+            if element.tag == RELATIONSHIP_TAG:
+                relationships[element.get("Id")] = (resolve_target(part_name, element.get("Target")),
+                                                    element.get("Type", ""))
+    return relationships
+
+
+def slide_part_names(archive):
+    """
+    This method lists the slide parts of a presentation in the order of the slides, which is the order of the slide
+    id list of the presentation part, not the numbering of the slide files.
+    :param: archive: the opened presentation. (ZipFile)
+    :return: names of the slide parts. (List of strings)
+    """
+    relationships = read_relationships(archive, PRESENTATION_PART)
+    slide_parts = []
+    with archive.open(PRESENTATION_PART) as presentation:
+        for _, element in iterparse(presentation):
+            if element.tag == SLIDE_ID_TAG:
+                slide_parts.append(relationships[element.get(RELATIONSHIP_ID_ATTRIBUTE)][0])
+    return slide_parts
+
+
+def count_slides(presentation_path):
+    """
+    This method counts the slides of a presentation without parsing them.
+    :param: presentation_path: path of a power-point presentation. (String)
+    :return: number of slides. (Integer)
+    """
+    with zipfile.ZipFile(presentation_path) as archive:
+        return len(slide_part_names(archive))
+
+
+def read_slide_count(presentation_path):
+    """
+    This method checks cheaply that a file is a power-point presentation, a zip file holding the content types and
+    the presentation part, and counts its slides. Nothing but the zip directory and the presentation part is read.
+    An encrypted part, a compression method zipfile does not support and corrupt compressed data all mean the file is
+    not a presentation the explainer can read.
+    :param: presentation_path: path of the file to check. (String)
+    :return: number of slides, or None if the file is not a power-point presentation. (Integer)
+    """
+    try:
+        with zipfile.ZipFile(presentation_path) as archive:
+            part_names = set(archive.namelist())
+            if not all(part_name in part_names for part_name in REQUIRED_PARTS):
+                return None
+            return len(slide_part_names(archive))
+    except (zipfile.BadZipFile, KeyError, XMLSyntaxError, RuntimeError, NotImplementedError, zlib.error):
+        return None
+
+
+def is_collected_run(path, include_groups, include_tables):
+    """
+    This method decides if the a:t element at the end of the given path of tags is text the extractor collects.
+    By default it is the text of a run of a paragraph of a shape with a text frame directly in the shape tree of the
+    slide, exactly the runs parse_text_of_slide walks through.
+    :param: path: tags from the root element down to the a:t element. (List of strings)
+    :param: include_groups: also collect the shapes nested in group shapes. (Boolean)
+    :param: include_tables: also collect the text of table cells. (Boolean)
+    :return: True if the text is collected, false otherwise. (Boolean)
+    """
+    if path[-3:] != RUN_TEXT_PATH or SHAPE_TREE_TAG not in path:
+        return False
+
+    # the tags between the shape tree and the paragraph, for example [p:grpSp, p:sp, p:txBody]
+    inner_path = path[path.index(SHAPE_TREE_TAG) + 1:-3]
+    if inner_path[-2:] == SHAPE_TEXT_PATH:
+        groups = inner_path[:-2]
+    elif include_tables and inner_path[-len(TABLE_CELL_TEXT_PATH):] == TABLE_CELL_TEXT_PATH:
+        groups = inner_path[:-len(TABLE_CELL_TEXT_PATH)]
+    else:
+        return False
+    return all(tag == GROUP_SHAPE_TAG for tag in groups) and (include_groups or not groups)
+
+
+def is_body_placeholder(shape):
+    """
+    :param: shape: a p:sp element. (Element)
+    :return: True if the shape is a body placeholder, which holds the notes of a notes slide. (Boolean)
+    """
+    placeholder = shape.find(BODY_PLACEHOLDER_PATH)
+    return placeholder is not None and placeholder.get("type") == BODY_PLACEHOLDER
+
+
+def iter_run_texts(stream, include_groups=False, include_tables=False, body_placeholders_only=False):
+    """
+    This method parses the xml of a slide incrementally and yields the text of every collected run, in document
+    order. Only the run texts and the shapes are reported by the parser, and every top level shape is dropped as
+    soon as it was parsed, so the memory used does not depend on the size of the slide.
+    :param: stream: the opened xml part of a slide or of a notes slide. (File object)
+    :param: include_groups: also collect the shapes nested in group shapes. (Boolean)
+    :param: include_tables: also collect the text of table cells. (Boolean)
+    :param: body_placeholders_only: only collect the text of body placeholders, which hold the notes of a notes
+    slide. (Boolean)
+    :return: generator of the texts of the runs, not stripped. (Strings)
+    """
+    for _, element in iterparse(stream, events=(END_EVENT,), tag=PARSED_TAGS):
+        if element.tag != RUN_TEXT_TAG:
+            parent = element.getparent()
+            if parent is not None and parent.tag == SHAPE_TREE_TAG:
+                element.clear()
+                while element.getprevious() is not None:
+                    del parent[0]
+            continue
+
+        ancestors = list(element.iterancestors())
+        path = [ancestor.tag for ancestor in reversed(ancestors)] + [element.tag]
+        if not is_collected_run(path, include_groups, include_tables):
+            continue
+        if body_placeholders_only and not is_body_placeholder(ancestors[3]):
+            continue
+        yield element.text or ""
+
+
+def find_notes_part(archive, slide_part):
+    """
+    This method finds the notes slide of a slide.
+    :param: archive: the opened presentation. (ZipFile)
+    :param: slide_part: name of the slide part. (String)
+    :return: name of the notes slide part, or None if the slide has no notes. (String)
+    """
+    for target, relationship_type in read_relationships(archive, slide_part).values():
+        if relationship_type.endswith(NOTES_SLIDE_RELATIONSHIP):
+            return target
+    return None
+
+
+def extract_slide_texts(presentation_path, include_groups=False, include_tables=False, include_notes=False):
+    """
+    This method extracts the text of every slide of a presentation straight from the xml parts of the zip file,
+    without building the python-pptx object model and without loading images or any other media. With the default
+    options it returns exactly what parse_text_of_slide returns for each slide, the options add the text that
+    parse_text_of_slide skips.
+    :param: presentation_path: path of a power-point presentation. (String)
+    :param: include_groups: also extract the shapes nested in group shapes. (Boolean)
+    :param: include_tables: also extract the text of table cells. (Boolean)
+    :param: include_notes: also extract the notes of the slides, after the text of the slide. (Boolean)
+    :return: the text of every slide, in the order of the slides. (List of strings)
+    """
+    with zipfile.ZipFile(presentation_path) as archive:
+        return extract_archive_texts(archive, slide_part_names(archive), include_groups, include_tables,
+                                     include_notes)
+
+
+def extract_archive_texts(archive, slide_parts, include_groups=False, include_tables=False, include_notes=False):
+    """
+    This method extracts the text of the given slides of an open presentation, as described in extract_slide_texts.
+    :param: archive: the zip file of the presentation. (ZipFile)
+    :param: slide_parts: the part names of the slides, in the order of the slides. (List of strings)
+    :param: include_groups: also extract the shapes nested in group shapes. (Boolean)
+    :param: include_tables: also extract the text of table cells. (Boolean)
+    :param: include_notes: also extract the notes of the slides, after the text of the slide. (Boolean)
+    :return: the text of every slide, in the order of the slides. (List of strings)
+    """
+    slide_texts = []
+    for slide_part in slide_parts:
+        with archive.open(slide_part) as slide:
+            runs = [text.strip() for text in iter_run_texts(slide, include_groups, include_tables)]
+
+        notes_part = find_notes_part(archive, slide_part) if include_notes else None
+        if notes_part is not None:
+            with archive.open(notes_part) as notes:
+                runs.extend(text.strip() for text in iter_run_texts(notes, include_groups, include_tables,
+                                                                    body_placeholders_only=True))
+        slide_texts.append(TEXT_SEPARATOR.join(runs))
+    return slide_texts
+
+
+def parse_text_of_slide(slide):
+    """
+    This method receives a slide, and extracts all the extractable text found in that slide. In addition, it cleans
+    the data using the strip function.
+    :param: slide: A single slide from the power-point. (Slide Object)
+    :return: Explanation response. (String)
+    """
+    slide_text = []
+    for shape in slide.shapes:
+        if not shape.has_text_frame:
+            continue
+        for paragraph in shape.text_frame.paragraphs:
+            for run in paragraph.runs:
+                slide_text.append(run.text.strip())
+    return " ".join(slide_text)
+
+
+def extract_texts(presentation_path, extraction_engine=XML_EXTRACTION_ENGINE, include_groups=False,
+                  include_tables=False, include_notes=False):
+    """
+    This method extracts the text of every slide of a presentation with the given engine. The 'xml' engine reads the
+    slides straight from the zip file and can also extract group shapes, tables and notes, the 'pptx' engine loads the
+    whole presentation with python-pptx and extracts the slides with parse_text_of_slide. It only takes and returns
+    plain values, so it can run in a worker process.
+    :param: presentation_path: path of a power-point presentation. (String)
+    :param: extraction_engine: 'xml' or 'pptx'. (String)
+    :param: include_groups: also extract the shapes nested in group shapes, xml engine only. (Boolean)
+    :param: include_tables: also extract the text of table cells, xml engine only. (Boolean)
+    :param: include_notes: also extract the notes of the slides, xml engine only. (Boolean)
+    :return: the text of every slide, in the order of the slides. (List of strings)
+    """
+    return extract_texts_timed(presentation_path, extraction_engine, include_groups, include_tables,
+                               include_notes)[0]
+
+
+def extract_texts_timed(presentation_path, extraction_engine=XML_EXTRACTION_ENGINE, include_groups=False,
+                        include_tables=False, include_notes=False):
+    """
+    This method extracts the text of every slide like extract_texts, and also measures the two steps apart: loading
+    the deck, which is opening the zip file and resolving the slides for the 'xml' engine, or building the whole
+    object model for the 'pptx' engine, and extracting the text of the slides.
+    :param: presentation_path: path of a power-point presentation. (String)
+    :param: extraction_engine: 'xml' or 'pptx'. (String)
+    :param: include_groups: also extract the shapes nested in group shapes, xml engine only. (Boolean)
+    :param: include_tables: also extract the text of table cells, xml engine only. (Boolean)
+    :param: include_notes: also extract the notes of the slides, xml engine only. (Boolean)
+    :return: the text of every slide, the seconds spent loading the deck and the seconds spent extracting. (Tuple)
+    """
+    start = time.perf_counter()
+    if extraction_engine == PPTX_EXTRACTION_ENGINE:
+        prs = Presentation(presentation_path)
+        loaded = time.perf_counter()
+        slide_texts = [parse_text_of_slide(slide) for slide in prs.slides]
+    else:
+        with zipfile.ZipFile(presentation_path) as archive:
+            slide_parts = slide_part_names(archive)
+            loaded = time.perf_counter()
+            slide_texts = extract_archive_texts(archive, slide_parts, include_groups, include_tables, include_notes)
+    return slide_texts, loaded - start, time.perf_counter() - loaded
@@ -1,9 +1,19 @@
 import uuid
 import os
-from flask import Flask, request, jsonify
+import hashlib
+import threading
+import time
+from flask import Flask, request, jsonify, Response, stream_with_context, g
 import json
-from handle_db import User, Upload, engine
-from sqlalchemy.orm import Session
+from werkzeug.exceptions import RequestEntityTooLarge
+from handle_db import User, Upload, SlideExplanation, engine, upsert_user, prepare_database
+from job_notifier import notify_new_upload, ProgressListener
+from response_cache import ResponseCache, compute_etag
+from metrics import Counter, Gauge, Histogram, REGISTRY, CONTENT_TYPE
+from slide_text_extractor import read_slide_count
+from output_store import create_output_store, compress, GZIP_ENCODING
+from sqlalchemy import func
+from sqlalchemy.orm import Session, object_session, selectinload
 
 webAPI = Flask(__name__)
 
@@ -13,21 +23,50 @@ OUTPUT_FOLDER = 'outputs'
 webAPI.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 webAPI.config['OUTPUT_FOLDER'] = OUTPUT_FOLDER
 webAPI.config['PROCESSED_FOLDER'] = PROCESSED_FOLDER
+MAX_UPLOAD_SIZE = int(os.environ.get('MAX_UPLOAD_SIZE', 100 * 1024 * 1024))
+MAX_SLIDES = int(os.environ.get('MAX_SLIDES', 1000))
+# the whole request may hold the multipart headers on top of the file. MAX_CONTENT_LENGTH is what bounds the upload:
+# werkzeug rejects a larger request from its Content-Length, or stops reading a body without one at the limit, while
+# the size check of save_and_hash_file only runs once werkzeug spooled the body, so it is a second line of defence
+MULTIPART_OVERHEAD = 64 * 1024
+webAPI.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_SIZE + MULTIPART_OVERHEAD
+MAX_BATCH_FILES = int(os.environ.get('MAX_BATCH_FILES', 50))
+MAX_BATCH_UPLOAD_SIZE = int(os.environ.get('MAX_BATCH_UPLOAD_SIZE', 1024 * 1024 * 1024))
+MAX_BATCH_UIDS = int(os.environ.get('MAX_BATCH_UIDS', 500))
+# the uploads with a higher priority are claimed first, whoever their user is
+MIN_PRIORITY = int(os.environ.get('MIN_PRIORITY', -10))
+MAX_PRIORITY = int(os.environ.get('MAX_PRIORITY', 10))
+DEFAULT_PRIORITY = 0
 ERROR = 400
 NOT_FOUND = 404
+PAYLOAD_TOO_LARGE = 413
+UNPROCESSABLE = 422
 OK = 200
 INTERNAL_ERROR = 500
 PENDING = 'pending'
 PROCESSING = 'processing'
 DONE = 'done'
+FAILED = 'failed'
+# the statuses an upload never leaves, the clients stop polling once the upload has one of them
+FINAL_STATUSES = (DONE, FAILED)
 NONE = 'None'
 TIME_FORMAT = '%Y%m%d%H%M%S'
 NOT_FOUND_MESSAGE = "not found"
 NO_FILE_ATTACHED = "No file attached"
 EMPTY_FILENAME = "Empty filename"
 NO_EXPLANATION_FILE = "No explanation file"
+NOT_A_PRESENTATION = "The file is not a power-point presentation (.pptx)"
+FILE_TOO_LARGE = f"The file is larger than {MAX_UPLOAD_SIZE} bytes"
+SLIDE_COUNT_OUT_OF_RANGE = f"A presentation must have between 1 and {MAX_SLIDES} slides"
+TOO_MANY_FILES = f"A batch may hold at most {MAX_BATCH_FILES} files"
+BATCH_TOO_LARGE = f"The batch is larger than {MAX_BATCH_UPLOAD_SIZE} bytes"
+NO_UIDS = "Please provide a json object with a list of uids"
+TOO_MANY_UIDS = f"A batch may hold at most {MAX_BATCH_UIDS} uids"
+INVALID_PRIORITY = f"The priority must be an integer between {MIN_PRIORITY} and {MAX_PRIORITY}"
+PRESENTATION_EXTENSION = '.pptx'
 ERROR_FIELD = 'error'
 EMAIL_FIELD = 'email'
+PRIORITY_FIELD = 'priority'
 FILE_FIELD = 'file'
 UID_FIELD = 'uid'
 STATUS_FIELD = 'status'
@@ -35,10 +74,111 @@ FILENAME_FIELD = 'filename'
 TIMESTAMP_FIELD = 'timestamp'
 FINISH_TIME_FIELD = 'finish_time'
 EXPLANATION_FIELD = 'explanation'
+SLIDES_DONE_FIELD = 'slides_done'
+SLIDES_TOTAL_FIELD = 'slides_total'
+SLIDE_KEY_PREFIX = 'slide'
 NOT_FOUND_FIELD = 'not_found'
+UIDS_FIELD = 'uids'
+UPLOADS_FIELD = 'uploads'
+STATUSES_FIELD = 'statuses'
 READ_FILE_MODE = 'r'
+WRITE_BINARY_MODE = 'wb'
+UPLOAD_CHUNK_SIZE = 1024 * 1024
 UID_NOT_FOUND = 'uid not found'
 EMAIL_FILENAME_NOT_FOUND = 'file name or email not found'
+TIMEOUT_FIELD = 'timeout'
+SLIDE_FIELD = 'slide'
+DEFAULT_WAIT_TIMEOUT = 30
+MAX_WAIT_TIMEOUT = 60
+PROGRESS_RECHECK_INTERVAL = 5
+KEEP_ALIVE_INTERVAL = 15
+# seconds a client is asked to wait before it polls the status of an upload that is not done again
+STATUS_RETRY_AFTER = int(os.environ.get('STATUS_RETRY_AFTER', 5))
+EVENT_STREAM_MIMETYPE = 'text/event-stream'
+JSON_MIMETYPE = 'application/json'
+ACCEPT_ENCODING_HEADER = 'Accept-Encoding'
+ENCODING = 'utf-8'
+STATUS_EVENT = 'status'
+SLIDE_EVENT = 'slide'
+DONE_EVENT = 'done'
+ERROR_EVENT = 'error'
+KEEP_ALIVE_COMMENT = ": keep-alive\n\n"
+PROGRESS_LISTENER_ERROR = "Could not listen for progress notifications, falling back to periodic checks:"
+UNMATCHED_ENDPOINT = 'unmatched'
+QUEUED_RESULT = 'queued'
+DUPLICATE_RESULT = 'duplicate'
+REJECTED_RESULT = 'rejected'
+HIT_RESULT = 'hit'
+MISS_RESULT = 'miss'
+
+# serialized responses of the finished uploads, keyed by uid and content encoding, versioned by their stored output
+STATUS_RESPONSE_CACHE = ResponseCache()
+OUTPUT_STORE = create_output_store(folder=OUTPUT_FOLDER)
+progress_listener = None
+progress_listener_started = False
+progress_listener_lock = threading.Lock()
+REQUEST_SECONDS = Histogram('webapi_request_seconds', "Seconds spent answering the requests, by route.",
+                            ('endpoint', 'method', 'status'))
+UPLOADS_RECEIVED = Counter('webapi_uploads_total', "Uploaded files, by whether they were queued, resolved to an "
+                                                   "identical processed file, or rejected.", ('result',))
+STATUS_CACHE_LOOKUPS = Counter('webapi_status_cache_lookups_total', "Lookups of the status response cache, by result.",
+                               ('result',), function=lambda: {HIT_RESULT: STATUS_RESPONSE_CACHE.hits,
+                                                              MISS_RESULT: STATUS_RESPONSE_CACHE.misses})
+
+
+def read_upload_counts():
+    """
+    This method counts the uploads of every status in the database, when the metrics are scraped.
+    :return: the number of uploads of every status. (Dictionary)
+    """
+    with Session(engine) as session:
+        counts = dict(session.query(Upload.status, func.count(Upload.id)).group_by(Upload.status).all())
+    return {status: counts.get(status, 0) for status in (PENDING, PROCESSING, DONE, FAILED)} | counts
+
+
+UPLOADS_BY_STATUS = Gauge('explainer_uploads', "Uploads in the database, by status.", ('status',),
+                          function=read_upload_counts)
+
+
+@webAPI.before_request
+def start_request_timer():
+    """
+    This method notes when the request started, for the REQUEST_SECONDS histogram.
+    :return:
+    """
+    g.request_start = time.perf_counter()
+
+
+@webAPI.after_request
+def observe_request(response):
+    """
+    This method observes the duration of the request in the REQUEST_SECONDS histogram, labelled by its route rather
+    than its path, so the uids do not make a label set each.
+    :param: response: the response of the request. (Response)
+    :return: the same response. (Response)
+    """
+    start = g.pop('request_start', None)
+    if start is not None:
+        endpoint = request.url_rule.rule if request.url_rule else UNMATCHED_ENDPOINT
+        REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint=endpoint, method=request.method,
+                                status=response.status_code)
+    return response
+
+
+def read_priority(value):
+    """
+    This method validates the priority parameter of an upload request.
+    :param: value: the priority parameter, None or empty if it was not given (String)
+    :return: the priority, DEFAULT_PRIORITY if it was not given, or None if it is not an integer between MIN_PRIORITY
+    and MAX_PRIORITY (Integer)
+    """
+    if not value:
+        return DEFAULT_PRIORITY
+    try:
+        priority = int(value)
+    except ValueError:
+        return None
+    return priority if MIN_PRIORITY <= priority <= MAX_PRIORITY else None
 
 
 def create_folder_if_not_exists(folder_path):
@@ -51,6 +191,129 @@ def create_folder_if_not_exists(folder_path):
         os.makedirs(folder_path)
 
 
+def save_and_hash_file(file, file_path, max_size=MAX_UPLOAD_SIZE):
+    """
+    This method receives an uploaded file and a destination path, it writes the file to the destination chunk by
+    chunk as it is received, and hashes the chunks along the way so the content is only read once. A file larger
+    than max_size is removed as soon as it crosses the limit. The file was already spooled by werkzeug, within
+    MAX_CONTENT_LENGTH, so the check does not save the reading of the request, it only keeps a file of a batch, which
+    shares a larger limit, from being larger than a single upload may be.
+    :param: file: the uploaded file (FileStorage)
+    :param: file_path: the path the file is saved to (String)
+    :param: max_size: maximum size of the file, in bytes (Integer)
+    :return: sha256 hex digest of the file (String)
+    :raise: RequestEntityTooLarge if the file is larger than max_size
+    """
+    digest = hashlib.sha256()
+    size = 0
+    with open(file_path, WRITE_BINARY_MODE) as destination:
+        while True:
+            chunk = file.stream.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_size:
+                break
+            digest.update(chunk)
+            destination.write(chunk)
+    if size > max_size:
+        os.remove(file_path)
+        raise RequestEntityTooLarge()
+    return digest.hexdigest()
+
+
+def validate_presentation(file_path):
+    """
+    This method checks that a saved upload is a power-point presentation with a number of slides the explainer
+    accepts, and removes it otherwise, so an invalid file never takes a place in the queue of the explainer.
+    :param: file_path: the path the file was saved to (String)
+    :return: the number of slides and None if the presentation is valid, otherwise None and the error message with
+    its status code (Tuple)
+    """
+    slides_total = read_slide_count(file_path)
+    if slides_total is None:
+        error = NOT_A_PRESENTATION, ERROR
+    elif not 0 < slides_total <= MAX_SLIDES:
+        error = SLIDE_COUNT_OUT_OF_RANGE, UNPROCESSABLE
+    else:
+        return slides_total, None
+    os.remove(file_path)
+    return None, error
+
+
+def save_upload(file):
+    """
+    This method checks an uploaded file, saves it to the uploads folder under a new uid and validates it as a
+    presentation.
+    :param: file: the uploaded file (FileStorage)
+    :return: the uid, digest and number of slides of the saved file and None, otherwise None and the error message
+    with its status code (Tuple)
+    :raise: RequestEntityTooLarge if the file is larger than MAX_UPLOAD_SIZE
+    """
+    if file.filename == '':
+        UPLOADS_RECEIVED.inc(result=REJECTED_RESULT)
+        return None, (EMPTY_FILENAME, ERROR)
+
+    original_filename, file_extension = os.path.splitext(file.filename)
+    if file_extension.lower() != PRESENTATION_EXTENSION:
+        UPLOADS_RECEIVED.inc(result=REJECTED_RESULT)
+        return None, (NOT_A_PRESENTATION, ERROR)
+
+    create_folder_if_not_exists(webAPI.config['UPLOAD_FOLDER'])
+
+    uid = str(uuid.uuid4())
+
+    new_filename = f"{uid}{PRESENTATION_EXTENSION}"
+    upload_path = os.path.join(webAPI.config['UPLOAD_FOLDER'], new_filename)
+    digest = save_and_hash_file(file, upload_path)
+    slides_total, error = validate_presentation(upload_path)
+    if error:
+        UPLOADS_RECEIVED.inc(result=REJECTED_RESULT)
+        return None, error
+    return (uid, digest, slides_total), None
+
+
+def add_upload(session, user_id, saved_upload, priority=DEFAULT_PRIORITY, remove_duplicate=True):
+    """
+    This method adds the upload of a saved file to the session. If an identical file has already been processed, the
+    upload is done right away and resolves to the existing explanations, and the saved file is removed, unless the
+    caller removes it itself.
+    :param: session: an open database session (Session)
+    :param: user_id: id of the user of the upload, None for an anonymous upload (Integer)
+    :param: saved_upload: the uid, digest and number of slides of the saved file (Tuple)
+    :param: priority: the validated priority of the upload (Integer)
+    :param: remove_duplicate: remove the saved file of an identical file already processed (Boolean)
+    :return: the new upload (Upload)
+    """
+    uid, digest, slides_total = saved_upload
+    upload = Upload(file_name=f"{uid}{PRESENTATION_EXTENSION}", status=PENDING, uid=uid, user_id=user_id,
+                    digest=digest, priority=priority)
+
+    finished_upload = find_finished_upload(session, digest)
+    if finished_upload:
+        upload.set_file_status(DONE)
+        upload.reuse_output_of(finished_upload)
+        if remove_duplicate:
+            os.remove(os.path.join(webAPI.config['UPLOAD_FOLDER'], upload.file_name))
+    UPLOADS_RECEIVED.inc(result=DUPLICATE_RESULT if finished_upload else QUEUED_RESULT)
+    upload.slides_total = slides_total
+
+    session.add(upload)
+    return upload
+
+
+def find_finished_upload(session, digest):
+    """
+    This method searches for the latest upload with the given digest that has already been processed without any
+    failed slide, an output holding error messages is never handed out again.
+    :param: session: an open database session (Session)
+    :param: digest: sha256 hex digest of a file (String)
+    :return: the finished upload, or None if the content was never processed successfully (Upload)
+    """
+    return session.query(Upload).filter_by(digest=digest, status=DONE, slides_failed=0).order_by(
+        Upload.finish_time.desc()).first()
+
+
 @webAPI.route("/upload", methods=['POST'])
 def upload_file():
     """
@@ -64,42 +327,109 @@ def upload_file():
      if there is an email, if so, it checks if the user is already found in the database, if so it adds a new upload
      to his uploads, if not it creates a new user for that email, and if the email is empty it creates a new
      anonymous user.
+
+     ADDED:
+     The user is found or created in the same transaction as the upload, so a new user costs no extra commit.
+
+     ADDED:
+     Files larger than MAX_UPLOAD_SIZE are rejected with 413, as soon as the request announces its size or while the
+     file is saved otherwise. A file that is not a .pptx zip with a presentation part is rejected with 400, and a
+     presentation without slides or with more than MAX_SLIDES slides with 422, before the upload is created. The
+     number of slides is stored with the upload.
+
+     ADDED:
+     The file is hashed while it is saved, if an identical file has already been processed, the upload is marked as
+     done right away and resolves to the existing explanations, so it is never queued for the explainer. Otherwise
+     the explainer is notified of the new upload as soon as it is committed.
+
+     ADDED:
+     The end-point also receives an optional priority with its parameters, an integer between MIN_PRIORITY and
+     MAX_PRIORITY, 0 by default, the uploads with a higher priority are processed first. Any other priority is
+     rejected with 400.
     :return: UID as a json responser (code: 200), or error with the error message as a json response (code 404)
     """
     email = request.args.get(EMAIL_FIELD)
+    priority = read_priority(request.args.get(PRIORITY_FIELD))
+    if priority is None:
+        return jsonify({ERROR_FIELD: INVALID_PRIORITY}), ERROR
     try:
         if FILE_FIELD not in request.files:
             return jsonify({ERROR_FIELD: NO_FILE_ATTACHED}), ERROR
 
-        file = request.files[FILE_FIELD]
-        if file.filename == '':
-            return jsonify({ERROR_FIELD: EMPTY_FILENAME}), ERROR
+        saved_upload, error = save_upload(request.files[FILE_FIELD])
+        if error:
+            return jsonify({ERROR_FIELD: error[0]}), error[1]
 
-        create_folder_if_not_exists(webAPI.config['UPLOAD_FOLDER'])
+        with Session(engine) as session:
+            user_id = upsert_user(session, email) if email else None
+            upload = add_upload(session, user_id, saved_upload, priority)
+            queued = upload.status == PENDING
+            session.commit()
 
-        uid = str(uuid.uuid4())
+        uid = saved_upload[0]
+        if queued:
+            notify_new_upload(uid)
+        return jsonify({UID_FIELD: uid}), OK
+    except RequestEntityTooLarge:
+        UPLOADS_RECEIVED.inc(result=REJECTED_RESULT)
+        return jsonify({ERROR_FIELD: FILE_TOO_LARGE}), PAYLOAD_TOO_LARGE
+    except Exception as e:
+        return jsonify({ERROR_FIELD: str(e)}), INTERNAL_ERROR
 
-        original_filename, file_extension = os.path.splitext(file.filename)
 
-        new_filename = f"{uid}{file_extension}"
-        file.save(os.path.join(webAPI.config['UPLOAD_FOLDER'], new_filename))
-        with Session(engine) as session:
-            if email:
-                user = session.query(User).filter_by(email=email).first()
-                if user is None:
-                    user = User(email=email)
-                    session.add(user)
-                    session.commit()
-                    upload = Upload(file_name=new_filename, status=PENDING, uid=uid, user_id=user.id)
-                else:
-                    upload = Upload(file_name=new_filename, status=PENDING, uid=uid, user_id=user.id)
+@webAPI.route("/upload/batch", methods=['POST'])
+def upload_files():
+    """
+    This end-point handles the '/upload/batch' route that receives several files, all attached under the 'file'
+    field of a single post request, with the same optional email and priority as the '/upload' end-point, which apply
+    to all of them. Every file is checked and saved like a single upload, a rejected file does not fail the others,
+    and the uploads of all the accepted files are added in a single transaction with a single lookup of the user.
+    The request may be as large as MAX_BATCH_UPLOAD_SIZE, and hold at most MAX_BATCH_FILES files.
+    :return: json object with the result of every file in the order they were attached, its uid or its error
+    (code: 200), or error with the error message as a json response (code 400 or 413)
+    """
+    request.max_content_length = MAX_BATCH_UPLOAD_SIZE + MULTIPART_OVERHEAD
+    email = request.args.get(EMAIL_FIELD)
+    priority = read_priority(request.args.get(PRIORITY_FIELD))
+    if priority is None:
+        return jsonify({ERROR_FIELD: INVALID_PRIORITY}), ERROR
+    try:
+        files = request.files.getlist(FILE_FIELD)
+        if not files:
+            return jsonify({ERROR_FIELD: NO_FILE_ATTACHED}), ERROR
+        if len(files) > MAX_BATCH_FILES:
+            return jsonify({ERROR_FIELD: TOO_MANY_FILES}), ERROR
+
+        results = []
+        saved_uploads = []
+        for file in files:
+            result = {FILENAME_FIELD: file.filename}
+            try:
+                saved_upload, error = save_upload(file)
+            except RequestEntityTooLarge:
+                saved_upload, error = None, (FILE_TOO_LARGE, PAYLOAD_TOO_LARGE)
+                UPLOADS_RECEIVED.inc(result=REJECTED_RESULT)
+            if error:
+                result[ERROR_FIELD] = error[0]
             else:
-                upload = Upload(file_name=new_filename, status=PENDING, uid=uid)
+                result[UID_FIELD] = saved_upload[0]
+                saved_uploads.append(saved_upload)
+            results.append(result)
 
-            session.add(upload)
-            session.commit()
+        queued_uids = []
+        if saved_uploads:
+            with Session(engine) as session:
+                user_id = upsert_user(session, email) if email else None
+                for saved_upload in saved_uploads:
+                    if add_upload(session, user_id, saved_upload, priority).status == PENDING:
+                        queued_uids.append(saved_upload[0])
+                session.commit()
 
-        return jsonify({UID_FIELD: uid}), OK
+        for uid in queued_uids:
+            notify_new_upload(uid)
+        return jsonify({UPLOADS_FIELD: results}), OK
+    except RequestEntityTooLarge:
+        return jsonify({ERROR_FIELD: BATCH_TOO_LARGE}), PAYLOAD_TOO_LARGE
     except Exception as e:
         return jsonify({ERROR_FIELD: str(e)}), INTERNAL_ERROR
 
@@ -152,6 +482,225 @@ def get_status_by_uid(uid):
         return jsonify({ERROR_FIELD: str(e)}), INTERNAL_ERROR
 
 
+@webAPI.route("/status/batch", methods=['POST'])
+def get_statuses_by_uids():
+    """
+    This end-point handles the '/status/batch' route that receives a json object with a list of uids, at most
+    MAX_BATCH_UIDS of them, and answers the status of all of them at once. The uploads are found with a single query,
+    the explanations finished so far of the uploads in progress with a single other query, and the versions of the
+    outputs of the done uploads with a single IN query, plus one for the outputs they reuse. The status of every
+    upload is the same json object as the '/status/<uid>' end-point, taken from STATUS_RESPONSE_CACHE for the done
+    uploads. Like the '/status/<uid>' end-point, the response carries a Retry-After header while any of the uploads is
+    neither done nor failed.
+    :return: json object of the status of every uid, or of its 'not_found' or 'error' message (code: 200), or error
+    with the error message as a json response (code 400)
+    """
+    payload = request.get_json(silent=True)
+    uids = payload.get(UIDS_FIELD) if isinstance(payload, dict) else None
+    if not isinstance(uids, list) or not uids or not all(isinstance(uid, str) for uid in uids):
+        return jsonify({ERROR_FIELD: NO_UIDS}), ERROR
+    uids = list(dict.fromkeys(uids))
+    if len(uids) > MAX_BATCH_UIDS:
+        return jsonify({ERROR_FIELD: TOO_MANY_UIDS}), ERROR
+
+    try:
+        with Session(engine) as session:
+            files = {file.uid: file for file in session.query(Upload).filter(Upload.uid.in_(uids))}
+            in_progress_ids = [file.id for file in files.values() if file.status != DONE]
+            if in_progress_ids:
+                session.query(Upload).filter(Upload.id.in_(in_progress_ids)).options(
+                    selectinload(Upload.slide_explanations)).all()
+            output_versions = OUTPUT_STORE.versions(
+                session, [file for file in files.values() if file.status == DONE])
+
+            statuses = []
+            all_final = all(file.status in FINAL_STATUSES for file in files.values())
+            for uid in uids:
+                file = files.get(uid)
+                if file is None:
+                    body = json.dumps({NOT_FOUND_FIELD: UID_NOT_FOUND}).encode(ENCODING)
+                else:
+                    try:
+                        body = build_status_body(session, file, output_versions=output_versions)[0]
+                    except FileNotFoundError as e:
+                        body = json.dumps({ERROR_FIELD: str(e)}).encode(ENCODING)
+                statuses.append(json.dumps(uid).encode(ENCODING) + b":" + body)
+
+        body = f"{{{json.dumps(STATUSES_FIELD)}:{{".encode(ENCODING) + b",".join(statuses) + b"}}"
+        response = Response(body, status=OK, mimetype=JSON_MIMETYPE)
+        if not all_final:
+            response.retry_after = STATUS_RETRY_AFTER
+        return response
+    except Exception as e:
+        return jsonify({ERROR_FIELD: str(e)}), INTERNAL_ERROR
+
+
+@webAPI.route("/status/<string:uid>/wait", methods=['GET'])
+def wait_for_status_by_uid(uid):
+    """
+    This end-point is a long-poll version of the '/status/<uid>' route. The client sends the status and the number of
+    slides done it already knows, and the end-point only answers once the upload differs from them, or once the
+    timeout (in seconds, at most MAX_WAIT_TIMEOUT) passed, with the same json object as '/status/<uid>'. Without a
+    known state, the end-point waits for the next change of the upload. A done or failed upload is answered right
+    away.
+    :param: uid: wanted unique ID (string)
+    :return:
+    """
+    timeout = min(request.args.get(TIMEOUT_FIELD, DEFAULT_WAIT_TIMEOUT, type=float), MAX_WAIT_TIMEOUT)
+    try:
+        current_state = load_progress_state(uid)
+        if current_state is None:
+            return jsonify({NOT_FOUND_FIELD: UID_NOT_FOUND}), NOT_FOUND
+
+        known_state = (request.args.get(STATUS_FIELD, current_state[0]),
+                       request.args.get(SLIDES_DONE_FIELD, current_state[1], type=int))
+        wait_for_progress(uid, known_state, timeout)
+        return get_status_by_uid(uid)
+
+    except Exception as e:
+        return jsonify({ERROR_FIELD: str(e)}), INTERNAL_ERROR
+
+
+@webAPI.route("/status/<string:uid>/events", methods=['GET'])
+def stream_status_by_uid(uid):
+    """
+    This end-point streams the progress of an upload as server-sent events. A 'status' event with the status, slides
+    done and slides total is sent whenever they change, a 'slide' event is sent for every slide as soon as its
+    explanation is available, and a final 'done' event is sent before the stream is closed, once the upload is done or
+    failed. A done upload whose explanations are missing ends the stream with an 'error' event holding the error
+    message.
+    :param: uid: wanted unique ID (string)
+    :return: event stream, or error with the error message as a json response (code 404)
+    """
+    if load_progress_state(uid) is None:
+        return jsonify({NOT_FOUND_FIELD: UID_NOT_FOUND}), NOT_FOUND
+    return Response(stream_with_context(generate_status_events(uid)), mimetype=EVENT_STREAM_MIMETYPE)
+
+
+def generate_status_events(uid):
+    """
+    This method generates the server-sent events of an upload until it is done or failed. The state of the upload is
+    read in a session that is closed before any event is sent, so a slow client does not hold a pooled connection
+    while its socket is written to.
+    :param: uid: unique ID of the upload (string)
+    :return: generator of server-sent events (String)
+    """
+    sent_slides = set()
+    sent_state = None
+    while True:
+        try:
+            events_state = load_events_state(uid)
+        except FileNotFoundError as error:
+            yield format_event(ERROR_EVENT, {ERROR_FIELD: f"{NO_EXPLANATION_FILE} {str(error)}"})
+            return
+        if events_state is None:
+            return
+
+        progress, explanations = events_state
+        for slide_key, explanation in explanations.items():
+            if slide_key not in sent_slides:
+                sent_slides.add(slide_key)
+                yield format_event(SLIDE_EVENT, {SLIDE_FIELD: slide_key, EXPLANATION_FIELD: explanation})
+
+        state = (progress[STATUS_FIELD], progress[SLIDES_DONE_FIELD])
+        if state != sent_state:
+            sent_state = state
+            yield format_event(STATUS_EVENT, progress)
+        if progress[STATUS_FIELD] in FINAL_STATUSES:
+            yield format_event(DONE_EVENT, progress)
+            return
+
+        if wait_for_progress(uid, sent_state, KEEP_ALIVE_INTERVAL) == sent_state:
+            yield KEEP_ALIVE_COMMENT
+
+
+def load_events_state(uid):
+    """
+    This method reads the progress of an upload and its explanations so far, for generate_status_events.
+    :param: uid: unique ID of the upload (string)
+    :return: the status, slides done and slides total of the upload, and the explanation of every slide key, or None
+    if the uid was not found (Tuple)
+    :raise: FileNotFoundError if the upload is done and its explanations are missing.
+    """
+    with Session(engine) as session:
+        file = session.query(Upload).filter_by(uid=uid).first()
+        if file is None:
+            return None
+        explanations = retrieve_explanations(file)
+        if not isinstance(explanations, dict):
+            explanations = {}
+        progress = {STATUS_FIELD: file.status, SLIDES_DONE_FIELD: len(explanations),
+                    SLIDES_TOTAL_FIELD: file.slides_total}
+        return progress, explanations
+
+
+def format_event(event, data):
+    """
+    This method formats a single server-sent event.
+    :param: event: name of the event (String)
+    :param: data: json serializable data of the event (Dictionary)
+    :return: the formatted event (String)
+    """
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def get_progress_listener():
+    """
+    This method starts the listener for the progress notifications of the explainer the first time it is needed.
+    :return: the started listener, or None if it could not be started (ProgressListener)
+    """
+    global progress_listener, progress_listener_started
+    with progress_listener_lock:
+        if not progress_listener_started:
+            progress_listener_started = True
+            listener = ProgressListener()
+            try:
+                listener.start()
+                progress_listener = listener
+            except OSError as error:
+                print(f"{PROGRESS_LISTENER_ERROR} {str(error)}")
+        return progress_listener
+
+
+def load_progress_state(uid):
+    """
+    This method reads the status of an upload and the number of its slides explained so far.
+    :param: uid: unique ID of the upload (string)
+    :return: the status and the slides done of the upload, or None if the uid was not found (Tuple)
+    """
+    with Session(engine) as session:
+        file = session.query(Upload.id, Upload.status).filter_by(uid=uid).first()
+        if file is None:
+            return None
+        slides_done = session.query(func.count(SlideExplanation.id)).filter_by(upload_id=file.id).scalar()
+        return file.status, slides_done
+
+
+def wait_for_progress(uid, known_state, timeout):
+    """
+    This method blocks until the state of an upload differs from the known one, the upload is done or failed, or the
+    timeout passed. It wakes up on the progress notifications of the explainer, and checks the database every
+    PROGRESS_RECHECK_INTERVAL seconds in case a notification was lost.
+    :param: uid: unique ID of the upload (string)
+    :param: known_state: the status and slides done the caller already knows (Tuple)
+    :param: timeout: maximum number of seconds to wait (Float)
+    :return: the latest state of the upload, or None if the uid was not found (Tuple)
+    """
+    listener = get_progress_listener()
+    deadline = time.monotonic() + timeout
+    while True:
+        version = listener.version(uid) if listener else 0
+        state = load_progress_state(uid)
+        remaining = deadline - time.monotonic()
+        if state is None or state != known_state or state[0] in FINAL_STATUSES or remaining <= 0:
+            return state
+
+        if listener:
+            listener.wait_for_change(uid, version, min(remaining, PROGRESS_RECHECK_INTERVAL))
+        else:
+            time.sleep(min(remaining, PROGRESS_RECHECK_INTERVAL))
+
+
 def generate_response(file, status_code):
     """
     This method handles the return response for the get_status end-point, it receives a status, filename, timestamp
@@ -165,33 +714,163 @@ def generate_response(file, status_code):
 
     ADDED:
     a new field for the finish time of an uploaded file.
+
+    ADDED:
+    the progress of the file, the number of slides explained so far and the number of slides in the presentation.
+    While the file is processing the explanation holds the slides finished so far.
+
+    ADDED:
+    the response carries an ETag, and a request whose If-None-Match matches it is answered with an empty 304. The
+    response of a done file is kept in STATUS_RESPONSE_CACHE as long as its stored output is not modified, so polling
+    a finished file neither reads nor parses its output again.
+
+    ADDED:
+    a client that accepts gzip gets the response of a done file gzip encoded, built around the compressed
+    explanations of the OUTPUT_STORE without decompressing them.
+
+    ADDED:
+    the response of a file that is not done carries a Retry-After header of STATUS_RETRY_AFTER seconds, the interval
+    the clients should wait before they poll it again.
+
+    ADDED:
+    a file the explainer gave up on has the failed status, with the explanations finished before it failed, and no
+    Retry-After header, as it never changes again.
     :return: json with all the metadata of a file
     """
-    return jsonify({
+    content_encoding = GZIP_ENCODING if request.accept_encodings[GZIP_ENCODING] else None
+    body, etag, content_encoding = build_status_body(object_session(file), file, content_encoding)
+    response = conditional_response(body, etag, status_code, content_encoding)
+    if file.status not in FINAL_STATUSES:
+        response.retry_after = STATUS_RETRY_AFTER
+    return response
+
+
+def build_status_body(session, file, accepted_encoding=None, output_versions=None):
+    """
+    This method serializes the status of a file for generate_response, outside of any request, so the async web API
+    can share it. The body of a done file comes from STATUS_RESPONSE_CACHE whenever its stored output did not change.
+    :param: session: the session of the file (Session)
+    :param: file: Upload object that has all the metadata of a file.
+    :param: accepted_encoding: 'gzip' if the client accepts gzip, None otherwise (String)
+    :param: output_versions: the output versions of the done files, keyed by uid, if they were loaded already
+    (Dictionary)
+    :return: the body, its entity tag and its content encoding, None if it is not encoded (Tuple)
+    """
+    if file.status != DONE:
+        body = build_response_body(file)
+        return body, compute_etag(body), None
+
+    if output_versions is not None:
+        output_version = output_versions.get(file.uid)
+    else:
+        output_version = OUTPUT_STORE.version(session, file)
+    if output_version is None:
+        raise FileNotFoundError(f"{NO_EXPLANATION_FILE} {file.get_output_uid()}")
+    cache_key = (file.uid, accepted_encoding)
+    cached_response = STATUS_RESPONSE_CACHE.get(cache_key, output_version)
+    if cached_response is None:
+        body = build_done_response_body(session, file, accepted_encoding)
+        cached_response = body, STATUS_RESPONSE_CACHE.put(cache_key, output_version, body)
+    return cached_response[0], cached_response[1], accepted_encoding
+
+
+def build_response_body(file):
+    """
+    This method serializes the metadata and the explanations of a file, as described in generate_response.
+    :param: file: Upload object that has all the metadata of a file.
+    :return: the serialized json object (Bytes)
+    """
+    explanations = retrieve_explanations(file)
+    slides_done = len(explanations) if isinstance(explanations, dict) else 0
+    slides_total = file.slides_total
+    if slides_total is None and file.status == DONE:
+        slides_total = slides_done
+    return webAPI.json.dumps({
+        STATUS_FIELD: file.status,
+        FILENAME_FIELD: file.file_name,
+        TIMESTAMP_FIELD: file.upload_time,
+        FINISH_TIME_FIELD: file.finish_time,
+        SLIDES_DONE_FIELD: slides_done,
+        SLIDES_TOTAL_FIELD: slides_total,
+        EXPLANATION_FIELD: explanations
+    }).encode(ENCODING)
+
+
+def build_done_response_body(session, file, content_encoding=None):
+    """
+    This method serializes the metadata and the explanations of a done file, as described in generate_response,
+    around the stored explanations. The explanation field is written first, as jsonify sorts the fields. For a gzip
+    response the metadata is compressed into gzip members of its own, and the stored member of the explanations is
+    sent as is in between, a sequence of gzip members is a valid gzip stream.
+    :param: session: the session of the file (Session)
+    :param: file: Upload object that has all the metadata of a done file.
+    :param: content_encoding: 'gzip', or None for an uncompressed body (String)
+    :return: the serialized json object, encoded with the content encoding (Bytes)
+    """
+    slides_total = file.slides_total
+    if slides_total is None:
+        slides_total = len(json.loads(OUTPUT_STORE.read(session, file)))
+    metadata = webAPI.json.dumps({
         STATUS_FIELD: file.status,
         FILENAME_FIELD: file.file_name,
         TIMESTAMP_FIELD: file.upload_time,
         FINISH_TIME_FIELD: file.finish_time,
-        EXPLANATION_FIELD: retrieve_explanations(file)
-    }), status_code
+        SLIDES_DONE_FIELD: slides_total,
+        SLIDES_TOTAL_FIELD: slides_total
+    }).encode(ENCODING)
+    prefix = f"{{{json.dumps(EXPLANATION_FIELD)}:".encode(ENCODING)
+    suffix = b"," + metadata[1:]
+    if content_encoding == GZIP_ENCODING:
+        return compress(prefix) + OUTPUT_STORE.read_compressed(session, file) + compress(suffix)
+    return prefix + OUTPUT_STORE.read(session, file) + suffix
+
+
+def conditional_response(body, etag, status_code, content_encoding=None):
+    """
+    This method builds a json response with an ETag, or an empty 304 if the request already holds that version.
+    :param: body: the serialized json object (Bytes)
+    :param: etag: the entity tag of the body (String)
+    :param: status_code: the status code of a full response (Integer)
+    :param: content_encoding: the content encoding of the body, None if it is not encoded (String)
+    :return: the response (Response)
+    """
+    response = Response(body, status=status_code, mimetype=JSON_MIMETYPE)
+    if content_encoding:
+        response.content_encoding = content_encoding
+    response.vary.add(ACCEPT_ENCODING_HEADER)
+    response.set_etag(etag)
+    return response.make_conditional(request)
 
 
 def retrieve_explanations(file):
     """
     This method receives a file object, and uses the file's status to know how to update the explanation field.
-    if the status is pending then there's no explanations yet. If the status is done then it reads the explanations
-    and returns the data.
+    if the status is pending then there's no explanations yet. If the status is processing then it returns the slides
+    explained so far, if any, and so does a failed file. If the status is done then it reads the explanations and
+    returns the data.
     :param: file: Upload object that has all the metadata of a file.
     :return: json object of each slide and its explanations.
     """
-    if file.status == PENDING or file.status == PROCESSING:
-        return NONE
+    if file.status != DONE:
+        if not file.slide_explanations:
+            return NONE
+        return {f"{SLIDE_KEY_PREFIX}{slide.slide_number}": slide.explanation for slide in file.slide_explanations}
+
+    return json.loads(OUTPUT_STORE.read(object_session(file), file))
+
 
-    with open(os.path.join(OUTPUT_FOLDER, file.uid + ".json"), READ_FILE_MODE) as f:
-        json_data = f.read()
-        data = json.loads(json_data)
-        return data
+@webAPI.route("/metrics", methods=['GET'])
+def get_metrics():
+    """
+    This end-point handles the '/metrics' route, it answers the scrapes with the metrics of the web API in the
+    Prometheus text format: the duration of the requests by route, the uploads received, the lookups of the status
+    response cache and the number of uploads of every status in the database. The explainer serves the metrics of its
+    stages on its own port.
+    :return: the metrics as plain text (code: 200)
+    """
+    return Response(REGISTRY.render(), status=OK, content_type=CONTENT_TYPE)
 
 
 if __name__ == "__main__":
+    prepare_database(engine)
     webAPI.run(debug=True)